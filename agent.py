@@ -1,11 +1,119 @@
 import dspy
+import os
 import sqlite3
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
 
+from answer_cache import AnswerCache, create_answer_cache
+from conversation import Session
+from router import QuestionRouter, RouteDecision
+from tools.imageDetection.infoDetectionTool import screenshot_ids, screenshot_reading_available, screenshot_state_tool
 from tools.rag.principalTool import rag_tool
+from tools.tracing import end_span, span, start_span, submit
+from tools.rag.entity_store import get_entity_store, structured_lookup
+from tools.rag.entity_names import resolve_names
 from tools.webSearch.principalTool import web_search_tool as web_search_tool_fn
 
 
+# Shared pool for concurrent tool calls (fallback fan-out and parallel_tools)
+_tool_pool = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_WORKERS", "8")), thread_name_prefix="dd-tools")
+
+
+def _tool_output_ok(tool_out) -> bool:
+    if tool_out is None or isinstance(tool_out, Exception):
+        return False
+    if isinstance(tool_out, str) and tool_out.strip() == "":
+        return False
+    return True
+
+
+def _collect(future: Future, deadline: float):
+    """Result of ``future`` if it finishes before ``deadline`` (monotonic); the exception otherwise."""
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout as e:
+        future.cancel()
+        return e
+    except Exception as e:
+        return e
+
+
+def run_tools(tool_funcs: dict, calls: list[tuple[str, str]], timeout: float = 20.0) -> list:
+    """Run independent ``(tool name, query)`` calls concurrently.
+
+    Returns the outputs in call order; a call that fails, names an unknown
+    tool or misses the shared ``timeout`` yields its exception instead.
+    """
+    deadline = time.monotonic() + timeout
+    futures = []
+    for name, query in calls:
+        fn = tool_funcs.get(name)
+        futures.append(submit(_tool_pool, fn, query) if fn else None)
+    return [_collect(f, deadline) if f else KeyError(name) for f, (name, _) in zip(futures, calls)]
+
+
+def _router_names(question: str) -> list[str]:
+    """Entity names in ``question`` for the router, including misspelled ones (as written)."""
+    return get_entity_store().mentioned(question) + [m.text for m in resolve_names(question)]
+
+
+class _TraceCallback(dspy.utils.callback.BaseCallback):
+    """Spans for DSPy modules (each ReAct iteration is a ``react.step``), LM calls and tools."""
+
+    def __init__(self):
+        self._spans = {}
+
+    def on_module_start(self, call_id, instance, inputs):
+        if isinstance(instance, dspy.Predict) and "next_tool_name" in instance.signature.output_fields:
+            name = "react.step"
+        else:
+            name = f"module.{type(instance).__name__}"
+        self._spans[call_id] = start_span(name)
+
+    def on_module_end(self, call_id, outputs, exception=None):
+        s = self._spans.pop(call_id, None)
+        if s is not None:
+            end_span(s, exception)
+
+    def on_lm_start(self, call_id, instance, inputs):
+        s = start_span("llm.call", model=instance.model,
+                       bytes=sum(len(str(m.get("content", ""))) for m in inputs.get("messages") or [])
+                       or len(str(inputs.get("prompt") or "")))
+        self._spans[call_id] = (s, instance)
+
+    def on_lm_end(self, call_id, outputs, exception=None):
+        s, lm = self._spans.pop(call_id, (None, None))
+        if s is None:
+            return
+        entry = lm.history[-1] if getattr(lm, "history", None) else {}
+        usage = dict(entry.get("usage") or {})
+        cache_hit = getattr(entry.get("response"), "cache_hit", None)
+        end_span(s, exception,
+                 prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                 tokens=usage.get("total_tokens"), **({"cache": "hit" if cache_hit else "miss"} if cache_hit is not None else {}))
+
+    def on_tool_start(self, call_id, instance, inputs):
+        self._spans[call_id] = start_span(f"tool.{instance.name}")
+
+    def on_tool_end(self, call_id, outputs, exception=None):
+        s = self._spans.pop(call_id, None)
+        if s is not None:
+            end_span(s, exception, bytes=len(str(outputs)) if outputs is not None else 0)
+
+
+class _ToolStatus(dspy.streaming.StatusMessageProvider):
+    """Turns tool calls inside the ReAct loop into short progress lines."""
+
+    def tool_start_status_message(self, instance, inputs):
+        args = inputs.get("kwargs", inputs)
+        query = args.get("query") or args.get("calls") or ""
+        return f"Running {instance.name}: {query}" if query else f"Running {instance.name}..."
+
+    def tool_end_status_message(self, outputs):
+        return None
+
+
 # --- DSPy Agent Definition ---
 class DDAgentSignature(dspy.Signature):
     """
@@ -45,13 +153,32 @@ class DDAgentSignature(dspy.Signature):
 
     question = dspy.InputField(desc="The user's natural language question.")
     initial_schema = dspy.InputField(desc="Optional system/role prompt; if empty the caller may choose which prompt to apply.")
+    history = dspy.InputField(desc="Summary of earlier turns and the latest exchanges of this conversation; resolve follow-ups (\"her trinkets\") against it. Empty for a new conversation.")
     answer = dspy.OutputField(
         desc="The final, natural language answer to the user's question."
     )
 
 
+class LookupAnswerSignature(dspy.Signature):
+    """You are an Expert Darkest Dungeon Advisor. Answer the factual question
+    using only the retrieved context, in a few sentences or a short list,
+    and name the page or table the facts come from. If the context does not
+    contain the answer, say that you do not know."""
+
+    question = dspy.InputField(desc="The user's natural language question.")
+    context = dspy.InputField(desc="Entity records and wiki passages retrieved for the question.")
+    answer = dspy.OutputField(desc="Concise answer grounded in the context.")
+
+
+GREETING_ANSWER = ("Hello! I'm your Darkest Dungeon advisor. Ask me about heroes, enemies, trinkets, "
+                   "curios or how to survive your next expedition.")
+
+
 class DDAgent(dspy.Module):
-    def __init__(self, tools: list[dspy.Tool], tool_funcs: dict | None = None, priorities: list[str] | None = None):
+    def __init__(self, tools: list[dspy.Tool], tool_funcs: dict | None = None, priorities: list[str] | None = None,
+                 cache: AnswerCache | None = None, parallel_fallback: bool = True,
+                 tool_timeouts: dict[str, float] | None = None, default_timeout: float = 20.0,
+                 router: QuestionRouter | None = None):
         super().__init__()
         # Initialize the ReAct agent.
         self.agent = dspy.ReAct(
@@ -63,6 +190,34 @@ class DDAgent(dspy.Module):
         self.tool_funcs = tool_funcs or {}
         # Order in which tools should be tried as fallbacks
         self.priorities = priorities or ["local_search", "web_search"]
+        # Optional answer cache consulted before running the ReAct loop
+        self.cache = cache
+        # Launch all fallback tools at once instead of one after another
+        self.parallel_fallback = parallel_fallback
+        # Per-tool deadline in seconds, measured from when the fallbacks start
+        self.tool_timeouts = tool_timeouts or {}
+        self.default_timeout = default_timeout
+        # Pre-router: greetings and direct lookups skip the ReAct loop
+        self.router = router
+        self.formatter = dspy.Predict(LookupAnswerSignature)
+        # Conversation being answered; tool calls go through its result cache.
+        # A DDAgent therefore serves one conversation at a time (see agent_pool).
+        self.session: Session | None = None
+        for tool in tools:
+            if tool.name in self.tool_funcs:
+                tool.func = self._session_tool(tool.name, tool.func)
+        for name, fn in list(self.tool_funcs.items()):
+            # in place: parallel_tools holds a reference to this dict
+            self.tool_funcs[name] = self._session_tool(name, fn)
+
+    def _session_tool(self, name: str, fn):
+        def call(query):
+            session = self.session
+            return session.call_tool(name, fn, query) if session else fn(query)
+        return call
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache else {}
 
     def _is_satisfactory(self, result) -> bool:
         """Very small heuristic to detect unsatisfactory answers.
@@ -105,19 +260,99 @@ class DDAgent(dspy.Module):
                 return False
         return True
 
-    def forward(self, question: str, initial_schema: str) -> dspy.Prediction:
+    def forward(self, question: str, initial_schema: str, session: Session | None = None) -> dspy.Prediction:
         """The forward pass of the module.
 
         Calls the underlying agent, and if the answer seems unsatisfactory,
         runs the configured tools directly in priority order and returns the
         first non-empty tool output (wrapped in a dict with a `fallback` flag).
+        Satisfactory agent answers are stored in the answer cache, and cached
+        answers are returned without calling the agent.
+
+        With a ``session`` the conversation history is passed to the agent,
+        tool results are reused within the conversation and the turn is
+        recorded; the answer cache is only used for a conversation's first
+        question, since follow-ups depend on what came before.
         """
-        result = self.agent(question=question, initial_schema=initial_schema)
+        history = session.context() if session else ""
+        if self._cacheable(question, history):
+            cached = self.cache.get(question, scope=initial_schema or "")
+            if cached is not None:
+                return self._record(session, question, dspy.Prediction(answer=cached, cached=True))
+
+        self.session = session
+        try:
+            decision = self._route(question, history)
+            if decision.route != "agent":
+                result = self._answer_routed(question, decision)
+                if result is not None:
+                    return self._record(session, question, self._finish(question, initial_schema, result, history))
+            self._trajectory()
+            result = self.agent(question=question, initial_schema=initial_schema, history=history)
+            return self._record(session, question, self._finish(question, initial_schema, result, history))
+        finally:
+            self.session = None
+
+    def _cacheable(self, question: str, history: str) -> bool:
+        # answers about a screenshot depend on the image, not only on the wording
+        return bool(self.cache) and not history and not screenshot_ids(question)
+
+    def _route(self, question: str, history: str) -> RouteDecision:
+        if screenshot_ids(question):
+            return RouteDecision("agent", reason="screenshot attached")
+        if self.router is None:
+            return RouteDecision("agent", reason="no router")
+        return self.router.route(question, history)
+
+    def _trajectory(self):
+        # each of lookup, agent and fallbacks starts from a context without earlier tool output
+        if self.session is not None:
+            self.session.start_trajectory()
+
+    def _answer_routed(self, question: str, decision: RouteDecision):
+        """Answer a greeting or lookup without the agent; None means escalate to it."""
+        if decision.route == "greeting":
+            return dspy.Prediction(answer=GREETING_ANSWER, route="greeting")
+        self._trajectory()
+        t0 = time.perf_counter()
+        names = [n for n in ("structured_lookup", "local_search") if n in self.tool_funcs]
+        outputs = run_tools(self.tool_funcs, [(n, question) for n in names], timeout=self.default_timeout)
+        # skip tools that came back empty ("matches": [] / "results": [])
+        context = "\n\n".join(
+            out["answer"] for out in outputs
+            if isinstance(out, dict) and out.get("answer") and out.get("matches", True) and out.get("results", True)
+        )
+        if not context:
+            print("[router] Lookup found no context; escalating to the agent.")
+            return None
+        result = self.formatter(question=question, context=context)
+        print(f"[router] Lookup answered in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if not self._is_satisfactory(result):
+            print("[router] Lookup answer unsatisfactory; escalating to the agent.")
+            return None
+        return dspy.Prediction(answer=result.answer, route="lookup")
+
+    def _record(self, session: Session | None, question: str, result):
+        if session is not None:
+            session.record(question, result)
+        return result
 
+    def _finish(self, question: str, initial_schema: str, result, history: str = ""):
+        """Cache a satisfactory agent result, otherwise run the fallbacks."""
         if self._is_satisfactory(result):
+            if self._cacheable(question, history) and getattr(result, "answer", None):
+                self.cache.put(question, str(result.answer), scope=initial_schema or "")
             return result
 
         # Agent result not satisfactory — try tools in priority order.
+        # Their output is the answer itself, so it must not point at passages the user never saw.
+        self._trajectory()
+        if self.parallel_fallback:
+            with span("agent.fallback") as s:
+                fallback = self._parallel_fallback(question)
+                s.set(tool=fallback["tool"] if fallback else None)
+            return fallback or result
+
         for name in self.priorities:
             fn = self.tool_funcs.get(name)
             if not fn:
@@ -137,23 +372,106 @@ class DDAgent(dspy.Module):
         # no useful fallback — return the original agent result
         return result
 
+    def stream(self, question: str, initial_schema: str = "", session: Session | None = None):
+        """Like `forward`, but yields events while the agent works.
+
+        Yields ``("status", text)`` when a tool starts, ``("token", text)``
+        for each chunk of the final answer and, last, ``("final", result)``
+        with what `forward` would have returned.
+        """
+        history = session.context() if session else ""
+        if self._cacheable(question, history):
+            cached = self.cache.get(question, scope=initial_schema or "")
+            if cached is not None:
+                yield "final", self._record(session, question, dspy.Prediction(answer=cached, cached=True))
+                return
+
+        decision = self._route(question, history)
+        if decision.route != "agent":
+            if decision.route == "lookup":
+                yield "status", f"Looking up {', '.join(decision.entities)}..."
+            self.session = session
+            try:
+                result = self._answer_routed(question, decision)
+            finally:
+                self.session = None
+            if result is not None:
+                yield "token", result.answer
+                yield "final", self._record(session, question, self._finish(question, initial_schema, result, history))
+                return
+
+        streaming_agent = dspy.streamify(
+            self.agent,
+            status_message_provider=_ToolStatus(),
+            stream_listeners=[dspy.streaming.StreamListener(signature_field_name="answer")],
+            async_streaming=False,
+        )
+        result = None
+        self.session = session
+        self._trajectory()
+        try:
+            for item in streaming_agent(question=question, initial_schema=initial_schema, history=history):
+                if isinstance(item, dspy.streaming.StatusMessage):
+                    yield "status", item.message
+                elif isinstance(item, dspy.streaming.StreamResponse):
+                    yield "token", item.chunk
+                elif isinstance(item, dspy.Prediction):
+                    result = item
+            if not self._is_satisfactory(result):
+                yield "status", "Answer looked incomplete; checking the fallback tools..."
+            final = self._record(session, question, self._finish(question, initial_schema, result, history))
+        finally:
+            self.session = None
+        yield "final", final
+
+    def _parallel_fallback(self, question: str) -> dict | None:
+        """Start every fallback tool at once and keep the best one by priority.
+
+        Tools are awaited in priority order, each until its own deadline, so
+        a result is returned as soon as all higher-priority tools have
+        finished or timed out. Calls that have not started are cancelled;
+        running ones are left to finish in the background.
+        """
+        start = time.monotonic()
+        futures = {name: submit(_tool_pool, self.tool_funcs[name], question)
+                   for name in self.priorities if self.tool_funcs.get(name)}
+        try:
+            for name, future in futures.items():
+                deadline = start + self.tool_timeouts.get(name, self.default_timeout)
+                tool_out = _collect(future, deadline)
+                if _tool_output_ok(tool_out):
+                    return {"fallback": True, "tool": name, "answer": tool_out}
+                if isinstance(tool_out, Exception):
+                    print(f"[Agent] Fallback {name} failed: {tool_out!r}")
+        finally:
+            for future in futures.values():
+                future.cancel()
+        return None
+
 
-def configure_llm():
-    """Configures the DSPy language model."""
+def configure_llm(lm: dspy.BaseLM | None = None):
+    """Configures the DSPy language model.
+
+    lm: use this LM instead of the default (e.g. a local stand-in for
+    benchmarks); otherwise the DD_LLM_MODEL env var, default gpt-4o-mini.
+    """
     load_dotenv()
-    llm = dspy.LM(model="openai/gpt-4o-mini", max_tokens=5000)
-    dspy.settings.configure(lm=llm)
+    llm = lm or dspy.LM(model=os.getenv("DD_LLM_MODEL", "openai/gpt-4o-mini"), max_tokens=5000)
+    dspy.settings.configure(lm=llm, callbacks=[_TraceCallback()])
 
-    print("[Agent] DSPy configured with gpt-4o-mini model.")
+    print(f"[Agent] DSPy configured with {llm.model} model.")
     return llm
 
 
-def create_agent(priorities: list[str] | None = None) -> dspy.Module | None:
+def create_agent(priorities: list[str] | None = None, cache: AnswerCache | None = None,
+                 lm: dspy.BaseLM | None = None) -> dspy.Module | None:
     """Create and return the DDAgent instance.
 
     priorities: optional list controlling fallback order (e.g. ["local_search", "web_search"]).
+    cache: answer cache to share between agents; a new one is created when omitted.
+    lm: language model to configure instead of the default one.
     """
-    if not configure_llm():
+    if not configure_llm(lm):
         return
 
     web_search_tool = dspy.Tool(
@@ -170,13 +488,46 @@ def create_agent(priorities: list[str] | None = None) -> dspy.Module | None:
         func=lambda query: rag_tool(query),
     )
 
-    all_tools = [web_search_tool, local_search_tool]
+    structured_lookup_tool = dspy.Tool(
+        name="structured_lookup",
+        desc="Exact lookup of a named hero, enemy, trinket or curio in the local entity database: hero stats and resistances, enemy HP/resistances/skills, trinket effects by hero class or dungeon, and which supply item cleanses a curio. Use it first when the question names a specific entity. Example: 'Bone Defender resistances', 'Vestal trinkets', 'Sacrificial Stone'.",
+        func=lambda query: structured_lookup(query),
+    )
+
+    screenshot_state = dspy.Tool(
+        name="screenshot_state",
+        desc="Reads a combat screenshot the user attached and returns the party (hero per rank 1-4 with approximate HP and stress) and the enemy lineup (enemy per rank with approximate HP). The query is the screenshot id from the question, e.g. 'img:3f2a9c01b7de'. Use it before advising on a fight the user showed in a screenshot.",
+        func=lambda query: screenshot_state_tool(query),
+    )
 
     # 2. Instantiate and run the agent. Provide the underlying callables and
     # a default priority order so DDAgent can run fallbacks when needed.
-    tool_funcs = {"web_search": web_search_tool_fn, "local_search": rag_tool}
+    tool_funcs = {"web_search": web_search_tool_fn, "local_search": rag_tool, "structured_lookup": structured_lookup}
+
+    def parallel_tools(calls: list[dict]) -> list[dict]:
+        return [
+            {"tool": c.get("tool"), "query": c.get("query"),
+             "output": out if not isinstance(out, Exception) else f"error: {out!r}"}
+            for c, out in zip(calls, run_tools(tool_funcs, [(c.get("tool"), c.get("query", "")) for c in calls]))
+        ]
+
+    parallel_tools_tool = dspy.Tool(
+        name="parallel_tools",
+        desc="Runs several independent tool calls at the same time and returns all their outputs in order. Use it instead of consecutive steps when the queries do not depend on each other. Each call is {'tool': 'structured_lookup' | 'local_search' | 'web_search', 'query': '...'}. Example: [{'tool': 'structured_lookup', 'query': 'Vestal trinkets'}, {'tool': 'local_search', 'query': 'crate'}].",
+        func=parallel_tools,
+    )
+
+    all_tools = [structured_lookup_tool, web_search_tool, local_search_tool, parallel_tools_tool]
+    # no weights ship with the repo; without them every call would only return an error
+    if screenshot_reading_available():
+        tool_funcs["screenshot_state"] = screenshot_state_tool
+        all_tools.insert(3, screenshot_state)
+    else:
+        print("[Agent] Screenshot detector weights not installed; screenshot_state is disabled.")
+
     priorities = priorities or ["local_search", "web_search"]
 
-    agent = DDAgent(tools=all_tools, tool_funcs=tool_funcs, priorities=priorities)
+    agent = DDAgent(tools=all_tools, tool_funcs=tool_funcs, priorities=priorities, cache=cache or create_answer_cache(),
+                    router=QuestionRouter(_router_names))
 
     return agent
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""Bounded pool of agent workers for concurrent serving.
+
+Each worker thread owns its own `DDAgent` and runs it inside
+``dspy.context`` with a private copy of the configured LM, so concurrent
+requests never share call history or settings. At most ``workers``
+questions run at a time (size it to the LLM rate limit), up to
+``max_queue`` more wait, and anything beyond that is rejected with
+`AgentPoolBusy`. Requests for a question that is already being answered
+(with the same conversation history) are attached to the running call
+instead of starting a new one.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+import asyncio
+import os
+import queue
+import threading
+import time
+
+import dspy
+
+from answer_cache import normalize_question
+from conversation import Session
+from tools.tracing import span
+
+
+class AgentPoolBusy(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class _Job:
+    """One agent call; its events are replayed to every subscriber."""
+
+    def __init__(self, key: Tuple[str, str, str], loop: asyncio.AbstractEventLoop):
+        self.key = key
+        self.loop = loop
+        self.session: Session | None = None
+        self.events: List[Tuple[str, object]] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.done = False
+        self.created = time.perf_counter()
+
+    def publish(self, event: Tuple[str, object]):
+        self.events.append(event)
+        for q in self.subscribers:
+            q.put_nowait(event)
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            q.put_nowait(event)
+        self.subscribers.append(q)
+        return q
+
+
+class AgentPool:
+    def __init__(self, factory: Callable[[], object], workers: int = 4, max_queue: int = 32):
+        self.workers = workers
+        self.max_queue = max_queue
+        # agents are created up front on the calling thread: dspy only allows
+        # the thread that configured it to change its global settings
+        self._agents: queue.Queue = queue.Queue()
+        for _ in range(workers):
+            agent = factory()
+            if agent is None:
+                raise RuntimeError("agent factory returned None")
+            lm = dspy.settings.lm.copy() if dspy.settings.lm is not None else None
+            self._agents.put((agent, lm))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dd-agent")
+        self._lock = threading.Lock()
+        self._jobs: Dict[Tuple[str, str, str], _Job] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def _run(self, job: _Job, question: str, initial_schema: str, session: Session | None):
+        agent, lm = self._agents.get()
+        try:
+            with dspy.context(lm=lm), span("agent.request", queue_ms=round((time.perf_counter() - job.created) * 1000, 3)) as s:
+                for event in agent.stream(question=question, initial_schema=initial_schema, session=session):
+                    if event[0] == "token" and "first_token_ms" not in s.attrs:
+                        s.set(first_token_ms=round((time.perf_counter() - job.created) * 1000, 3))
+                    job.loop.call_soon_threadsafe(job.publish, event)
+        except Exception as e:
+            job.loop.call_soon_threadsafe(job.publish, ("final", e))
+        finally:
+            self._agents.put((agent, lm))
+            job.loop.call_soon_threadsafe(self._finish, job)
+
+    def _finish(self, job: _Job):
+        if not any(kind == "final" for kind, _ in job.events):
+            job.publish(("final", None))
+        job.done = True
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    async def stream(self, question: str, initial_schema: str = "",
+                     session: Session | None = None) -> AsyncIterator[Tuple[str, object]]:
+        """Events of `DDAgent.stream` for ``question``, ending with ``("final", result)``."""
+        key = (normalize_question(question), initial_schema or "", session.key() if session else "")
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self.coalesced += 1
+            else:
+                if len(self._jobs) >= self.workers + self.max_queue:
+                    self.rejected += 1
+                    raise AgentPoolBusy(f"{len(self._jobs)} questions in flight")
+                job = self._jobs[key] = _Job(key, asyncio.get_running_loop())
+                job.session = session
+                self.started += 1
+                self._executor.submit(self._run, job, question, initial_schema, session)
+            events = job.subscribe()
+        while True:
+            kind, value = await events.get()
+            if kind == "final" and session is not None and session is not job.session:
+                # coalesced onto another conversation's call; the agent only recorded it there
+                session.record(question, value)
+            yield kind, value
+            if kind == "final":
+                return
+
+    async def ask(self, question: str, initial_schema: str = "", session: Session | None = None):
+        """Final result only."""
+        result = None
+        async for kind, value in self.stream(question, initial_schema, session):
+            if kind == "final":
+                result = value
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._jobs)
+        return {
+            "workers": self.workers,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.workers),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+
+def create_agent_pool(factory: Callable[[], object]) -> AgentPool:
+    """Pool sized by ``AGENT_WORKERS`` (default 4) and ``AGENT_QUEUE`` (default 32)."""
+    return AgentPool(
+        factory,
+        workers=int(os.getenv("AGENT_WORKERS", "4")),
+        max_queue=int(os.getenv("AGENT_QUEUE", "32")),
+    )
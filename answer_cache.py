@@ -0,0 +1,305 @@
+"""Two-level answer cache in front of `DDAgent`.
+
+Level one is an exact match on the normalized question ("Best trinkets for
+Vestal?" and "best trinkets for vestal" share a key); level two is a
+near-duplicate match by cosine similarity of question embeddings. Entries
+live in a local SQLite file so they survive restarts, expire after ``ttl``
+seconds, are evicted least-recently-used beyond ``max_entries`` and are all
+dropped when the files under ``wiki_menu_data`` change.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from tools.rag.disk_index import _scan_sources, default_index_dir
+from tools.rag.file_loader import get_corpus_store
+from tools.tracing import span
+
+
+Encoder = Callable[[Sequence[str]], np.ndarray]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    embedding BLOB,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers (last_used);
+"""
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case words only: "Best trinkets for Vestal?" -> "best trinkets for vestal"."""
+    return " ".join(re.findall(r"\w+", question.lower().replace("_", " ")))
+
+
+def corpus_fingerprint(data_dir: Path) -> str:
+    entries = [(rel, st.st_size, st.st_mtime_ns) for rel, st in _scan_sources(data_dir).items()]
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Persistent exact + semantic cache of agent answers.
+
+    ``encoder`` embeds questions for the semantic level; when it is None
+    only exact matches are served. ``scope`` (e.g. the system prompt) is
+    part of every key, so answers given under different prompts never mix.
+    A near-duplicate only counts when both questions name the same
+    entities, so "Vestal trinkets" never answers "Crusader trinkets".
+    With ``refresh`` set, lookups always miss but `put` still stores, so
+    every answer is recomputed and replaces the cached one.
+    """
+
+    def __init__(self, db_path: Path = None, root: Path = None, ttl: float = 24 * 3600, max_entries: int = 2000,
+                 threshold: float = 0.93, encoder: Encoder | None = None, refresh: bool = False):
+        store = get_corpus_store(root)
+        self._corpus_store = store
+        self.db_path = Path(db_path or default_index_dir(store.root) / "answers.sqlite")
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.encoder = encoder
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._generation = -1
+        # semantic level: (key, scope) and L2-normalised embedding rows of live entries
+        self._keys: List[Tuple[str, str]] = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        with self._lock:
+            self._check_corpus()
+            self._load_vectors()
+
+    @staticmethod
+    def _scope(scope: str) -> str:
+        return hashlib.sha1(scope.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _key(question: str, scope: str) -> str:
+        return hashlib.sha1(f"{scope}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def _check_corpus(self):
+        corpus = self._corpus_store.get()
+        if corpus.generation == self._generation:
+            return
+        self._generation = corpus.generation
+        fingerprint = corpus_fingerprint(self._corpus_store.data_dir)
+        row = self._conn.execute("SELECT value FROM cache_meta WHERE key = 'corpus'").fetchone()
+        if row and row[0] == fingerprint:
+            return
+        if row:
+            print("[answer_cache] Corpus changed; dropping cached answers.")
+            self.invalidations += 1
+        self._conn.execute("DELETE FROM answers")
+        self._conn.execute("INSERT OR REPLACE INTO cache_meta VALUES ('corpus', ?)", (fingerprint,))
+        self._conn.commit()
+        self._keys, self._vectors = [], np.zeros((0, 0), dtype=np.float32)
+
+    def _load_vectors(self):
+        rows = self._conn.execute("SELECT key, scope, embedding FROM answers WHERE embedding IS NOT NULL").fetchall()
+        self._keys = [(k, scope) for k, scope, _ in rows]
+        self._vectors = np.stack([np.frombuffer(b, dtype=np.float32) for _, _, b in rows]) if rows \
+            else np.zeros((0, 0), dtype=np.float32)
+
+    def _embed(self, question: str) -> np.ndarray | None:
+        if self.encoder is None:
+            return None
+        try:
+            encode_query = getattr(self.encoder, "encode_query", None)
+            vec = encode_query(question) if encode_query else self.encoder([question])[0]
+        except Exception as e:
+            print(f"[answer_cache] Semantic level disabled: {e}")
+            self.encoder = None
+            return None
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _nearest(self, vec: np.ndarray | None, scope: str) -> List[str]:
+        """Keys in ``scope`` whose question is at least ``threshold`` similar, best first."""
+        if vec is None or not self._keys or self._vectors.shape[1] != len(vec):
+            return []
+        sims = self._vectors @ vec
+        order = np.argsort(-sims)
+        return [self._keys[i][0] for i in order if sims[i] >= self.threshold and self._keys[i][1] == scope][:5]
+
+    @staticmethod
+    def _entities(question: str) -> frozenset:
+        try:
+            from tools.rag.entity_store import get_entity_store
+
+            return frozenset(get_entity_store().mentioned(question))
+        except (OSError, sqlite3.Error):
+            return frozenset()
+
+    def _drop(self, keys: List[str]):
+        if not keys:
+            return
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+        self._forget(keys)
+
+    def _forget(self, keys: List[str]):
+        drop = set(keys)
+        keep = [i for i, (k, _) in enumerate(self._keys) if k not in drop]
+        if len(keep) != len(self._keys):
+            self._keys = [self._keys[i] for i in keep]
+            self._vectors = self._vectors[keep]
+
+    def _fetch(self, key: str, now: float, entities: frozenset | None = None) -> str | None:
+        row = self._conn.execute("SELECT answer, created, question FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            self._drop([key])
+            self._conn.commit()
+            return None
+        if entities is not None and self._entities(row[2]) != entities:
+            return None
+        self._conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self._conn.commit()
+        return row[0]
+
+    def get(self, question: str, scope: str = "") -> str | None:
+        """Cached answer for ``question`` or None."""
+        with span("answer_cache.get") as s:
+            if self.refresh:
+                s.set(cache="refresh")
+                return None
+            answer, outcome = self._get(question, scope)
+            s.set(cache=outcome)
+            return answer
+
+    def _get(self, question: str, scope: str) -> Tuple[str | None, str]:
+        key = self._key(question, scope)
+        with self._lock:
+            self._check_corpus()
+            answer = self._fetch(key, time.time())
+            if answer is not None:
+                self.exact_hits += 1
+                return answer, "hit"
+        # encode outside the lock; it is the slow part
+        vec = self._embed(normalize_question(question))
+        with self._lock:
+            candidates = self._nearest(vec, self._scope(scope))
+            entities = self._entities(question) if candidates else None
+            for candidate in candidates:
+                answer = self._fetch(candidate, time.time(), entities)
+                if answer is not None:
+                    self.semantic_hits += 1
+                    return answer, "semantic_hit"
+            self.misses += 1
+            return None, "miss"
+
+    def put(self, question: str, answer: str, scope: str = ""):
+        key = self._key(question, scope)
+        scope = self._scope(scope)
+        vec = self._embed(normalize_question(question))
+        with self._lock:
+            self._check_corpus()
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, scope, question, answer, embedding, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, scope, question, answer, vec.tobytes() if vec is not None else None, now, now),
+            )
+            self._forget([key])
+            if vec is not None:
+                if self._vectors.shape[1:] != (len(vec),):
+                    self._vectors = np.zeros((0, len(vec)), dtype=np.float32)
+                self._keys.append((key, scope))
+                self._vectors = np.vstack([self._vectors, vec[None, :]])
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        expired = [k for (k,) in self._conn.execute("SELECT key FROM answers WHERE created < ?", (now - self.ttl,))]
+        overflow = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - len(expired) - self.max_entries
+        lru = []
+        if overflow > 0:
+            lru = [k for (k,) in self._conn.execute(
+                "SELECT key FROM answers WHERE created >= ? ORDER BY last_used LIMIT ?", (now - self.ttl, overflow))]
+        self.evictions += len(expired) + len(lru)
+        self._drop(expired + lru)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._keys, self._vectors = [], np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict[str, float]:
+        # counters change under the lock; read them there too for a consistent snapshot
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "lookups": lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "entries": entries,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _default_encoder() -> Encoder | None:
+    if os.getenv("ANSWER_CACHE_SEMANTIC", "1") == "0":
+        return None
+    # find_spec, not import: importing it loads torch and transformers
+    try:
+        available = importlib.util.find_spec("llama_index.embeddings.huggingface") is not None
+    except ModuleNotFoundError:
+        available = False
+    if not available:
+        print("[answer_cache] llama-index embeddings not installed; exact matches only.")
+        return None
+    from tools.rag import dense_index
+
+    if dense_index._encoder is None:
+        dense_index._encoder = dense_index.HuggingFaceEncoder()
+    return dense_index._encoder
+
+
+def create_answer_cache(root: Path = None) -> AnswerCache | None:
+    """Cache configured from the environment; None when ``ANSWER_CACHE=0``.
+
+    ``ANSWER_CACHE_TTL`` (seconds), ``ANSWER_CACHE_SIZE`` (entries) and
+    ``ANSWER_CACHE_THRESHOLD`` (cosine similarity for near-duplicates) tune it.
+    """
+    if os.getenv("ANSWER_CACHE", "1") == "0":
+        return None
+    try:
+        return AnswerCache(
+            root=root,
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2000")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93")),
+            encoder=_default_encoder(),
+        )
+    except (OSError, sqlite3.Error) as e:
+        print(f"[answer_cache] Disabled: {e}")
+        return None
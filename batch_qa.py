@@ -0,0 +1,259 @@
+"""Offline batch question answering over JSONL.
+
+Questions are streamed from a JSONL file, one ``{"id", "question"}`` object
+per line (``initial_schema`` is optional; the id defaults to the line
+number). benchmarks/questions.jsonl has this format. Retrieval runs first,
+in a process pool: ``structured_lookup`` and ``local_search`` for the
+question itself. Its results are primed into the question's `Session`
+tool cache. That cache is keyed by the query, here the raw question, so
+only the router's lookup path and the agent's fallbacks (which search for
+the question as asked) reuse them; the ReAct loop writes its own queries
+and still searches. The LLM stage then runs through an
+`AgentPool` whose ``--llm-concurrency`` workers cap the number of calls in
+flight.
+
+Each answer is appended to the output JSONL as soon as it is done, with
+per-question timings, and flushed to disk. The output file doubles as the
+checkpoint: a rerun skips ids it already holds and retries failed ones. On
+resume the file is first rewritten with only the last successful record
+of each id, so retries never leave duplicate ids behind. Answers also go
+through the shared answer cache, so a nightly run pre-warms it;
+``--refresh`` recomputes every answer and writes it back to the cache,
+``--no-cache`` bypasses the cache entirely. Run from the repository root:
+
+    python batch_qa.py questions.jsonl answers.jsonl [--processes 4] [--llm-concurrency 4] [--restart]
+                       [--refresh | --no-cache]
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, Set
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+# worker processes only import this module and the retrieval tools;
+# dspy and the agents are imported by `run` in the parent
+RETRIEVAL_TOOLS = ("structured_lookup", "local_search")
+
+
+def _init_worker():
+    from tools.rag.entity_store import get_entity_store
+    from tools.rag.principalTool import warm_up
+
+    warm_up()
+    get_entity_store()
+
+
+def retrieve(question: str) -> Dict[str, Any]:
+    """Retrieval stage, run in a worker process: ``{"tools": {name: output}, "ms"}``."""
+    from tools.rag.entity_store import structured_lookup
+    from tools.rag.principalTool import rag_tool
+
+    t0 = time.perf_counter()
+    fns = {"structured_lookup": structured_lookup, "local_search": rag_tool}
+    tools = {}
+    for name in RETRIEVAL_TOOLS:
+        try:
+            tools[name] = fns[name](question)
+        except Exception as e:
+            print(f"[batch_qa] {name} failed for {question!r}: {e!r}")
+    return {"tools": tools, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+def completed_ids(path: Path) -> Set[str]:
+    """Ids already answered in ``path`` (without an error).
+
+    The file is rewritten to hold one record per answered id, the last one:
+    failed records (about to be retried) and a line cut short by a crash are
+    dropped, so the file stays valid JSONL without duplicate ids.
+    """
+    if not path.exists():
+        return set()
+    # id -> line of its last successful record, in the order they were written
+    kept: Dict[str, bytes] = {}
+    lines = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            lines += 1
+            if not record.get("error"):
+                qid = str(record["id"])
+                kept.pop(qid, None)
+                kept[qid] = line
+    if lines != len(kept) or sum(map(len, kept.values())) < path.stat().st_size:
+        print(f"[batch_qa] Compacting {path}: {len(kept)} answered, dropping {lines - len(kept)} failed or superseded "
+              f"records and any partial line.")
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.writelines(kept.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    return set(kept)
+
+
+def read_questions(path: Path, skip: Set[str]) -> Iterator[Dict[str, str]]:
+    """Questions from ``path`` in order, without the ids in ``skip`` or repeated ids."""
+    seen = set(skip)
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            qid = str(item.get("id") or f"line-{n}")
+            if qid in seen or not item.get("question"):
+                continue
+            seen.add(qid)
+            yield {"id": qid, "question": item["question"], "initial_schema": item.get("initial_schema", "")}
+
+
+def _answer_text(result) -> str | None:
+    if isinstance(result, dict):
+        answer = result.get("answer")
+    else:
+        answer = getattr(result, "answer", None)
+    if answer is None:
+        return None
+    return answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False, default=str)
+
+
+def _record(item: Dict[str, str], result, retrieval: Dict[str, Any] | None, session, t0: float, t_llm: float) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"id": item["id"], "question": item["question"]}
+    if isinstance(result, Exception) or result is None:
+        record["error"] = repr(result) if result is not None else "no result"
+    else:
+        record["answer"] = _answer_text(result)
+        if isinstance(result, dict):
+            record["route"] = f"fallback:{result.get('tool')}"
+        elif getattr(result, "cached", False):
+            record["route"] = "cache"
+        else:
+            record["route"] = getattr(result, "route", "agent")
+    now = time.perf_counter()
+    record["timings"] = {
+        "retrieval_ms": retrieval["ms"] if retrieval else None,
+        "llm_ms": round((now - t_llm) * 1000, 1),
+        "total_ms": round((now - t0) * 1000, 1),
+    }
+    stats = session.stats()
+    record["tool_hits"], record["tool_misses"] = stats["tool_hits"], stats["tool_misses"]
+    return record
+
+
+async def run(questions: Path, output: Path, processes: int = 4, llm_concurrency: int = 4,
+              window: int | None = None, restart: bool = False, refresh: bool = False,
+              use_cache: bool = True) -> Dict[str, Any]:
+    """Answer every question in ``questions`` not yet in ``output``; returns a summary.
+
+    ``window`` bounds how many questions are in flight between the two
+    stages (default: enough to keep both busy). ``refresh`` skips answer
+    cache lookups but stores the new answers; ``use_cache=False`` does not
+    touch the cache at all.
+    """
+    from agent import create_agent
+    from agent_pool import AgentPool
+    from answer_cache import create_answer_cache
+    from conversation import Session
+
+    if restart and output.exists():
+        output.unlink()
+    done = completed_ids(output)
+    if done:
+        print(f"[batch_qa] Resuming: {len(done)} questions already answered in {output}.")
+    window = window or 2 * (processes + llm_concurrency)
+    if not use_cache:
+        # create_agent would otherwise open its own cache
+        os.environ["ANSWER_CACHE"] = "0"
+    cache = create_answer_cache()
+    if cache and refresh:
+        cache.refresh = True
+    pool = AgentPool(lambda: create_agent(cache=cache), workers=llm_concurrency, max_queue=window)
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(window)
+    timings = []
+    counts = {"answered": 0, "errors": 0, "skipped": len(done)}
+    t_start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             mp_context=multiprocessing.get_context("spawn")) as retrievers, \
+            open(output, "a", encoding="utf-8") as out:
+
+        def write(record: Dict[str, Any]):
+            out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+
+        async def answer(item: Dict[str, str]):
+            t0 = time.perf_counter()
+            session = Session(f"batch:{item['id']}")
+            try:
+                retrieval = await loop.run_in_executor(retrievers, retrieve, item["question"])
+            except Exception as e:
+                print(f"[batch_qa] Retrieval failed for {item['id']}: {e!r}")
+                retrieval = None
+            for name, tool_out in (retrieval or {}).get("tools", {}).items():
+                session.prime(name, item["question"], tool_out)
+            t_llm = time.perf_counter()
+            try:
+                result = await pool.ask(item["question"], item["initial_schema"], session=session)
+            except Exception as e:
+                result = e
+            record = _record(item, result, retrieval, session, t0, t_llm)
+            write(record)
+            if "error" in record:
+                counts["errors"] += 1
+            else:
+                counts["answered"] += 1
+                timings.append(record["timings"]["total_ms"])
+            print(f"[batch_qa] {item['id']}: {record.get('route', 'error')} in {record['timings']['total_ms']:.0f} ms")
+
+        tasks = set()
+        for item in read_questions(questions, done):
+            await slots.acquire()
+            task = asyncio.create_task(answer(item))
+            tasks.add(task)
+            task.add_done_callback(lambda t: (tasks.discard(t), slots.release()))
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    wall = time.perf_counter() - t_start
+    summary = dict(counts, seconds=round(wall, 1), pool=pool.stats(), answer_cache=cache.stats() if cache else {})
+    if timings:
+        timings.sort()
+        summary["total_ms"] = {"mean": round(statistics.mean(timings), 1),
+                               "p50": timings[len(timings) // 2], "max": timings[-1]}
+        summary["questions_per_min"] = round(len(timings) / wall * 60, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", type=Path, help="input JSONL with one {\"id\", \"question\"} per line")
+    parser.add_argument("output", type=Path, help="output JSONL; also the checkpoint a rerun resumes from")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("BATCH_PROCESSES", "4")),
+                        help="retrieval worker processes")
+    parser.add_argument("--llm-concurrency", type=int, default=int(os.getenv("AGENT_WORKERS", "4")),
+                        help="agent workers, i.e. LLM calls in flight")
+    parser.add_argument("--window", type=int, default=None, help="questions in flight between the stages")
+    parser.add_argument("--restart", action="store_true", help="discard the existing output and start over")
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument("--refresh", action="store_true",
+                       help="ignore cached answers, but store the new ones in the answer cache")
+    cache.add_argument("--no-cache", action="store_true", help="neither read nor write the answer cache")
+    args = parser.parse_args()
+    summary = asyncio.run(run(args.questions, args.output, args.processes, args.llm_concurrency,
+                              args.window, args.restart, args.refresh, not args.no_cache))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Offline end-to-end benchmark of the agent pipeline.
+
+`create_agent` runs against deterministic local stand-ins: `ScriptedLM`, a
+DSPy LM that answers every ReAct step from a per-question tool script
+after a configurable delay, and a local HTTP server in place of the wiki
+for ``web_search``. Local search, the entity store and the router run for
+real. Questions come from ``benchmarks/questions.jsonl`` (one
+``{"id", "question", "tools"}`` object per line; ``tools`` is the order in
+which the scripted agent calls them).
+
+Run from the repository root:
+
+    python -m benchmarks.bench_agent [--llm-latency 0.3] [--repeat 1] [--cache] [--json out.json]
+"""
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_retriever import _percentile
+from benchmarks.bench_web_search import _WikiStandIn
+
+
+ROOT = Path(__file__).resolve().parents[1]
+QUESTIONS = ROOT / "benchmarks" / "questions.jsonl"
+
+_FIELD_RE = r"\[\[ ## {} ## \]\]\n(.*?)(?:\n\n\[\[ ## |\Z)"
+
+
+def _field(text: str, name: str) -> str:
+    m = re.search(_FIELD_RE.format(name), text, re.DOTALL)
+    return m.group(1).strip() if m else ""
+
+
+def load_questions(path: Path = QUESTIONS) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _make_lm_class():
+    import dspy
+
+    class ScriptedLM(dspy.BaseLM):
+        """Chat-adapter-compatible LM that follows a tool script per question.
+
+        ReAct steps call ``scripts[question]`` in order and then ``finish``;
+        any signature with an ``answer`` output gets a fixed-format answer.
+        Every call sleeps ``latency`` seconds and counts estimated tokens.
+        """
+
+        def __init__(self, scripts: dict[str, list[str]], latency: float = 0.0):
+            super().__init__(model="local/scripted", model_type="chat", temperature=0.0, max_tokens=1000, cache=False)
+            self.scripts = scripts
+            self.latency = latency
+            self._lock = threading.Lock()
+            self.reset()
+
+        def reset(self):
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.seconds = 0.0
+
+        def _reply(self, system: str, user: str) -> str:
+            question = _field(user, "question")
+            if "`next_tool_name`" in system:
+                step = len(set(re.findall(r"observation_(\d+)", user)))
+                tools = self.scripts.get(question, ["local_search"])
+                name, args = (tools[step], {"query": question}) if step < len(tools) else ("finish", {})
+                fields = {"next_thought": f"Step {step}: use {name}.", "next_tool_name": name,
+                          "next_tool_args": json.dumps(args)}
+            else:
+                fields = {}
+                if "`reasoning`" in system:
+                    fields["reasoning"] = "The retrieved observations cover the question."
+                fields["answer"] = (f"Short Recommendation: answer to '{question}' from the retrieved data.\n"
+                                    "1) Check the relevant stats. 2) Adjust the party. 3) Bring supplies.\n"
+                                    "Risk Assessment: Medium. Confidence: 70")
+            return "\n\n".join(f"[[ ## {k} ## ]]\n{v}" for k, v in fields.items()) + "\n\n[[ ## completed ## ]]"
+
+        def forward(self, prompt=None, messages=None, **kwargs):
+            t0 = time.perf_counter()
+            messages = messages or [{"role": "user", "content": prompt}]
+            system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+            text = self._reply(system, messages[-1]["content"])
+            if self.latency:
+                time.sleep(self.latency)
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+            completion_tokens = len(text) // 4
+            with self._lock:
+                self.calls += 1
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+                self.seconds += time.perf_counter() - t0
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            message = SimpleNamespace(content=text, tool_calls=None)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")],
+                                   usage=usage, model=self.model)
+
+    return ScriptedLM
+
+
+class ToolTimer:
+    """Wraps tool callables to count calls and time them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.calls[name] = self.calls.get(name, 0) + 1
+                    self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - t0
+        return timed
+
+
+def _instrument(agent, timer: ToolTimer):
+    for name, tool in agent.agent.tools.items():
+        if name != "finish":
+            tool.func = timer.wrap(name, tool.func)
+    for name, fn in list(agent.tool_funcs.items()):
+        agent.tool_funcs[name] = timer.wrap(name, fn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=Path, default=QUESTIONS)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per LLM call")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="keep the answer cache enabled")
+    parser.add_argument("--json", type=Path, help="write per-question results here")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WikiStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tmp = Path(tempfile.mkdtemp(prefix="bench_agent_"))
+    os.environ["WEB_SEARCH_BASE"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["WEB_CACHE_PATH"] = str(tmp / "web_pages.sqlite")
+    # the flag decides, whatever ANSWER_CACHE says in the environment
+    os.environ["ANSWER_CACHE"] = "1" if args.cache else "0"
+
+    from agent import create_agent
+    from tools.rag.entity_store import structured_lookup
+    from tools.rag.principalTool import rag_tool
+
+    questions = load_questions(args.questions)
+    lm = _make_lm_class()({q["question"]: q.get("tools", []) for q in questions}, latency=args.llm_latency)
+    agent = create_agent(lm=lm)
+    timer = ToolTimer()
+    _instrument(agent, timer)
+
+    # build indexes and the entity store outside the timed runs
+    rag_tool("warm up")
+    structured_lookup("warm up")
+
+    rows = []
+    for _ in range(args.repeat):
+        for q in questions:
+            lm.reset()
+            timer.reset()
+            t0 = time.perf_counter()
+            result = agent(question=q["question"], initial_schema="")
+            total = time.perf_counter() - t0
+            route = getattr(result, "route", None) or ("fallback" if isinstance(result, dict) else "agent")
+            rows.append({
+                "id": q["id"],
+                "route": route,
+                "total_ms": total * 1000,
+                "llm_ms": lm.seconds * 1000,
+                "tool_ms": {k: v * 1000 for k, v in timer.seconds.items()},
+                "llm_calls": lm.calls,
+                "tool_calls": dict(timer.calls),
+                "prompt_tokens": lm.prompt_tokens,
+                "completion_tokens": lm.completion_tokens,
+            })
+            r = rows[-1]
+            print(f"{r['id']}  {route:<8} total={r['total_ms']:8.1f} ms  llm={r['llm_ms']:8.1f} ms ({lm.calls} calls)  "
+                  f"tools={sum(r['tool_ms'].values()):7.1f} ms {r['tool_calls']}  tokens={lm.prompt_tokens}+{lm.completion_tokens}")
+
+    totals = [r["total_ms"] for r in rows]
+    print(f"\n{len(rows)} answers, LLM latency {args.llm_latency * 1000:.0f} ms/call")
+    print(f"total     mean={statistics.mean(totals):8.1f} ms  p50={_percentile(totals, 50):8.1f} ms  p95={_percentile(totals, 95):8.1f} ms")
+    llm = [r["llm_ms"] for r in rows]
+    print(f"llm       mean={statistics.mean(llm):8.1f} ms  p50={_percentile(llm, 50):8.1f} ms  p95={_percentile(llm, 95):8.1f} ms")
+    for name in sorted({n for r in rows for n in r["tool_ms"]}):
+        samples = [r["tool_ms"][name] for r in rows if name in r["tool_ms"]]
+        calls = sum(r["tool_calls"].get(name, 0) for r in rows)
+        print(f"{name:<17} calls={calls:4d}  mean/answer={statistics.mean(samples):8.1f} ms  p95={_percentile(samples, 95):8.1f} ms")
+    print(f"LLM calls/answer: {statistics.mean(r['llm_calls'] for r in rows):.2f}  "
+          f"tool calls/answer: {statistics.mean(sum(r['tool_calls'].values()) for r in rows):.2f}  "
+          f"tokens/answer: {statistics.mean(r['prompt_tokens'] for r in rows):.0f} prompt + "
+          f"{statistics.mean(r['completion_tokens'] for r in rows):.0f} completion")
+    routes = {}
+    for r in rows:
+        routes[r["route"]] = routes.get(r["route"], 0) + 1
+    print(f"routes: {routes}")
+
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=1), encoding="utf-8")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Effect of corpus compaction on index size, scoring time and packed context.
+
+Builds the in-memory BM25 index with and without `compact_corpus`. For
+each, it reports postings, scoring latency over the retriever benchmark
+queries, and how many passages `pack_snippets` fits into the
+RAG_CONTEXT_TOKENS budget. It also reports how many top-3 documents the
+two indexes share, and checks that every per-entity stat line ("SPD 4 4 5
+5 6", "Stun 25% 45% 70%") indexed by the plain build is still in some
+chunk of the same page; the script fails if one is lost. Run from the
+repository root:
+
+    python -m benchmarks.bench_compaction [--repeat N]
+"""
+from collections import defaultdict
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+from benchmarks.bench_retriever import QUERIES, _report, _timed
+from tools.rag.file_loader import load_corpus
+from tools.rag.qa_tool import DEFAULT_BUDGET, pack_snippets
+from tools.rag.retriever import InvertedIndex
+
+
+# a stat name followed by two or more values: infobox and enemy stat rows
+STAT_RE = re.compile(r"\b(?:MAX HP|HP|DODGE|Dodge|PROT|Protection|SPD|Speed|CRIT|DMG|Stun|Move|Blight|Bleed|Disease"
+                     r"|Debuff|Death Blow|Trap)(?: [-+]?\d[\d.]*%?){2,}")
+
+
+def _build(corpus, compact: bool) -> InvertedIndex:
+    os.environ["RAG_COMPACT"] = "1" if compact else "0"
+    t0 = time.perf_counter()
+    index = InvertedIndex.build(corpus)
+    postings = sum(len(ids) for ids, _ in index.postings.values())
+    print(f"{'compacted' if compact else 'plain':<10} build {(time.perf_counter() - t0) * 1000:7.1f} ms, "
+          f"{len(index.chunks)} chunks, {len(index.postings)} terms, {postings} postings")
+    return index
+
+
+def _page_texts(index: InvertedIndex):
+    pages = defaultdict(list)
+    for path, chunk in index.chunks:
+        pages[path].append(chunk.raw(index.texts[path]))
+    return pages
+
+
+def lost_stat_lines(plain: InvertedIndex, compacted: InvertedIndex):
+    """(page, stat line) pairs indexed by ``plain`` but in no chunk of the page in ``compacted``."""
+    before, after = _page_texts(plain), _page_texts(compacted)
+    lost, total = [], 0
+    for path, raws in before.items():
+        for line in {m.group() for raw in raws for m in STAT_RE.finditer(raw)}:
+            total += 1
+            if not any(line in raw for raw in after[path]):
+                lost.append((path.stem, line))
+    return lost, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    plain = _build(corpus, False)
+    compacted = _build(corpus, True)
+    print(f"\n{compacted.compaction.summary()}\n")
+
+    budget = int(os.getenv("RAG_CONTEXT_TOKENS", str(DEFAULT_BUDGET)))
+    overlap = 0
+    for name, index in (("plain", plain), ("compacted", compacted)):
+        samples, passages = [], []
+        for q in QUERIES:
+            samples += _timed(lambda: index.score(q), args.repeat)
+            passages.append(len(pack_snippets(index.search(q, top=6), q, budget).passages))
+        _report(name, samples)
+        print(f"{'':<10} {statistics.mean(passages):.2f} passages per {budget}-token observation")
+    for q in QUERIES:
+        overlap += len({p for p, _, _ in plain.search(q)} & {p for p, _, _ in compacted.search(q)})
+    print(f"\ntop-3 document overlap: {overlap}/{3 * len(QUERIES)}")
+
+    lost, total = lost_stat_lines(plain, compacted)
+    print(f"stat lines kept: {total - len(lost)}/{total}")
+    for page, line in lost[:10]:
+        print(f"  lost on {page}: {line}")
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
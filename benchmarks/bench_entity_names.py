@@ -0,0 +1,98 @@
+"""Typo-tolerant name resolution: accuracy, latency, and the retrieval it rescues.
+
+Each query misspells, abbreviates or re-hyphenates one name. The report
+shows the resolution latency (first and memoized), how many queries
+resolve to the expected page, and top-3 document hits of plain BM25
+against `rag_tool` with resolution. The last part also runs
+`structured_lookup`. Negative controls are ordinary questions whose words
+are close to some name ("stack" / Sack); any correction of them is
+counted as false. Run from the repository root:
+
+    python -m benchmarks.bench_entity_names [--repeat N]
+"""
+import argparse
+
+from benchmarks.bench_retriever import _report, _timed
+from tools.rag.entity_names import get_name_index, resolve_names
+from tools.rag.entity_store import structured_lookup
+from tools.rag.principalTool import _search_index, rag_tool
+
+
+# query -> (canonical name, title (file stem) of the page that answers it)
+QUERIES = {
+    "vestle trinkets": ("Vestal", "Vestal"),
+    "man at arms skills": ("Man-at-Arms", "Man-at-Arms"),
+    "manatarms camping": ("Man-at-Arms", "Man-at-Arms"),
+    "plague doc blinding gas": ("Plague Doctor", "Plague_Doctor"),
+    "bone defendor resistances": ("Bone Defender", "Bone_Defender"),
+    "arbalist stats": ("Arbalest", "Arbalest"),
+    "hellian barbaric yawp": ("Hellion", "Hellion"),
+    "crusador smite": ("Crusader", "Crusader"),
+    "grave rober": ("Grave Robber", "Grave_Robber"),
+    "houndmastr guard dog": ("Houndmaster", "Houndmaster"),
+    "occulist hands from the abyss": ("Occultist", "Occultist"),
+    "how do I beat the swine prnce": ("Swine Prince", "Swine_Prince"),
+    "brigand cutthroath": ("Brigand Cutthroat", "Brigand_Cutthroat"),
+    "what cleanses a sacrifical stone": ("Sacrificial Stone", "Curios"),
+    "the ancestor": ("The Ancestor", "The_Ancestor"),
+}
+
+# nothing in these should be "corrected" (exact names like Leper are fine)
+NEGATIVE = [
+    "does blight stack",
+    "how many stacks of bleed",
+    "which trinkets help the leper",
+    "is bleed better than blight",
+    "how do I lower stress in camp",
+    "which heroes are religious",
+    "what happens at low torch",
+    "when should I retreat from a fight",
+    "best team for the cove",
+    "how does the stagecoach work",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    index = get_name_index()
+    print(f"Name index: {len(index)} names\n")
+    cold, warm = [], []
+    for q in QUERIES:
+        def fresh():
+            index._cache.pop(q, None)
+            index.resolve(q)
+        cold += _timed(fresh, args.repeat)
+        warm += _timed(lambda: index.resolve(q), args.repeat)
+    _report("resolve", cold)
+    _report("memoized", warm)
+
+    search = _search_index("bm25")
+    resolved = plain_hits = rescued_hits = lookups = 0
+    for q, (name, title) in QUERIES.items():
+        names = resolve_names(q)
+        resolved += any(m.name == name for m in names)
+        plain = [p.stem for p, _, _ in search.search(q, top=3)]
+        rescued = [r["meta"].get("title") for r in rag_tool(q)["results"]][:3]
+        plain_hits += title in plain
+        rescued_hits += title in rescued
+        lookups += bool(structured_lookup(q)["matches"])
+        print(f"  {q:<36} -> {', '.join(m.name for m in names) or '-':<28} bm25 {'hit' if title in plain else 'miss':<5}"
+              f"rag_tool {'hit' if title in rescued else 'miss'}")
+    n = len(QUERIES)
+    print(f"\nresolved to the expected name: {resolved}/{n}")
+    print(f"top-3 hit, bm25 alone: {plain_hits}/{n}; rag_tool with resolution: {rescued_hits}/{n}")
+    print(f"structured_lookup records found: {lookups}/{n}")
+
+    false = 0
+    for q in NEGATIVE:
+        corrected = [m for m in resolve_names(q) if m.corrected]
+        false += bool(corrected)
+        print(f"  {q:<36} -> {', '.join(f'{m.text!r} as {m.name}' for m in corrected) or 'no correction'}")
+    print(f"\nnegative controls corrected (false positives): {false}/{len(NEGATIVE)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Compare the lxml single-pass extractor with the former BeautifulSoup ones.
+
+Pages come from ``--html DIR`` (saved wiki pages, ``*.html``) or, by
+default, are rebuilt from the scraped corpus as MediaWiki-style markup:
+headings, linked paragraphs, footnotes, an infobox table, interaction
+wikitables, scripts and navigation. The run also reports how many pages
+come out identical to the old extractors' output. Run from the repository
+root:
+
+    python -m benchmarks.bench_html_extract [--html DIR] [--pages 40] [--repeat 3]
+"""
+from html import escape, unescape
+from pathlib import Path
+import argparse
+import re
+import statistics
+
+from bs4 import BeautifulSoup
+
+from benchmarks.bench_retriever import _report, _timed
+from tools.rag.chunker import TABLE_MARKER, parse_contents
+from tools.rag.file_loader import load_corpus
+from tools.wiki_extract import extract_page, main_text, scraper_text
+
+
+def bs4_extract_text(html: str) -> str:
+    """`dd_wiki_tool.extract_text` before the shared extractor."""
+    soup = BeautifulSoup(html, "lxml")
+    content = soup.select_one(".mw-parser-output")
+    tables_text = []
+    for table in content.find_all("table", class_="wikitable"):
+        header = " ".join([th.get_text(strip=True) for th in table.find_all("th")])
+        if any(kw in header for kw in ["Curio", "Trinket", "Quirk", "Chance", "Cleansing", "Effect"]):
+            tables_text.append("\n=== TABLA DE INTERACCIONES ===\n")
+            for row in table.find_all("tr"):
+                cols = row.find_all(["td", "th"])
+                if not cols:
+                    continue
+                row_parts = []
+                for col in cols:
+                    col_text = col.get_text(strip=True)
+                    icons = [img.get("alt", "") or img.get("title", "") for img in col.find_all("img") if img.get("alt")]
+                    if icons:
+                        col_text = f"[Íconos: {', '.join(icons)}] {col_text}"
+                    row_parts.append(col_text)
+                tables_text.append(" | ".join(row_parts))
+            tables_text.append("\n")
+            table.decompose()
+    for tag in content.find_all(["script", "style", "nav", "aside", "sup"]):
+        tag.decompose()
+    text = content.get_text(separator="\n\n", strip=True)
+    text = unescape(text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return "\n\n".join([text[:40000]] + tables_text)
+
+
+def bs4_main_content(html_text: str, max_chars: int = 20000) -> str:
+    """`webSearch.principalTool.extract_main_content` before the shared extractor."""
+    soup = BeautifulSoup(html_text, "lxml")
+    content = soup.select_one(".mw-parser-output") or soup.find("main") or soup.body
+    for tag in content.find_all(["script", "style", "noscript", "table", "aside", "nav"]):
+        tag.decompose()
+    text = content.get_text(separator="\n\n", strip=True)
+    text = unescape(text)
+    text = re.sub(r"\r?\n\s*\n", "\n\n", text)
+    text = re.sub(r"\s+", " ", text)
+    return text[:max_chars].strip()
+
+
+def _linked(words: list[str]) -> str:
+    # wiki prose links roughly every eighth word
+    return " ".join(f'<a href="/wiki/{escape(w)}" title="{escape(w)}">{escape(w)}</a>' if i % 8 == 3 else escape(w)
+                    for i, w in enumerate(words))
+
+
+def page_html(text: str) -> str:
+    """Wiki-like HTML for a scraped file's body and interaction tables."""
+    body, _, tables = text.partition("\n\n" + "\n" + TABLE_MARKER)
+    body = body.split("=" * 80, 1)[-1].strip()
+    tables = (TABLE_MARKER + tables) if tables else ""
+    headings = [h for _, h in parse_contents(body)[0]]
+    parts = ['<html><head><script>var wg = {"page": 1};</script><style>.x{}</style></head><body>',
+             '<nav><a href="/">Home</a> <a href="/wiki/Heroes">Heroes</a></nav>',
+             '<div id="content"><div class="mw-parser-output">',
+             '<table class="infobox"><tr><th>Type</th><td>Page</td></tr><tr><th>Game</th><td>Darkest Dungeon</td></tr></table>']
+    words = body.split()
+    chunk = []
+    for w in words:
+        chunk.append(w)
+        if len(chunk) >= 60:
+            parts.append(f"<p>{_linked(chunk)}<sup>[1]</sup></p>\n")
+            chunk = []
+        if headings and w == headings[0].split()[-1]:
+            parts.append(f"<p>{_linked(chunk)}</p>\n<h2><span class=\"mw-headline\">{escape(headings.pop(0))}</span></h2>\n")
+            chunk = []
+    parts.append(f"<p>{_linked(chunk)}</p>")
+    for block in tables.split(TABLE_MARKER)[1:]:
+        rows = [r for r in block.strip().split("\n\n") if r.strip()]
+        parts.append('<table class="wikitable"><tbody>')
+        for i, row in enumerate(rows):
+            cell = "th" if i == 0 else "td"
+            parts.append("<tr>" + "".join(f"<{cell}>{escape(c.strip())}</{cell}>" for c in row.split(" | ")) + "</tr>")
+        parts.append("</tbody></table>")
+    parts.append('<aside>Related pages</aside></div></div><script>track();</script></body></html>')
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--html", type=Path, help="directory of saved wiki pages (*.html)")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.html:
+        pages = [p.read_text(encoding="utf-8") for p in sorted(args.html.glob("*.html"))][:args.pages]
+    else:
+        docs = sorted(load_corpus().docs.items(), key=lambda kv: len(kv[1]), reverse=True)[:args.pages]
+        pages = [page_html(text) for _, text in docs]
+    print(f"{len(pages)} pages, {statistics.mean(len(p) for p in pages) / 1024:.0f} KiB of HTML on average\n")
+
+    scraper_same = sum(bs4_extract_text(h) == scraper_text(extract_page(h)) for h in pages)
+    # web_search now drops <sup> footnote markers like the scraper always did
+    web_same = sum(bs4_main_content(re.sub(r"<sup\b.*?</sup>", "", h, flags=re.S)) == main_text(h) for h in pages)
+    print(f"identical output: scraper {scraper_same}/{len(pages)}, web_search {web_same}/{len(pages)} (footnotes aside)\n")
+
+    def run(fn):
+        samples = []
+        for h in pages:
+            samples += _timed(lambda: fn(h), args.repeat)
+        return samples
+
+    old_scraper, old_web = run(bs4_extract_text), run(bs4_main_content)
+    new_scraper, new_web = run(lambda h: scraper_text(extract_page(h))), run(main_text)
+    _report("bs4 scrape", old_scraper)
+    _report("lxml scrape", new_scraper)
+    _report("bs4 web", old_web)
+    _report("lxml web", new_web)
+    print(f"\nspeedup: scraper x{statistics.mean(old_scraper) / statistics.mean(new_scraper):.1f}, "
+          f"web_search x{statistics.mean(old_web) / statistics.mean(new_web):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Latency of the screenshot tool: preprocessing, warm CPU inference, micro-batching, cache.
+
+Screenshots come from ``--images DIR`` (saved combat screenshots, png/jpg)
+or are drawn synthetically at 1920x1080 (four heroes, four enemies, HP
+and stress bars). Inference needs detector weights: the configured
+``IMAGE_DETECTOR_WEIGHTS`` or ``--weights``. For latency alone, stock
+``yolov8n.pt`` works (ultralytics downloads it). Without weights or
+ultralytics only the preprocessing is measured and the script exits 1.
+Run from the repository root:
+
+    python -m benchmarks.bench_image_tool [--images DIR] [--weights yolov8n.pt] [--clients 8] [--repeat 3]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.bench_retriever import _percentile, _report, _timed
+
+
+def synthetic_screenshot(seed: int) -> bytes:
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    img = (rng.random((1080, 1920, 3)) * 40).astype(np.uint8)
+    for side, xs in (("party", (840, 640, 440, 240)), ("enemies", (1000, 1200, 1400, 1600))):
+        for x in xs:
+            color = tuple(int(c) for c in rng.integers(60, 200, 3))
+            cv2.rectangle(img, (x, 420), (x + 150, 760), color, -1)
+            hp = rng.uniform(0.1, 1.0)
+            cv2.rectangle(img, (x + 10, 770), (x + 10 + int(130 * hp), 782), (0, 0, 220), -1)
+            if side == "party":
+                cv2.rectangle(img, (x + 10, 788), (x + 10 + int(13 * rng.integers(0, 10)), 800), (255, 255, 255), -1)
+    ok, buf = cv2.imencode(".png", img)
+    return buf.tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=Path, help="directory of saved screenshots")
+    parser.add_argument("--weights", help="detector weights (default: IMAGE_DETECTOR_WEIGHTS)")
+    parser.add_argument("--count", type=int, default=16, help="synthetic screenshots to draw")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.weights:
+        os.environ["IMAGE_DETECTOR_WEIGHTS"] = args.weights
+
+    from tools.imageDetection import detector as det
+    from tools.imageDetection import infoDetectionTool as tool
+
+    if args.images:
+        shots = [p.read_bytes() for p in sorted(args.images.iterdir()) if p.suffix.lower() in (".png", ".jpg", ".jpeg")]
+    else:
+        shots = [synthetic_screenshot(i) for i in range(args.count)]
+    print(f"{len(shots)} screenshots, {statistics.mean(len(s) for s in shots) / 1024:.0f} KiB on average\n")
+
+    prep = []
+    for data in shots:
+        prep += _timed(lambda: tool._combat_band(tool._decode(data)), args.repeat)
+    _report("decode+crop", prep)
+
+    t0 = time.perf_counter()
+    try:
+        warm = det.get_detector().warm_up()
+    except det.DetectorUnavailable as e:
+        print(f"\ninference not measured: {e}")
+        return 1
+    print(f"model load + warm inference: {warm}, {(time.perf_counter() - t0) * 1000:.0f} ms\n")
+
+    def uncached(data):
+        tool._results.clear()
+        tool.read_party_state(data)
+
+    sequential = []
+    for data in shots:
+        sequential += _timed(lambda: uncached(data), args.repeat)
+    _report("sequential", sequential)
+
+    for max_batch in (1, det.get_detector().batcher.max_batch):
+        detector = det.get_detector()
+        detector.batcher = det.MicroBatcher(detector._predict, max_batch=max_batch, max_wait=detector.batcher.max_wait)
+        tool._results.clear()
+        samples = []
+
+        def one(data):
+            t = time.perf_counter()
+            tool.read_party_state(data, key=f"{time.perf_counter_ns()}")
+            samples.append((time.perf_counter() - t) * 1000)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            list(pool.map(one, shots * args.repeat))
+        wall = time.perf_counter() - t0
+        _report(f"batch<={max_batch}", samples)
+        print(f"{'':<10} {len(samples) / wall:.1f} screenshots/s with {args.clients} clients, "
+              f"batches: {detector.batcher.stats()}")
+
+    tool.read_party_state(shots[0])
+    hits = _timed(lambda: tool.read_party_state(shots[0]), 50)
+    _report("cache hit", hits)
+    print(f"\np95 uncached vs cached: {_percentile(sequential, 95):.1f} ms vs {_percentile(hits, 95):.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Compare the BM25 indexes against the original linear scorer.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_retriever [--repeat N]
+"""
+from pathlib import Path
+import argparse
+import statistics
+import time
+
+from tools.rag.disk_index import DiskIndex, build_index, default_index_dir
+from tools.rag.file_loader import load_corpus
+from tools.rag.retriever import InvertedIndex, retrieve_linear
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+QUERIES = [
+    "crate",
+    "vestal trinkets",
+    "bone defender resistances",
+    "sacrificial stone cleanse",
+    "how do I stop my hero from panicking stress",
+    "plague doctor blinding gas",
+    "ancestor",
+    "holy water",
+    "swine prince",
+    "best trinkets for crusader in the ruins",
+]
+# bare entity names: short scraper metadata blocks used to win these
+NAME_QUERIES = ["vestal", "crusader", "hellion stats", "bone defender", "collector"]
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(pct / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _report(name, samples):
+    print(f"{name:<10} mean={statistics.mean(samples):8.3f} ms  p50={_percentile(samples, 50):8.3f} ms  p95={_percentile(samples, 95):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus.docs)} documents, {sum(len(t) for t in corpus.docs.values())} chars")
+
+    t0 = time.perf_counter()
+    index = InvertedIndex.build(corpus)
+    print(f"Index build: {(time.perf_counter() - t0) * 1000:.1f} ms, {len(index.chunks)} chunks, {len(index.postings)} terms\n")
+
+    index_dir = default_index_dir()
+    build_index(out_dir=index_dir)
+    t0 = time.perf_counter()
+    disk = DiskIndex(index_dir, ROOT / "wiki_menu_data")
+    print(f"Disk index open (mmap): {(time.perf_counter() - t0) * 1000:.1f} ms\n")
+
+    linear, indexed, mmapped = [], [], []
+    overlap = 0
+    for q in QUERIES:
+        linear += _timed(lambda: retrieve_linear(corpus, q), args.repeat)
+        indexed += _timed(lambda: index.search(q), args.repeat)
+        mmapped += _timed(lambda: disk.search(q), args.repeat)
+        a = {p for p, _, _ in retrieve_linear(corpus, q)}
+        b = {p for p, _, _ in index.search(q)}
+        overlap += len(a & b)
+
+    _report("linear", linear)
+    _report("bm25", indexed)
+    _report("bm25-mmap", mmapped)
+    print(f"\nspeedup (mean): {statistics.mean(linear) / statistics.mean(indexed):.1f}x")
+    print(f"top-3 document overlap with linear scorer: {overlap}/{3 * len(QUERIES)}")
+
+    # passages must be page content, never the TÍTULO/URL/... block
+    metadata = [(name, q) for q in QUERIES + NAME_QUERIES
+                for name, search in (("bm25", index.search), ("bm25-mmap", disk.search))
+                for _, snippet, _ in search(q) if "TÍTULO:" in snippet]
+    print(f"metadata passages returned: {len(metadata)}" + (f"  {metadata}" if metadata else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Import-time budget and warm-start timing for the serving modules.
+
+Each module is imported in a fresh interpreter under ``python -X importtime``.
+The report shows its cumulative import time, the heaviest imports under it,
+and any heavy optional dependency that was loaded eagerly instead of behind
+the tool that needs it. The exit status is 1 when a module is over
+``--budget-ms``, loads one of those dependencies or fails to import
+(``--allow-missing`` only reports import failures, e.g. when gradio is not
+installed). ``--warm`` also times
+`warmup.warm_start` (without the LLM check) in a fresh process. Run from the
+repository root:
+
+    python -m benchmarks.bench_startup [--budget-ms 1500] [--top 8] [--warm] [--allow-missing]
+"""
+from pathlib import Path
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+MODULES = [
+    "tools.rag.principalTool",
+    "tools.rag.entity_store",
+    "tools.webSearch.principalTool",
+    "answer_cache",
+    "conversation",
+    "router",
+    "warmup",
+    "agent",
+    "agent_pool",
+    "gradio_app",
+]
+DEFAULT_BUDGET_MS = 1500.0
+# larger budgets; dspy (with LiteLLM) and gradio dominate these
+BUDGETS_MS = {"agent": 4000.0, "agent_pool": 4000.0, "gradio_app": 7000.0}
+# must only be imported when a tool actually uses them
+LAZY = ("torch", "transformers", "llama_index", "sentence_transformers", "ultralytics", "mediapipe", "cv2", "lightning")
+
+
+def import_profile(module: str) -> dict:
+    """``-X importtime`` of ``module``: {"total_ms", "imports": [(name, depth, cumulative_ms)]} or {"error"}."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        try:
+            us = int(cumulative.strip())
+        except ValueError:
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, us / 1000))
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    # importtime lists children before their parent; keep the module's own subtree
+    # (interpreter start-up imports such as site come first at depth 0)
+    end = next(i for i, (name, depth, _) in enumerate(imports) if name == module and depth == 0)
+    start = end
+    while start > 0 and imports[start - 1][1] > 0:
+        start -= 1
+    return {"total_ms": imports[end][2], "imports": [(n, d - 1, ms) for n, d, ms in imports[start:end]]}
+
+
+def warm_start_ms() -> dict:
+    code = ("import json, time; t0 = time.perf_counter(); import warmup; r = warmup.warm_start(llm=False); "
+            "r['ms'] = (time.perf_counter() - t0) * 1000; print(json.dumps(r))")
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1]}
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report["process_ms"] = (time.perf_counter() - t0) * 1000
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help=f"import budget for every module (default {DEFAULT_BUDGET_MS:.0f}, more for agent/gradio_app)")
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports to list per module")
+    parser.add_argument("--warm", action="store_true", help="also time warmup.warm_start")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="report modules that fail to import instead of failing")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        profile = import_profile(module)
+        if "error" in profile:
+            print(f"{module:<32} {'unavailable' if args.allow_missing else 'IMPORT FAILED'}: {profile['error']}")
+            failed |= not args.allow_missing
+            continue
+        eager = sorted({name.split(".")[0] for name, _, _ in profile["imports"] if name.split(".")[0] in LAZY})
+        budget = args.budget_ms or BUDGETS_MS.get(module, DEFAULT_BUDGET_MS)
+        over = profile["total_ms"] > budget
+        failed |= over or bool(eager)
+        flag = "OVER BUDGET" if over else "ok"
+        print(f"{module:<32} {profile['total_ms']:8.1f} ms  {flag}" + (f"  eager heavy imports: {eager}" if eager else ""))
+        # heaviest top-level packages pulled in by this module
+        heaviest = sorted((i for i in profile["imports"] if i[1] == 0), key=lambda i: -i[2])
+        for name, _, ms in heaviest[:args.top]:
+            print(f"    {name:<40} {ms:8.1f} ms")
+
+    if args.warm:
+        report = warm_start_ms()
+        if "error" in report:
+            print(f"\nwarm start failed: {report['error']}")
+            failed = True
+        else:
+            print(f"\nwarm start: {report['ms']:.0f} ms in-process, {report['process_ms']:.0f} ms with interpreter start, "
+                  f"ready={report['ready']} degraded={report['degraded']}")
+            for name, check in report["checks"].items():
+                print(f"    {name:<24} {'ok' if check['ok'] else 'FAILED':<7} {check['ms']:8.1f} ms  "
+                      f"{check.get('error') or check.get('detail', '')}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
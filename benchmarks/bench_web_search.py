@@ -0,0 +1,87 @@
+"""Measure web_search fetch paths against a local stand-in for the wiki.
+
+A local HTTP server plays darkestdungeon.wiki.gg (ETag support included),
+so this needs no network. Run from the repository root:
+
+    python -m benchmarks.bench_web_search [--repeat N]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import os
+import tempfile
+import threading
+
+import requests
+
+from benchmarks.bench_retriever import _report, _timed
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+PAGE = ("<html><body><div class='mw-parser-output'>"
+        + "".join(f"<h2>Section {i}</h2><p>{'The crate holds supplies. ' * 40}</p>" for i in range(60))
+        + "</div></body></html>").encode("utf-8")
+
+
+class _WikiStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; avoid Nagle + delayed-ACK stalls on keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _WikiStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ["WEB_CACHE_PATH"] = str(Path(tempfile.mkdtemp()) / "web_pages.sqlite")
+
+    from tools.webSearch import principalTool as web
+
+    def per_call_session():
+        # what _fetch_url used to do: a new session per call, then parse
+        with requests.Session() as s:
+            web.extract_main_content(s.get(base + "/wiki/Crate", headers=web.HEADERS, timeout=10).text)
+
+    def pooled_no_cache():
+        web.extract_main_content(web._fetch_url("/wiki/Crate", base=base).text)
+
+    def cached():
+        web.fetch_page("/wiki/Crate", base=base)
+
+    def revalidated():
+        web._get_cache().ttl = 0
+        web.fetch_page("/wiki/Crate", base=base)
+
+    print(f"Page: {len(PAGE) / 1024:.0f} KiB of HTML\n")
+    _report("new-sess", _timed(per_call_session, args.repeat))
+    _report("pooled", _timed(pooled_no_cache, args.repeat))
+    cached()
+    _report("cache-hit", _timed(cached, args.repeat))
+    _report("304", _timed(revalidated, args.repeat))
+    print(f"\npage cache: {web._get_cache().stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Per-conversation state: token-budgeted history and a tool-result cache.
+
+A `Session` keeps the most recent turns verbatim and folds older ones into
+a running summary one turn at a time, so the history passed to the agent
+stays within ``budget`` tokens however long the chat gets. Tool calls made
+during the conversation are cached by (tool, normalized query), and
+retrieved snippets that were already returned earlier in the same
+trajectory (the router lookup, the ReAct loop or the fallbacks of one
+turn) are shortened to a pointer instead of being sent to the LLM again.
+Earlier turns reach the agent only as question/answer history, so a
+passage seen in one of them is returned in full.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import copy
+import hashlib
+import os
+import re
+import threading
+
+from answer_cache import normalize_question
+from tools.rag.qa_tool import estimate_tokens
+
+
+def _first_sentence(text: str, limit: int = 200) -> str:
+    text = " ".join(text.split())
+    m = re.search(r"(?<=[.!?])\s", text)
+    sentence = text[:m.start()] if m else text
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "..."
+
+
+class Session:
+    def __init__(self, session_id: str, budget: int = 1200, recent_turns: int = 3, summary_share: float = 0.4):
+        self.session_id = session_id
+        self.budget = budget
+        self.recent_turns = recent_turns
+        # share of the budget the summary of older turns may use
+        self.summary_share = summary_share
+        self.turns: List[Tuple[str, str]] = []
+        self.summary: List[str] = []
+        # every (question, answer) pair so far, to compare with the client's history
+        self.pairs: List[Tuple[str, str]] = []
+        self.tool_cache: Dict[Tuple[str, str], Any] = {}
+        # sha1 of snippet -> query that first returned it in the current trajectory
+        self.seen_snippets: Dict[str, str] = {}
+        self.tool_hits = 0
+        self.tool_misses = 0
+        self._lock = threading.Lock()
+
+    def key(self) -> str:
+        """Coalescing key: empty while the conversation has no history."""
+        return self.session_id if self.turns or self.summary else ""
+
+    def add_turn(self, question: str, answer: str):
+        with self._lock:
+            self.turns.append((question, answer))
+            self.pairs.append((question, answer))
+            self._compact()
+
+    def start_trajectory(self):
+        """Stop shortening snippets returned so far: the next tool calls feed a context that has not seen them."""
+        with self._lock:
+            self.seen_snippets.clear()
+
+    def record(self, question: str, result):
+        """End the turn; add it for an agent result (prediction or fallback dict) that has an answer."""
+        answer = result.get("answer") if isinstance(result, dict) else getattr(result, "answer", None)
+        self.start_trajectory()
+        if answer is not None:
+            self.add_turn(question, str(answer))
+
+    def sync(self, history: List[Tuple[str, str]]):
+        """Match the session to the (user, assistant) pairs a client sent.
+
+        An empty history means the user started a new chat, so the session is
+        cleared along with its tool cache. Any other history that differs
+        from the stored turns (a restart, a retried or undone turn) replaces
+        them; cached tool results do not depend on the history and are kept.
+        """
+        history = [(str(q), str(a)) for q, a in history]
+        with self._lock:
+            if history == self.pairs:
+                return
+            self.turns, self.summary, self.pairs = [], [], []
+            self.seen_snippets.clear()
+            if not history:
+                self.tool_cache.clear()
+            for question, answer in history:
+                self.turns.append((question, answer))
+                self.pairs.append((question, answer))
+            self._compact()
+
+    def _turn_text(self, question: str, answer: str) -> str:
+        return f"User: {question}\nAdvisor: {answer}"
+
+    def _compact(self):
+        """Fold the oldest turns into the summary until the recent ones fit the budget."""
+        def recent_cost():
+            return sum(estimate_tokens(self._turn_text(q, a)) for q, a in self.turns)
+
+        while self.turns and (len(self.turns) > self.recent_turns or recent_cost() > self.budget * (1 - self.summary_share)):
+            if len(self.turns) == 1:
+                break
+            question, answer = self.turns.pop(0)
+            self.summary.append(f"- Asked: {_first_sentence(question)} Advised: {_first_sentence(answer)}")
+        while self.summary and estimate_tokens("\n".join(self.summary)) > self.budget * self.summary_share:
+            self.summary.pop(0)
+
+    def context(self) -> str:
+        """History block for the agent's ``history`` input (empty for a new conversation)."""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append("Earlier in this conversation:\n" + "\n".join(self.summary))
+            recent = [self._turn_text(q, a) for q, a in self.turns]
+            used = estimate_tokens("\n\n".join(parts))
+            kept = []
+            for turn in reversed(recent):
+                remaining = self.budget - used
+                if estimate_tokens(turn) > remaining:
+                    if not kept and remaining > 0:
+                        # the last turn alone is over budget; keep its tail
+                        kept.append("..." + turn[-remaining * 4:])
+                    break
+                kept.append(turn)
+                used += estimate_tokens(turn)
+            parts.extend(reversed(kept))
+            return "\n\n".join(p for p in parts if p)
+
+    def call_tool(self, name: str, fn, query: str):
+        """``fn(query)`` through the session cache, with snippets already seen in this trajectory shortened."""
+        key = (name, normalize_question(str(query)))
+        with self._lock:
+            if key in self.tool_cache:
+                self.tool_hits += 1
+                return self._dedupe(self.tool_cache[key], str(query))
+        out = fn(query)
+        with self._lock:
+            self.tool_misses += 1
+            # cache the full result; shortening depends on what the current trajectory has seen
+            self.tool_cache[key] = out
+            return self._dedupe(out, str(query))
+
+    def prime(self, name: str, query: str, out):
+        """Store a tool result computed elsewhere (e.g. in a retrieval worker) as if `call_tool` had run."""
+        with self._lock:
+            self.tool_cache[(name, normalize_question(str(query)))] = out
+
+    def _seen(self, text: str, query: str) -> str | None:
+        """Query that first returned ``text`` in this trajectory, or None (and remember it)."""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if digest in self.seen_snippets:
+            return self.seen_snippets[digest]
+        self.seen_snippets[digest] = query
+        return None
+
+    def _dedupe(self, out, query: str):
+        if not isinstance(out, dict):
+            return out
+        if isinstance(out.get("answer"), str) and "\n\n[1] " in out["answer"]:
+            # packed rag_tool observation: "Query: ...\n\n[1] path (score)\ntext\n\n[2] ..."
+            blocks = out["answer"].split("\n\n[")
+            for i in range(1, len(blocks)):
+                header, _, body = blocks[i].partition("\n")
+                earlier = self._seen(body, query)
+                if earlier is not None:
+                    blocks[i] = f"{header}\n(same passage as returned earlier for '{earlier}')"
+            return dict(out, answer="\n\n[".join(blocks))
+        if not isinstance(out.get("results"), list):
+            return out
+        out = copy.copy(out)
+        results = []
+        for r in out["results"]:
+            snippet = r.get("snippet") if isinstance(r, dict) else None
+            if not snippet:
+                results.append(r)
+                continue
+            earlier = self._seen(snippet, query)
+            if earlier is not None:
+                r = dict(r, snippet=f"{snippet[:160]}... (returned in full earlier for '{earlier}')")
+            results.append(r)
+        out["results"] = results
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "turns": len(self.turns),
+            "summarized_turns": len(self.summary),
+            "history_tokens": estimate_tokens(self.context()),
+            "tool_hits": self.tool_hits,
+            "tool_misses": self.tool_misses,
+        }
+
+
+class SessionStore:
+    """LRU map of session id -> `Session`."""
+
+    def __init__(self, max_sessions: int = 500, budget: int = 1200):
+        self.max_sessions = max_sessions
+        self.budget = budget
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Session:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(session_id, budget=self.budget)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return session
+
+
+def create_session_store() -> SessionStore:
+    """Store sized by ``MAX_SESSIONS`` (default 500) and ``HISTORY_TOKENS`` (default 1200)."""
+    return SessionStore(
+        max_sessions=int(os.getenv("MAX_SESSIONS", "500")),
+        budget=int(os.getenv("HISTORY_TOKENS", "1200")),
+    )
@@ -1,16 +1,41 @@
 import sqlite3
 import gradio as gr
 import os
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 
 from agent import create_agent
+from agent_pool import AgentPoolBusy, create_agent_pool
+from answer_cache import create_answer_cache
+from conversation import create_session_store
+from tools import tracing
+from tools.imageDetection.infoDetectionTool import register_screenshot, screenshot_reading_available
+import warmup
 
 
-try:
-    priorities_env = os.getenv("RAG_PRIORITIES")
-    priorities = priorities_env.split(",") if priorities_env else None
-    _agent = create_agent(priorities=priorities)
-except Exception as e:
-    print("[gradio_app] Warning: failed to create agent at import time:", e)
+_pool = None
+_cache = None
+_sessions = create_session_store()
+
+
+def startup():
+    """Create the agents and warm up before the server accepts traffic.
+
+    Failures are recorded in the readiness state rather than raised, so the
+    server still comes up and /readyz reports what is wrong.
+    """
+    global _pool, _cache
+    try:
+        priorities_env = os.getenv("RAG_PRIORITIES")
+        priorities = priorities_env.split(",") if priorities_env else None
+        _cache = create_answer_cache()
+        # one agent per worker, all sharing the answer cache
+        _pool = create_agent_pool(lambda: create_agent(priorities=priorities, cache=_cache))
+    except Exception as e:
+        print("[gradio_app] Failed to create the agents:", e)
+        warmup.fail("agents", e)
+    return warmup.warm_start(cache=_cache, llm=_pool is not None)
 
 
 def _extract_text_from_result(result) -> str:
@@ -36,24 +61,121 @@ def _extract_text_from_result(result) -> str:
     return str(result)
 
 
-def respond(message: str, history: list[tuple]):
+def _history_pairs(history: list) -> list[tuple[str, str]]:
+    """(user, assistant) pairs from gradio's "messages" history."""
+    pairs, question = [], None
+    for msg in history or []:
+        role, content = (msg.get("role"), msg.get("content")) if isinstance(msg, dict) else (None, None)
+        if role == "user" and isinstance(content, str):
+            # uploaded files come as separate user messages
+            question = content
+        elif role == "assistant" and question is not None:
+            pairs.append((question, str(content)))
+            question = None
+    return pairs
+
+
+def _question(message) -> str:
+    """Text of a multimodal message, with an id the agent can pass to screenshot_state per image."""
+    if isinstance(message, str):
+        return message
+    text = message.get("text") or ""
+    ids = []
+    for f in message.get("files") or []:
+        path = f.get("path") if isinstance(f, dict) else f
+        with open(path, "rb") as fh:
+            ids.append(register_screenshot(fh.read()))
+    if ids and not screenshot_reading_available():
+        text = (text or "What should I do in this fight?") + "\n[A screenshot was attached, but screenshot reading is not installed on this server.]"
+    elif ids:
+        text = (text or "What should I do in this fight?") + "\n" + " ".join(f"[Screenshot attached: {i}]" for i in ids)
+    return text
+
+
+async def respond(message, history: list, request: gr.Request = None):
+    """Stream tool progress and answer tokens into the chat as they arrive."""
+    message = _question(message)
     if not message:
-        return ""
+        yield ""
+        return
     print(f"[gradio_app] User: {message}")
-    #TODO: add support for history in agent calls 
-    if _agent is None:
-        bot_text = "Agent not available (failed to initialize). Check logs."
-        return bot_text
+    if _pool is None:
+        yield "Agent not available (failed to initialize). Check logs."
+        return
+
+    session = _sessions.get(getattr(request, "session_hash", None) or "default")
+    # after a restart the browser still has the chat; rebuild the session from it
+    session.sync(_history_pairs(history))
 
+    status_lines = []
+    answer = ""
+    result = None
     try:
-        result = _agent(question=message, initial_schema="")
+        async for kind, value in _pool.stream(message, initial_schema="", session=session):
+            if kind == "status":
+                status_lines.append(f"_{value}_")
+            elif kind == "token":
+                answer += value
+            else:
+                result = value
+            yield "\n".join(status_lines + ([answer] if answer else []))
+    except AgentPoolBusy:
+        print(f"[gradio_app] Rejected, pool full: {_pool.stats()}")
+        yield "The advisor is answering too many questions right now. Please try again in a moment."
+        return
     except Exception as e:
         result = e
 
     bot_text = _extract_text_from_result(result)
     print(f"[gradio_app] Bot: {bot_text}")
-    return bot_text
+    print(f"[gradio_app] Pool: {_pool.stats()} Session: {session.stats()}")
+    if _cache is not None:
+        print(f"[gradio_app] Answer cache: {_cache.stats()}")
+    yield bot_text
+
+
+def pipeline_stats() -> dict:
+    """Per-stage latency percentiles, bytes, tokens and cache outcomes since startup."""
+    return {
+        "stages": tracing.stats(),
+        "pool": _pool.stats() if _pool else {},
+        "answer_cache": _cache.stats() if _cache else {},
+        "readiness": warmup.readiness(),
+    }
+
+
+with gr.Blocks(title="PartyKeeper") as demo:
+    gr.ChatInterface(respond, type="messages", multimodal=True,
+                     textbox=gr.MultimodalTextbox(file_types=["image"], placeholder="Ask, or attach a combat screenshot"))
+    with gr.Accordion("Pipeline stats", open=False):
+        stats_view = gr.JSON()
+        # also served as the /stats API endpoint
+        gr.Button("Refresh").click(pipeline_stats, outputs=stats_view, api_name="stats")
+
+
+def main():
+    report = startup()
+    if not report["ready"] and os.getenv("WARM_START_STRICT", "0") == "1":
+        raise SystemExit(f"[gradio_app] Not ready: {report['checks']}")
+
+    app = FastAPI()
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    def readyz():
+        state = warmup.readiness()
+        return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+    # the pool does the limiting; let gradio hand it every request it may queue
+    workers = _pool.workers if _pool else 1
+    queue = _pool.max_queue if _pool else 0
+    demo.queue(max_size=workers + queue, default_concurrency_limit=workers + queue)
+    app = gr.mount_gradio_app(app, demo, path="/")
+    uvicorn.run(app, host=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"), port=int(os.getenv("GRADIO_SERVER_PORT", "7860")))
 
 
-demo = gr.ChatInterface(respond, type="messages")
-demo.launch()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
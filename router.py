@@ -0,0 +1,110 @@
+"""Keyword/entity pre-router that runs before the ReAct agent.
+
+Classifies a question as
+
+- ``greeting``: small talk, answered without any LLM call;
+- ``lookup``: names a known page (corpus titles from `Corpus.documents()`
+  metadata) or entity (trinket, curio, ...) and asks for facts about it;
+  answered from the retriever with a single LLM formatting call;
+- ``agent``: everything else (strategy, comparisons, follow-ups), which
+  gets the full multi-step agent.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+import re
+import threading
+import time
+
+from tools.rag.file_loader import get_corpus_store
+from tools.tracing import span
+
+
+_GREETING_RE = re.compile(
+    r"^(hi|hello|hey|hola|good (morning|evening|afternoon)|thanks|thank you|thx|ok|okay|bye|goodbye)\b[\s!.,]*"
+    r"(there|advisor|again|a lot|so much)?[\s!.]*$", re.IGNORECASE)
+# facts a single page or table row can answer
+_LOOKUP_RE = re.compile(
+    r"\b(what|which|who|where|list|show|tell me about|how (much|many)|stats?|hp|health|resist\w*|speed|dodge|"
+    r"prot(ection)?|damage|dmg|crit|skills?|abilit\w*|trinkets?|curios?|cleans\w*|drops?|loot|quirks?|effects?|"
+    r"weak\w*|immune|found|located|rarity|cost|price)\b", re.IGNORECASE)
+# open-ended planning that needs several tool calls and reasoning
+_STRATEGY_RE = re.compile(
+    r"\b(should i|should we|how (do|can|should) (i|we)|best|better|worse|vs\.?|versus|compare|strateg\w*|"
+    r"party|team|comp(osition)?|build|recommend\w*|advice|help me|plan|beat|survive|counter|why|if i|when i|"
+    r"instead|or)\b", re.IGNORECASE)
+
+
+def _normalize(s: str) -> str:
+    return " ".join(re.findall(r"\w+", s.lower().replace("_", " ")))
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    entities: List[str] = field(default_factory=list)
+    reason: str = ""
+    ms: float = 0.0
+
+
+class QuestionRouter:
+    def __init__(self, extra_names=None):
+        """``extra_names`` returns more entity names (e.g. from the entity store)."""
+        self.extra_names = extra_names
+        self._lock = threading.Lock()
+        self._generation = -1
+        self._titles: Set[str] = set()
+        self.counts: Dict[str, int] = {"greeting": 0, "lookup": 0, "agent": 0}
+
+    def _known_titles(self) -> Set[str]:
+        corpus = get_corpus_store().get()
+        with self._lock:
+            if corpus.generation != self._generation:
+                titles = {_normalize(meta.get("title", "")) for _, _, meta in corpus.documents()}
+                self._titles = {t for t in titles if t}
+                self._generation = corpus.generation
+            return self._titles
+
+    def entities(self, question: str) -> List[str]:
+        """Known titles/entity names appearing as whole words, longest first."""
+        q = f" {_normalize(question)} "
+        names = set(self._known_titles())
+        if self.extra_names is not None:
+            try:
+                names.update(_normalize(n) for n in self.extra_names(question))
+            except Exception as e:
+                print(f"[router] Entity names unavailable: {e}")
+        found = []
+        for name in sorted(names, key=len, reverse=True):
+            if name and f" {name} " in q:
+                found.append(name)
+                q = q.replace(f" {name} ", "  ")
+        return found
+
+    def route(self, question: str, history: str = "") -> RouteDecision:
+        t0 = time.perf_counter()
+        with span("router") as s:
+            decision = self._route(question.strip(), history)
+            s.set(route=decision.route, entities=len(decision.entities))
+        decision.ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.counts[decision.route] += 1
+        print(f"[router] route={decision.route} entities={decision.entities} reason={decision.reason!r} "
+              f"in {decision.ms:.1f} ms")
+        return decision
+
+    def _route(self, question: str, history: str) -> RouteDecision:
+        if _GREETING_RE.match(question):
+            return RouteDecision("greeting", reason="small talk")
+        if history:
+            # pronouns and ellipsis ("and her trinkets?") need the conversation
+            return RouteDecision("agent", reason="follow-up in a conversation")
+        if _STRATEGY_RE.search(question):
+            return RouteDecision("agent", reason="open-ended/strategy wording")
+        entities = self.entities(question)
+        if not entities:
+            return RouteDecision("agent", reason="no known entity")
+        if len(entities) > 2:
+            return RouteDecision("agent", entities, reason="too many entities for one lookup")
+        if len(question.split()) <= 4 or _LOOKUP_RE.search(question):
+            return RouteDecision("lookup", entities, reason="fact about a named entity")
+        return RouteDecision("agent", entities, reason="entity without lookup wording")
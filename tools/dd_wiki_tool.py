@@ -2,90 +2,97 @@ from __future__ import annotations
 import requests
 import urllib.parse
 import re
-from html import unescape
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import argparse
+import hashlib
+import json
 import os
+import sys
+import threading
 import time
-from bs4 import BeautifulSoup
+from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-BASE = "https://darkestdungeon.wiki.gg"
+if not __package__:
+    # run as ``python tools/dd_wiki_tool.py``: make the repository root importable
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tools.wiki_extract import extract_page, scraper_text
+
+BASE = os.getenv("WIKI_BASE", "https://darkestdungeon.wiki.gg")
 OUTPUT_DIR = "wiki_menu_data"
+# per-page record of the last scrape and the list of files the last run touched
+MANIFEST_NAME = ".manifest.json"
+CHANGES_NAME = ".changes.json"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def get_session():
+def get_session(pool_size: int = 10):
     session = requests.Session()
     retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
-    session.mount("https://", HTTPAdapter(max_retries=retries))
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
     session.headers.update({"User-Agent": "PartyKeeperBot/1.0"})
     return session
 
 session = get_session()
 
-def fetch_page(title: str) -> Dict:
-    safe_title = urllib.parse.quote(title.replace(" ", "_"))
-    url = f"{BASE}/wiki/{safe_title}"
+
+class RateLimiter:
+    """Spaces request starts at least ``1 / rate`` seconds apart across all threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def page_url(title: str) -> str:
+    return f"{BASE}/wiki/{urllib.parse.quote(title.replace(' ', '_'))}"
+
+def fetch_page(title: str, headers: Dict | None = None) -> Dict:
+    url = page_url(title)
     try:
-        resp = session.get(url, timeout=15)
+        resp = session.get(url, timeout=15, headers=headers)
+        if resp.status_code == 304:
+            return {"title": title, "url": url, "html": "", "success": True, "not_modified": True}
         resp.raise_for_status()
-        return {"title": title, "url": resp.url, "html": resp.text, "success": True}
+        return {"title": title, "url": resp.url, "html": resp.text, "success": True,
+                "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
     except:
         return {"title": title, "url": url, "html": "", "success": False}
 
 def extract_text(html: str) -> str:
     if not html:
         return "No se pudo cargar."
-    
-    soup = BeautifulSoup(html, "lxml")
-    content = soup.select_one(".mw-parser-output")
-    if not content:
+    page = extract_page(html)
+    if page is None:
         return "Contenido no encontrado."
-    
-    tables_text = []
-    for table in content.find_all("table", class_="wikitable"):
-        header = " ".join([th.get_text(strip=True) for th in table.find_all("th")])
-        if any(kw in header for kw in ["Curio", "Trinket", "Quirk", "Chance", "Cleansing", "Effect"]):
-            tables_text.append("\n=== TABLA DE INTERACCIONES ===\n")
-            for row in table.find_all("tr"):
-                cols = row.find_all(["td", "th"])
-                if not cols:
-                    continue
-                row_parts = []
-                for col in cols:
-                    col_text = col.get_text(strip=True)
-                    # Íconos
-                    icons = [img.get("alt", "") or img.get("title", "") for img in col.find_all("img") if img.get("alt")]
-                    if icons:
-                        col_text = f"[Íconos: {', '.join(icons)}] {col_text}"
-                    row_parts.append(col_text)
-                tables_text.append(" | ".join(row_parts))
-            tables_text.append("\n")
-            table.decompose() 
-    for tag in content.find_all(["script", "style", "nav", "aside", "sup"]):
-        tag.decompose()
-    
-    text = content.get_text(separator="\n\n", strip=True)
-    text = unescape(text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    
-    final = [text[:40000]]  
-    final.extend(tables_text)
-    return "\n\n".join(final)
+    return scraper_text(page)
 
-def save_file(category: str, title: str, text: str):
+def relative_path(category: str, title: str) -> str:
+    """Path of a page's file under OUTPUT_DIR ("heroes/Man-at-Arms.txt")."""
     safe_cat = re.sub(r'[^\w\-]', '_', category)
     safe_title = re.sub(r'[^\w\-]', '_', title)
-    dir_path = os.path.join(OUTPUT_DIR, safe_cat)
-    os.makedirs(dir_path, exist_ok=True)
-    
-    filename = f"{safe_title}.txt"
-    filepath = os.path.join(dir_path, filename)
+    return f"{safe_cat}/{safe_title}.txt"
+
+def save_file(category: str, title: str, text: str):
+    filepath = os.path.join(OUTPUT_DIR, *relative_path(category, title).split("/"))
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
     
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(f"TÍTULO: {title}\n")
-        f.write(f"URL: {BASE}/wiki/{urllib.parse.quote(title.replace(' ', '_'))}\n")
+        f.write(f"URL: {page_url(title)}\n")
         f.write(f"CATEGORÍA: {category}\n")
         f.write(f"FECHA: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
         f.write("=" * 80 + "\n\n")
@@ -134,7 +141,91 @@ DD1_PAGES = {
     ]
 }
 
-def main():
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(output_dir: str = OUTPUT_DIR) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f).get("pages", {})
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: str, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def _scrape_one(category: str, title: str, entry: Dict | None, limiter: RateLimiter, force: bool,
+                max_age: float) -> Dict:
+    rel = relative_path(category, title)
+    exists = os.path.exists(os.path.join(OUTPUT_DIR, *rel.split("/")))
+    if entry and exists and not force and time.time() - entry.get("fetched_at", 0) < max_age:
+        return {"status": "unchanged", "path": rel}
+    headers = {}
+    if entry and exists and not force:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    limiter.wait()
+    data = fetch_page(title, headers=headers or None)
+    if not data["success"]:
+        return {"status": "failed", "path": rel}
+    if data.get("not_modified"):
+        return {"status": "unchanged", "path": rel, "entry": dict(entry, fetched_at=time.time())}
+
+    text = extract_text(data["html"])
+    digest = text_hash(text)
+    new_entry = {"title": title, "category": category, "path": rel, "etag": data.get("etag"),
+                 "last_modified": data.get("last_modified"), "sha256": digest, "fetched_at": time.time()}
+    if exists and entry and entry.get("sha256") == digest and not force:
+        return {"status": "unchanged", "path": rel, "entry": new_entry}
+    save_file(category, title, text)
+    return {"status": "modified" if exists else "added", "path": rel, "entry": new_entry}
+
+def scrape(pages: Dict[str, List[str]] = DD1_PAGES, workers: int = 8, rate: float = 8.0, force: bool = False,
+           max_age: float = 0.0) -> Dict:
+    """Incrementally refresh OUTPUT_DIR with a bounded worker pool.
+
+    Requests go out through a shared ``RateLimiter`` (``rate`` per second)
+    and use the ETag/Last-Modified of the previous run; pages whose
+    extracted text did not change are not rewritten, so their mtime (and
+    every index keyed on it) stays valid. Pages checked less than
+    ``max_age`` seconds ago are not requested at all. The run is recorded in
+    ``.manifest.json`` (url -> etag, sha256, fetch time) and the touched
+    files in ``.changes.json`` for indexers.
+    """
+    manifest = load_manifest()
+    limiter = RateLimiter(rate)
+    jobs = [(category, title) for category, titles in pages.items() for title in titles]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dd-wiki") as pool:
+        results = list(pool.map(lambda job: _scrape_one(*job, manifest.get(page_url(job[1])), limiter, force, max_age), jobs))
+
+    changes = {"added": [], "modified": [], "unchanged": [], "failed": []}
+    for (category, title), result in zip(jobs, results):
+        changes[result["status"]].append(result["path"])
+        if "entry" in result:
+            manifest[page_url(title)] = result["entry"]
+    changes["finished_at"] = time.strftime('%Y-%m-%d %H:%M:%S')
+    changes["seconds"] = round(time.perf_counter() - t0, 2)
+
+    _write_json(os.path.join(OUTPUT_DIR, MANIFEST_NAME), {"version": 1, "pages": manifest})
+    _write_json(os.path.join(OUTPUT_DIR, CHANGES_NAME), changes)
+    return changes
+
+def load_changes(output_dir: str = OUTPUT_DIR) -> Dict:
+    """Change list of the last `scrape` run (empty lists when there is none)."""
+    try:
+        with open(os.path.join(output_dir, CHANGES_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"added": [], "modified": [], "unchanged": [], "failed": []}
+
+def main_sequential():
     print("🚀 EXTRAYENDO TODO DE DARKEST DUNGEON 1 (COMPLETO)\n")
     
     for category, pages in DD1_PAGES.items():
@@ -158,5 +249,25 @@ def main():
     print("   enemies/          ← Bone_Soldier.txt (ataques, loot), Swine_Wretch.txt, ... (~100)")
     print("   locations/        ← Ruins.txt (curios, enemigos), Weald.txt, ... (6)")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape the Darkest Dungeon wiki into wiki_menu_data.")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=8.0, help="max requests per second across all workers")
+    parser.add_argument("--max-age", type=float, default=0.0, help="skip pages checked less than this many seconds ago")
+    parser.add_argument("--force", action="store_true", help="re-download and rewrite every page")
+    parser.add_argument("--sequential", action="store_true", help="old one-page-at-a-time full rewrite")
+    args = parser.parse_args(argv)
+    if args.sequential:
+        return main_sequential()
+
+    print("🚀 EXTRAYENDO TODO DE DARKEST DUNGEON 1 (INCREMENTAL)\n")
+    changes = scrape(workers=args.workers, rate=args.rate, force=args.force, max_age=args.max_age)
+    for status in ("added", "modified", "failed"):
+        for rel in changes[status]:
+            print(f"  {status:<9} {rel}")
+    print(f"\n🎉 {len(changes['added'])} nuevas, {len(changes['modified'])} modificadas, "
+          f"{len(changes['unchanged'])} sin cambios, {len(changes['failed'])} fallidas en {changes['seconds']}s")
+    print(f"   Cambios en {os.path.join(OUTPUT_DIR, CHANGES_NAME)}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""CPU object detector kept warm in the process, with micro-batching.
+
+The YOLO model (ultralytics) is loaded once, on first use or by
+`Detector.warm_up`, and a dummy inference then runs so the first real request
+does not pay for graph setup. Concurrent `detect` calls are grouped by
+`MicroBatcher`: a request waits at most ``max_wait`` seconds for others to
+arrive, and up to ``max_batch`` crops go through one forward pass.
+
+The weights are not part of the repository; see `infoDetectionTool` for
+the class names they must use.
+"""
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_WEIGHTS = ROOT / "models" / "dd_screenshot.pt"
+
+
+class DetectorUnavailable(RuntimeError):
+    """Raised when the detector weights or ultralytics are missing."""
+
+
+@dataclass
+class Detection:
+    label: str
+    confidence: float
+    # x1, y1, x2, y2 in pixels of the crop that was detected on
+    box: Tuple[float, float, float, float]
+
+
+class MicroBatcher:
+    """Runs ``fn(items) -> results`` on batches of concurrently submitted items."""
+
+    def __init__(self, fn: Callable[[List], List], max_batch: int = 8, max_wait: float = 0.015, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[object, Future]]" = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        threading.Thread(target=self._loop, name=name, daemon=True).start()
+
+    def submit(self, item) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+
+class Detector:
+    def __init__(self, weights: Path, imgsz: int = 640, conf: float = 0.35, threads: int | None = None,
+                 max_batch: int = 8, max_wait: float = 0.015):
+        self.weights = Path(weights)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.threads = threads
+        self._model = None
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(self._predict, max_batch=max_batch, max_wait=max_wait, name="dd-detector")
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if not self.weights.exists():
+                    raise DetectorUnavailable(f"detector weights not found at {self.weights}")
+                try:
+                    import torch
+                    from ultralytics import YOLO
+                except ImportError as e:
+                    raise DetectorUnavailable(f"ultralytics is not installed ({e})") from e
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                model = YOLO(str(self.weights))
+                model.predict(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz,
+                              device="cpu", verbose=False)
+                self._model = model
+        return self._model
+
+    @property
+    def names(self) -> dict:
+        return self._load().names
+
+    def warm_up(self) -> dict:
+        t0 = time.perf_counter()
+        model = self._load()
+        return {"weights": self.weights.name, "classes": len(model.names), "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+    def _predict(self, crops: Sequence[np.ndarray]) -> List[List[Detection]]:
+        model = self._load()
+        results = model.predict(list(crops), imgsz=self.imgsz, conf=self.conf, device="cpu", verbose=False)
+        out = []
+        for r in results:
+            boxes = r.boxes
+            xyxy = boxes.xyxy.cpu().numpy()
+            confs = boxes.conf.cpu().numpy()
+            classes = boxes.cls.cpu().numpy().astype(int)
+            out.append([Detection(model.names[c], float(p), tuple(float(v) for v in box))
+                        for box, p, c in zip(xyxy, confs, classes)])
+        return out
+
+    def detect(self, crop: np.ndarray, timeout: float = 30.0) -> List[Detection]:
+        """Detections on one BGR crop; batched with concurrent calls."""
+        return self.batcher.submit(crop).result(timeout=timeout)
+
+
+_detector: Detector | None = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> Detector:
+    """Shared detector configured by ``IMAGE_DETECTOR_WEIGHTS``, ``IMAGE_SIZE``, ``IMAGE_THREADS``,
+    ``IMAGE_MAX_BATCH`` and ``IMAGE_BATCH_WAIT_MS``."""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            threads = os.getenv("IMAGE_THREADS")
+            _detector = Detector(
+                Path(os.getenv("IMAGE_DETECTOR_WEIGHTS") or DEFAULT_WEIGHTS),
+                imgsz=int(os.getenv("IMAGE_SIZE", "640")),
+                threads=int(threads) if threads else None,
+                max_batch=int(os.getenv("IMAGE_MAX_BATCH", "8")),
+                max_wait=float(os.getenv("IMAGE_BATCH_WAIT_MS", "15")) / 1000,
+            )
+        return _detector
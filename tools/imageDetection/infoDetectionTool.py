@@ -0,0 +1,214 @@
+"""Read the party and the enemy lineup from a Darkest Dungeon combat screenshot.
+
+Uploads are registered with `register_screenshot`, which returns an id
+(``img:<sha1 prefix>``) for the question text. The agent passes that id to
+`screenshot_state_tool`. A screenshot is decoded and downscaled to
+``MAX_WIDTH``. Only the combat band, where the characters and their bars
+are, goes to the shared detector (`detector.get_detector`), batched with
+other uploads. Detected heroes, identified by the hero pages in the corpus,
+get ranks 1-4 from the middle of the screen outwards. Everything else is
+an enemy, ranked left to right. HP and stress come from the fill of the
+bars under each character. Results are cached by image hash.
+
+Label contract: the detector's class names (``model.names``) are matched
+against the hero pages of the corpus. A hero class must be named after
+the hero's page title, the file stem in ``wiki_menu_data/heroes``:
+"Vestal", "Plague_Doctor", "Man-at-Arms", "Bounty_Hunter" (case and
+"_"/space are ignored). A hero class that matches no hero page is
+reported as an enemy. Enemy classes should likewise be enemy page titles
+("Bone_Soldier", "Brigand_Cutthroat"); they are returned as named, with
+spaces, so the agent can look them up. No weights ship with the
+repository. The agent only gets the tool when `screenshot_reading_available`.
+"""
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Tuple
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+from tools.imageDetection.detector import Detection, DetectorUnavailable, get_detector
+from tools.rag.file_loader import get_corpus_store
+from tools.tracing import span
+
+
+# screenshots are downscaled to this width before cropping
+MAX_WIDTH = 1280
+# rows of the screen with the characters and their bars (fractions of the height)
+BAND = (0.18, 0.82)
+# bars under a character: rows below its box, as fractions of the box height
+HP_BAR = (0.02, 0.08)
+STRESS_BAR = (0.08, 0.15)
+STRESS_PIPS = 10
+MAX_UPLOADS = 64
+MAX_RESULTS = 256
+
+SCREENSHOT_RE = re.compile(r"\bimg:[0-9a-f]{12}\b")
+
+_uploads: "OrderedDict[str, bytes]" = OrderedDict()
+_results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+cache_hits = 0
+cache_misses = 0
+
+
+def image_id(data: bytes) -> str:
+    return "img:" + hashlib.sha1(data).hexdigest()[:12]
+
+
+def register_screenshot(data: bytes) -> str:
+    """Keep an uploaded screenshot for the tool; returns its id for the question text."""
+    key = image_id(data)
+    with _lock:
+        _uploads[key] = data
+        _uploads.move_to_end(key)
+        while len(_uploads) > MAX_UPLOADS:
+            _uploads.popitem(last=False)
+    return key
+
+
+def screenshot_ids(text: str) -> List[str]:
+    return SCREENSHOT_RE.findall(text or "")
+
+
+def screenshot_reading_available() -> bool:
+    """Whether detector weights are installed (ultralytics itself is checked when they load)."""
+    return get_detector().weights.exists()
+
+
+def _decode(data: bytes) -> np.ndarray:
+    import cv2
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("not a readable image")
+    return img
+
+
+def _combat_band(img: np.ndarray) -> np.ndarray:
+    """Downscaled crop of the rows with the characters and their bars."""
+    import cv2
+
+    h, w = img.shape[:2]
+    if w > MAX_WIDTH:
+        img = cv2.resize(img, (MAX_WIDTH, round(h * MAX_WIDTH / w)), interpolation=cv2.INTER_AREA)
+        h, w = img.shape[:2]
+    return img[int(h * BAND[0]):int(h * BAND[1])]
+
+
+def _red(hsv: np.ndarray) -> np.ndarray:
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    return ((h < 10) | (h > 170)) & (s > 120) & (v > 80)
+
+
+def _white(hsv: np.ndarray) -> np.ndarray:
+    return (hsv[..., 1] < 60) & (hsv[..., 2] > 190)
+
+
+def _bar_fill(band: np.ndarray, box: Tuple[float, float, float, float], rows: Tuple[float, float], mask) -> float | None:
+    """Share of the bar's columns lit in ``mask`` colours (None when the bar is off the crop)."""
+    import cv2
+
+    x1, y1, x2, y2 = box
+    height, inset = y2 - y1, (x2 - x1) * 0.1
+    top, bottom = int(y2 + rows[0] * height), min(band.shape[0], int(y2 + rows[1] * height))
+    left, right = max(0, int(x1 + inset)), min(band.shape[1], int(x2 - inset))
+    if bottom <= top or right <= left:
+        return None
+    lit = mask(cv2.cvtColor(band[top:bottom, left:right], cv2.COLOR_BGR2HSV))
+    return round(float((lit.mean(axis=0) >= 0.3).mean()), 2)
+
+
+def _hero_names() -> Dict[str, str]:
+    """Normalized hero name -> display name, from the hero pages in the corpus."""
+    names = {}
+    for _, _, meta in get_corpus_store().get().documents():
+        if meta.get("category") == "heroes":
+            title = meta["title"].replace("_", " ")
+            names[title.lower()] = title
+    return names
+
+
+def _lineups(band: np.ndarray, detections: List[Detection]) -> Tuple[List[Dict], List[Dict]]:
+    heroes = _hero_names()
+    party, enemies = [], []
+    for d in detections:
+        name = d.label.replace("_", " ").strip()
+        (party if name.lower() in heroes else enemies).append((heroes.get(name.lower(), name), d))
+    # at most four per side; big enemies taking two ranks still count once
+    party = sorted(party, key=lambda p: -p[1].confidence)[:4]
+    enemies = sorted(enemies, key=lambda p: -p[1].confidence)[:4]
+    # heroes face right: rank 1 is the rightmost one; enemies' rank 1 is the leftmost
+    party.sort(key=lambda p: -(p[1].box[0] + p[1].box[2]))
+    enemies.sort(key=lambda p: p[1].box[0] + p[1].box[2])
+
+    def entry(rank, name, d, key, stress):
+        out = {"rank": rank, key: name, "confidence": round(d.confidence, 2),
+               "hp": _bar_fill(band, d.box, HP_BAR, _red)}
+        if stress:
+            fill = _bar_fill(band, d.box, STRESS_BAR, _white)
+            out["stress"] = None if fill is None else round(fill * STRESS_PIPS) * 10
+        return out
+
+    return ([entry(i, n, d, "hero", True) for i, (n, d) in enumerate(party, start=1)],
+            [entry(i, n, d, "enemy", False) for i, (n, d) in enumerate(enemies, start=1)])
+
+
+def _summary(party: List[Dict], enemies: List[Dict]) -> str:
+    def pct(v):
+        return "?" if v is None else f"~{round(v * 100)}%"
+
+    lines = ["Party (rank 1 to 4): " + ("; ".join(
+        f"{p['rank']}) {p['hero']} HP {pct(p['hp'])}, stress {'?' if p.get('stress') is None else p['stress']}"
+        for p in party) or "no heroes detected")]
+    lines.append("Enemies (rank 1 to 4): " + ("; ".join(
+        f"{e['rank']}) {e['enemy']} HP {pct(e['hp'])}" for e in enemies) or "no enemies detected"))
+    lines.append("HP and stress are read from the bars and approximate.")
+    return "\n".join(lines)
+
+
+def read_party_state(data: bytes, key: str | None = None) -> Dict[str, Any]:
+    """Structured party/enemy state of a screenshot (cached by image hash)."""
+    global cache_hits, cache_misses
+    key = key or image_id(data)
+    with _lock:
+        cached = _results.get(key)
+        if cached is not None:
+            cache_hits += 1
+            _results.move_to_end(key)
+            return cached
+        cache_misses += 1
+    t0 = time.perf_counter()
+    with span("image.read", bytes=len(data)) as s:
+        band = _combat_band(_decode(data))
+        detections = get_detector().detect(np.ascontiguousarray(band))
+        party, enemies = _lineups(band, detections)
+        s.set(detections=len(detections))
+    result = {"image": key, "party": party, "enemies": enemies, "answer": _summary(party, enemies),
+              "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    with _lock:
+        _results[key] = result
+        while len(_results) > MAX_RESULTS:
+            _results.popitem(last=False)
+    return result
+
+
+def screenshot_state_tool(image: str) -> Dict[str, Any]:
+    print(f"   [BEGIN Tool Action] Reading screenshot: {image} [END Tool Action]")
+    found = screenshot_ids(image)
+    key = found[0] if found else image.strip()
+    with _lock:
+        data = _uploads.get(key)
+    if data is None:
+        return {"image": image, "error": "unknown screenshot id; ask the user to attach the screenshot again"}
+    try:
+        return read_party_state(data, key)
+    except DetectorUnavailable as e:
+        return {"image": key, "error": f"screenshot reading is not available: {e}"}
+    except FutureTimeout:
+        return {"image": key, "error": "screenshot reading timed out; the detector is busy, try again shortly"}
+    except ValueError as e:
+        return {"image": key, "error": str(e)}
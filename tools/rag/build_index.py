@@ -0,0 +1,49 @@
+"""Build (or check) the on-disk retrieval index and entity database for ``wiki_menu_data``.
+
+    python -m tools.rag.build_index [--root DIR] [--out DIR] [--check]
+"""
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+
+from .disk_index import build_index, default_index_dir, manifest_matches
+from .entity_store import build_entity_store
+from .file_loader import _default_root
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the on-disk BM25 index used by rag_tool and the structured_lookup entity database.")
+    parser.add_argument("--root", type=Path, default=None, help="repository root containing wiki_menu_data")
+    parser.add_argument("--out", type=Path, default=None, help="index directory (default: $RAG_INDEX_DIR or <root>/.rag_index)")
+    parser.add_argument("--check", action="store_true", help="only report whether the existing index is up to date")
+    args = parser.parse_args(argv)
+
+    root = (args.root or _default_root()).resolve()
+    out = args.out or default_index_dir(root)
+
+    if args.check:
+        manifest_path = out / "manifest.json"
+        ok = manifest_path.exists() and manifest_matches(json.loads(manifest_path.read_text(encoding="utf-8")), root / "wiki_menu_data")
+        print(f"{out}: {'up to date' if ok else 'missing or stale'}")
+        return 0 if ok else 1
+
+    t0 = time.perf_counter()
+    manifest = build_index(root, out)
+    size = sum(p.stat().st_size for p in out.iterdir() if p.is_file())
+    print(f"Indexed {len(manifest['files'])} files, {manifest['chunks']} chunks, {manifest['terms']} terms "
+          f"in {time.perf_counter() - t0:.2f}s -> {out} ({size / 1024:.0f} KiB)")
+    if manifest.get("compaction"):
+        c = manifest["compaction"]
+        print(f"Compaction: {c['bytes_saved']} of {c['bytes_before']} bytes and ~{c['tokens_saved']} tokens not indexed "
+              f"({c['boilerplate_runs']} boilerplate runs, {c['duplicate_rows']} duplicate rows)")
+
+    t0 = time.perf_counter()
+    count = build_entity_store(root, out / "entities.sqlite")
+    print(f"Stored {count} entity records in {time.perf_counter() - t0:.2f}s -> {out / 'entities.sqlite'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
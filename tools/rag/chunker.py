@@ -0,0 +1,255 @@
+"""Split scraped wiki files into addressable chunks.
+
+`dd_wiki_tool.extract_text` writes each page as a header block, one long
+whitespace-collapsed body line and then the ``=== TABLA DE INTERACCIONES ===``
+tables, one row per paragraph. This module recovers the structure:
+
+- the body is cut at the headings listed in the page's "Contents" block
+  (``1 Combat Skills 1.1 Notes 2 Camping Skills ...``), and hero combat
+  skills are further cut per skill ("Dazzling Light # Range ...");
+- every table row becomes its own chunk that knows its column names.
+
+Chunks are character spans into the original text, so indexes can keep
+offsets instead of copies, and every chunk carries a section path such as
+``Vestal > Combat Skills > Dazzling Light``.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+import re
+
+# ~300 tokens; also keeps chunks under the 512-token limit of embedding models
+MAX_CHUNK_CHARS = 1200
+TABLE_MARKER = "=== TABLA DE INTERACCIONES ==="
+
+_HEADER_RULE = "=" * 80
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)*")
+_SKILL_RE = re.compile(r"(?:(?<=Sound )|(?<=Guild ))([A-Z][^#]{1,40}?) # (?:Range|Rank) ")
+_ICONS_RE = re.compile(r"\[Íconos: [^\]]*\]\s*")
+
+
+def paragraph_spans(content: str) -> List[Tuple[int, int]]:
+    """Return (start, end) character offsets of the non-empty paragraphs.
+
+    Paragraphs are separated by blank lines; when a document has none, each
+    non-empty line is a paragraph. Offsets point at the stripped text.
+    """
+    spans = []
+    pos = 0
+    for block in content.split("\n\n"):
+        stripped = block.strip()
+        if stripped:
+            start = pos + block.index(stripped)
+            spans.append((start, start + len(stripped)))
+        pos += len(block) + 2
+    if spans:
+        return spans
+
+    pos = 0
+    for line in content.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped:
+            start = pos + line.index(stripped)
+            spans.append((start, start + len(stripped)))
+        pos += len(line)
+    return spans
+
+
+@dataclass(frozen=True)
+class Chunk:
+    start: int
+    end: int
+    # e.g. "Vestal > Combat Skills > Dazzling Light"
+    section: str
+    # "header", "text" or "row"; header chunks (the scraper's TÍTULO/URL/... block)
+    # are not indexed: the title already starts every section path
+    kind: str = "text"
+    # column names of the table a "row" chunk belongs to
+    columns: Tuple[str, ...] = ()
+    # BM25 token length to index with; compaction sets it on short pieces
+    # cut out of a longer chunk (0: the chunk's own length)
+    length: int = 0
+
+    def raw(self, text: str) -> str:
+        return text[self.start:self.end]
+
+    def cells(self, text: str) -> List[str]:
+        """Raw cells of a table row, including empty ones."""
+        # pad so empty leading/trailing cells ("| x", "x |") still split
+        return [c.strip() for c in f" {self.raw(text)} ".split(" | ")]
+
+    def fields(self, text: str) -> Dict[str, str]:
+        """Column name -> cell text for table rows (empty for other chunks)."""
+        if self.kind != "row":
+            return {}
+        cells = self.cells(text)
+        return {col or f"col{i + 1}": cell for i, (col, cell) in enumerate(zip(self.columns, cells)) if cell}
+
+    def render(self, text: str) -> str:
+        """Chunk text prefixed with its section path; rows as ``column: value`` pairs."""
+        if self.kind == "row" and self.columns:
+            body = "; ".join(f"{k}: {v}" for k, v in self.fields(text).items())
+        else:
+            body = self.raw(text)
+        return f"[{self.section}] {body}"
+
+
+def document_title(path: Path) -> str:
+    """Page title used at the root of section paths ("Bone_Defender.txt" -> "Bone Defender")."""
+    return Path(path).stem.replace("_", " ")
+
+
+def row_label(cell: str) -> str:
+    """First cell of a table row without the icon annotations."""
+    return _ICONS_RE.sub("", cell).strip()
+
+
+def _successors(number: str) -> List[str]:
+    parts = number.split(".")
+    out = [number + ".1"]
+    for i in range(len(parts), 0, -1):
+        out.append(".".join(parts[:i - 1] + [str(int(parts[i - 1]) + 1)]))
+    return out
+
+
+def parse_contents(body: str) -> Tuple[List[Tuple[str, str]], int]:
+    """Parse the "Contents 1 Foo 1.1 Bar 2 Baz" block of a page body.
+
+    Returns ``([(number, title), ...], end offset of the block)``; the list is
+    empty when the page has no table of contents.
+    """
+    m = re.search(r"\bContents 1 ", body)
+    if not m:
+        return [], 0
+    words = [(w.group(), w.start()) for w in re.finditer(r"\S+", body[m.start() + len("Contents "):])]
+    base = m.start() + len("Contents ")
+    entries: List[Tuple[str, str]] = []
+    number, title, expected = "1", [], ["1"]
+    i = 0
+    while i < len(words):
+        word, pos = words[i]
+        if not title and word in expected and _NUMBER_RE.fullmatch(word):
+            number, expected = word, _successors(word)
+            i += 1
+            continue
+        if title and word in expected:
+            entries.append((number, " ".join(title)))
+            title = []
+            continue
+        if title and entries and body.startswith(entries[0][1] + " ", base + pos):
+            entries.append((number, " ".join(title)))
+            return entries, base + pos
+        if len(title) >= 8:
+            break
+        title.append(word)
+        i += 1
+    if title:
+        entries.append((number, " ".join(title)))
+    return entries, len(body)
+
+
+def _windows(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """Cut [start, end) into pieces of at most ``max_chars``, preferring sentence ends."""
+    out = []
+    while end - start > max_chars:
+        limit = start + max_chars
+        cut = max(text.rfind(". ", start, limit), text.rfind("„ ", start, limit))
+        if cut <= start + max_chars // 2:
+            cut = text.rfind(" ", start, limit)
+        if cut <= start:
+            cut = limit
+        else:
+            cut += 1
+        out.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        out.append((start, end))
+    return out
+
+
+def _body_sections(text: str, start: int, end: int, title: str) -> List[Tuple[int, int, str]]:
+    """Split one body paragraph into (start, end, section path) at its headings."""
+    body = text[start:end]
+    entries, toc_end = parse_contents(body)
+    if not entries:
+        return [(start, end, title)]
+
+    bounds = []
+    pos = toc_end
+    for number, heading in entries:
+        found = body.find(heading, pos)
+        if found < 0:
+            continue
+        bounds.append((found, number, heading))
+        pos = found + len(heading)
+
+    sections = []
+    if bounds and bounds[0][0] > 0:
+        sections.append((start, start + bounds[0][0], title))
+    path: Dict[int, str] = {}
+    for i, (found, number, heading) in enumerate(bounds):
+        depth = number.count(".")
+        path = {d: h for d, h in path.items() if d < depth}
+        path[depth] = heading
+        stop = bounds[i + 1][0] if i + 1 < len(bounds) else len(body)
+        section = " > ".join([title] + [path[d] for d in sorted(path)])
+        sections.extend(_skill_sections(text, start + found, start + stop, section))
+    return sections
+
+
+def _skill_sections(text: str, start: int, end: int, section: str) -> List[Tuple[int, int, str]]:
+    if not section.endswith("Combat Skills") and not section.endswith("Abilities"):
+        return [(start, end, section)]
+    out = []
+    prev, prev_name = start, None
+    for m in _SKILL_RE.finditer(text, start, end):
+        if m.start() > prev:
+            out.append((prev, m.start(), f"{section} > {prev_name}" if prev_name else section))
+        prev, prev_name = m.start(), m.group(1).strip()
+    out.append((prev, end, f"{section} > {prev_name}" if prev_name else section))
+    return out
+
+
+def chunk_document(text: str, title: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Chunk]:
+    """Split a scraped wiki file into `Chunk` objects ordered by offset."""
+    chunks: List[Chunk] = []
+    offset = 0
+    rule = text.find(_HEADER_RULE)
+    if text.startswith("TÍTULO:") and rule >= 0:
+        header_end = len(text[:rule].rstrip())
+        chunks.append(Chunk(0, header_end, title, "header"))
+        offset = rule + len(_HEADER_RULE)
+
+    table = 0
+    columns: Tuple[str, ...] | None = None
+    caption = ""
+    rows = 0
+    for start, end in paragraph_spans(text[offset:]):
+        start, end = start + offset, end + offset
+        para = text[start:end]
+        if para == TABLE_MARKER:
+            table += 1
+            columns, caption, rows = None, "", 0
+            continue
+        if table:
+            cells = tuple(row_label(c) for c in para.split(" | "))
+            if columns is None:
+                # first row of every table is its header
+                columns = cells
+                continue
+            if not rows and not caption and len(columns) == 1 and len(cells) > 1:
+                # single-cell first row was a caption ("Curios found within theRuins")
+                caption, columns = columns[0], cells
+                continue
+            rows += 1
+            label = cells[0] or next((c for c in cells if c), "")
+            section = f"{title} > {caption or f'Table {table}'} > {label}"[:200]
+            for s, e in _windows(text, start, end, max_chars):
+                chunks.append(Chunk(s, e, section, "row", columns))
+            continue
+        for s, e, section in _body_sections(text, start, end, title):
+            for ws, we in _windows(text, s, e, max_chars):
+                chunks.append(Chunk(ws, we, section))
+    return chunks
@@ -0,0 +1,230 @@
+"""Corpus compaction before indexing: repeated boilerplate and duplicate rows.
+
+Scraped pages carry text repeated across many of them: navboxes ("view
+Heroes in Darkest Dungeon ..."), the trinket-set blurb on every hero page,
+the shared camping skills. `compact_corpus` chunks every document (see
+`tools.rag.chunker`) and then:
+
+- finds word shingles of body prose that occur on ``min_docs`` or more
+  pages. Runs of at least ``min_words`` covered words are cut out of the
+  chunks of every page but the first one that has them, so the text is
+  indexed once instead of on every page. Only prose is shingled: the
+  page lead (infobox), chunks that are 20%+ numbers and shingles that are
+  mostly numbers are never cut. Stat blocks such as "SPD 4 4 5 5 6" or
+  "Stun 25% 45% 70%" repeat across pages but belong to each of them, and
+  text shared by a handful of pages (a district bonus of three heroes)
+  is kept on all of them. Pieces left after a cut are indexed with at
+  least the average chunk length, so a leftover caption does not outrank
+  the page's own passages;
+- drops table rows that repeat an earlier row of the same page word for
+  word (e.g. identical skills at each enemy level);
+- interns section paths and column tuples shared by many chunks.
+
+Chunks stay character spans into the original text, so the on-disk index
+keeps reading snippets by offset. The returned `CompactionReport` gives the
+indexed bytes and tokens before and after. ``RAG_COMPACT=0`` disables it.
+"""
+from collections import Counter
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, Hashable, Iterable, List, Tuple
+import os
+import re
+import sys
+
+from .chunker import Chunk, chunk_document
+from .qa_tool import estimate_tokens
+
+
+SHINGLE_WORDS = 8
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class CompactionReport:
+    documents: int = 0
+    chunks_before: int = 0
+    chunks_after: int = 0
+    boilerplate_runs: int = 0
+    duplicate_rows: int = 0
+    interned: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(asdict(self), bytes_saved=self.bytes_saved, tokens_saved=self.tokens_saved)
+
+    def summary(self) -> str:
+        pct = 100 * self.bytes_saved / self.bytes_before if self.bytes_before else 0.0
+        return (f"{self.chunks_before} -> {self.chunks_after} chunks, {self.bytes_saved} bytes ({pct:.1f}%) and "
+                f"~{self.tokens_saved} tokens saved ({self.boilerplate_runs} boilerplate runs, "
+                f"{self.duplicate_rows} duplicate rows)")
+
+
+def compaction_enabled() -> bool:
+    return os.getenv("RAG_COMPACT", "1") != "0"
+
+
+def _words(text: str, chunk: Chunk) -> List[Tuple[int, int, str]]:
+    return [(m.start(), m.end(), m.group().lower()) for m in _WORD_RE.finditer(text, chunk.start, chunk.end)]
+
+
+def _numeric(word: str) -> bool:
+    return any(ch.isdigit() for ch in word)
+
+
+def _is_prose(words: List[Tuple[int, int, str]]) -> bool:
+    # flattened stat tables ("Ectoplasm 8 0% 0% 1 Eldritch Stun - 50% ...") run at 20%+ numbers
+    return 5 * sum(_numeric(w) for _, _, w in words) < len(words)
+
+
+def _shingles(words: List[Tuple[int, int, str]], size: int) -> List[int | None]:
+    """Hash of every ``size``-word window; None for windows that are mostly numbers."""
+    out = []
+    for i in range(len(words) - size + 1):
+        window = [w for _, _, w in words[i:i + size]]
+        out.append(None if 2 * sum(map(_numeric, window)) >= size else hash(tuple(window)))
+    return out
+
+
+def _lead(chunks: List[Chunk]) -> List[Chunk]:
+    """Text chunks of the page lead: the section before the first Contents heading."""
+    body = [c for c in chunks if c.kind == "text"]
+    if not body:
+        return []
+    lead = [c for c in body if c.section == body[0].section]
+    # a page without headings is all lead; keep only its first chunk
+    return body[:1] if len(lead) == len(body) else lead
+
+
+def _cut(text: str, chunk: Chunk, words: List[Tuple[int, int, str]], covered: List[bool],
+         min_words: int, min_length: int) -> Tuple[List[Chunk], int]:
+    """Pieces of ``chunk`` outside the covered runs of at least ``min_words`` words, and the number of runs cut.
+
+    Pieces are indexed with a BM25 length of at least ``min_length``.
+    """
+    cuts, i = [], 0
+    while i < len(words):
+        if not covered[i]:
+            i += 1
+            continue
+        j = i
+        while j < len(words) and covered[j]:
+            j += 1
+        if j - i >= min_words:
+            cuts.append((words[i][0], words[j - 1][1]))
+        i = j
+    if not cuts:
+        return [chunk], 0
+    section_words = len(_WORD_RE.findall(chunk.section))
+    pieces, start = [], chunk.start
+    for cut_start, cut_end in cuts + [(chunk.end, chunk.end)]:
+        piece = text[start:cut_start]
+        count = len(_WORD_RE.findall(piece))
+        # scraps left between two runs ('All is well."') would outrank whole passages on BM25 length norm
+        if count >= min_words:
+            lead = len(piece) - len(piece.lstrip())
+            # so would a gallery caption left over from a navbox section
+            length = min_length if section_words + count < min_length else 0
+            pieces.append(Chunk(start + lead, start + len(piece.rstrip()), chunk.section, chunk.kind, chunk.columns, length))
+        start = cut_end
+    return pieces, len(cuts)
+
+
+def compact_corpus(documents: Iterable[Tuple[Hashable, str, str]], shingle_words: int = SHINGLE_WORDS,
+                   min_docs: int = 5, min_words: int = 12,
+                   enabled: bool | None = None) -> Tuple[Dict[Hashable, List[Chunk]], CompactionReport]:
+    """Chunks of every ``(key, text, title)`` document with boilerplate and duplicate rows removed.
+
+    Documents are compared in the order given; the first page with a
+    repeated run keeps it.
+    """
+    docs = list(documents)
+    report = CompactionReport(documents=len(docs))
+    chunked = {key: chunk_document(text, title) for key, text, title in docs}
+    texts = {key: text for key, text, _ in docs}
+    enabled = compaction_enabled() if enabled is None else enabled
+
+    # BM25 length of an average chunk before compaction; the floor for cut pieces
+    lengths = [len(_WORD_RE.findall(c.section + " " + c.raw(texts[k]))) for k in chunked for c in chunked[k]]
+    min_length = round(sum(lengths) / len(lengths)) if lengths else 0
+
+    # body words and shingles per chunk; shingle -> pages having it, and the first of them
+    body: Dict[Hashable, List[Tuple[Chunk, List, List[int]]]] = {}
+    df: Counter = Counter()
+    first: Dict[int, Hashable] = {}
+    for key, _, _ in docs if enabled else ():
+        text, seen = texts[key], set()
+        body[key] = []
+        lead = set(_lead(chunked[key]))
+        for chunk in chunked[key]:
+            if chunk.kind != "text" or chunk in lead:
+                continue
+            words = _words(text, chunk)
+            if not _is_prose(words):
+                continue
+            shingles = _shingles(words, shingle_words)
+            body[key].append((chunk, words, shingles))
+            seen.update(shingles)
+        seen.discard(None)
+        df.update(seen)
+        for h in seen:
+            first.setdefault(h, key)
+
+    out: Dict[Hashable, List[Chunk]] = {}
+    strings: Dict[object, object] = {}
+    for key, _, _ in docs:
+        text = texts[key]
+        report.chunks_before += len(chunked[key])
+        for c in chunked[key]:
+            report.bytes_before += len(c.raw(text).encode("utf-8"))
+            report.tokens_before += estimate_tokens(c.raw(text))
+        if not enabled:
+            out[key] = chunked[key]
+            continue
+
+        replaced: Dict[Chunk, List[Chunk]] = {}
+        for chunk, words, shingles in body[key]:
+            covered = [False] * len(words)
+            for i, h in enumerate(shingles):
+                if h is not None and df[h] >= min_docs and first[h] != key:
+                    for j in range(i, i + shingle_words):
+                        covered[j] = True
+            pieces, runs = _cut(text, chunk, words, covered, min_words, min_length)
+            if runs:
+                replaced[chunk] = pieces
+                report.boilerplate_runs += runs
+
+        kept, rows = [], set()
+        for chunk in chunked[key]:
+            if chunk.kind == "row":
+                raw = chunk.raw(text)
+                if raw in rows:
+                    report.duplicate_rows += 1
+                    continue
+                rows.add(raw)
+            for piece in replaced.get(chunk, [chunk]):
+                section = strings.setdefault(piece.section, sys.intern(piece.section))
+                columns = strings.setdefault(piece.columns, piece.columns)
+                if section is not piece.section or columns is not piece.columns:
+                    report.interned += 1
+                    piece = replace(piece, section=section, columns=columns)
+                kept.append(piece)
+        out[key] = kept
+
+    for key, chunks in out.items():
+        text = texts[key]
+        report.chunks_after += len(chunks)
+        for c in chunks:
+            report.bytes_after += len(c.raw(text).encode("utf-8"))
+            report.tokens_after += estimate_tokens(c.raw(text))
+    return out, report
@@ -0,0 +1,216 @@
+"""Dense (embedding) retrieval backend.
+
+Structured chunks (`tools.rag.chunker`) of `Corpus.documents()` are embedded
+in batches on CPU and the matrix is persisted as float16 under
+``<index dir>/dense/<model>`` together with the sha1 of every chunk, so a
+re-scrape only re-encodes the chunks whose text changed. Both files are
+replaced atomically, and the hash list records a digest of the matrix it
+belongs to, so a reader never pairs rows with the wrong chunks. Queries are answered
+with one matrix-vector product and ``argpartition``.
+"""
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from .chunker import Chunk, document_title
+from .compaction import compact_corpus
+from .disk_index import _write_atomic, default_index_dir
+
+
+DEFAULT_MODEL = "BAAI/bge-small-en-v1.5"
+
+Encoder = Callable[[Sequence[str]], np.ndarray]
+
+
+class HuggingFaceEncoder:
+    """Batched CPU encoder backed by llama-index's HuggingFace embeddings."""
+
+    def __init__(self, model_name: str = None, batch_size: int = None):
+        self.model_name = model_name or os.getenv("RAG_EMBED_MODEL", DEFAULT_MODEL)
+        self.batch_size = batch_size or int(os.getenv("RAG_EMBED_BATCH", "32"))
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+                self._model = HuggingFaceEmbedding(model_name=self.model_name, device="cpu", embed_batch_size=self.batch_size)
+        return self._model
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        model = self._load()
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(model.get_text_embedding_batch(list(texts[i:i + self.batch_size])))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        return np.asarray(self._load().get_query_embedding(query), dtype=np.float32)
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _chunk_hash(model_name: str, text: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class DenseIndex:
+    """Embedding matrix over the chunks of one corpus snapshot."""
+
+    def __init__(self, chunks: List[Tuple[Path, Chunk]], texts: Dict[Path, str], matrix: np.ndarray,
+                 encoder: Encoder, doc_meta: Dict[Path, dict] | None = None):
+        self.chunks = chunks
+        self.texts = texts
+        # float32, L2-normalised rows
+        self.matrix = matrix
+        self.encoder = encoder
+        self.doc_meta = doc_meta or {}
+        # category -> row ids, so a filtered query only multiplies its sub-matrix
+        by_category: Dict[str, List[int]] = {}
+        for i, (path, _) in enumerate(chunks):
+            by_category.setdefault(self.meta(path).get("category", ""), []).append(i)
+        self.category_rows = {c: np.asarray(rows, dtype=np.int64) for c, rows in by_category.items()}
+
+    @classmethod
+    def build(cls, corpus, encoder: Encoder = None, cache_dir: Path = None) -> "DenseIndex":
+        encoder = encoder or HuggingFaceEncoder()
+        model_name = getattr(encoder, "model_name", type(encoder).__name__)
+        if cache_dir is None:
+            cache_dir = default_index_dir() / "dense" / re.sub(r"[^\w\-.]", "_", model_name)
+
+        chunks = []
+        texts = {}
+        doc_meta = {}
+        documents = sorted(corpus.documents(), key=lambda d: d[0])
+        chunked, _ = compact_corpus((path, text, document_title(path)) for path, text, _ in documents)
+        for path, text, meta in documents:
+            texts[path] = text
+            doc_meta[path] = meta
+            chunks.extend((path, chunk) for chunk in chunked[path] if chunk.kind != "header")
+        chunk_texts = [chunk.render(texts[p]) for p, chunk in chunks]
+        hashes = [_chunk_hash(model_name, t) for t in chunk_texts]
+
+        cached = _load_cache(cache_dir)
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+        if missing:
+            print(f"[dense_index] Encoding {len(missing)} of {len(chunks)} chunks with {model_name}.")
+            encoded = np.asarray(encoder([chunk_texts[i] for i in missing]), dtype=np.float32)
+            for i, vec in zip(missing, encoded):
+                cached[hashes[i]] = vec
+
+        dim = len(next(iter(cached.values()))) if cached else 0
+        matrix = np.zeros((len(chunks), dim), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            matrix[i] = cached[h]
+        matrix = _normalize(matrix)
+        if missing:
+            _save_cache(cache_dir, hashes, matrix)
+        return cls(chunks, texts, matrix, encoder, doc_meta)
+
+    def _query_vector(self, query: str) -> np.ndarray:
+        encode_query = getattr(self.encoder, "encode_query", None)
+        vec = encode_query(query) if encode_query else self.encoder([query])[0]
+        return _normalize(np.asarray(vec, dtype=np.float32))
+
+    def _rows(self, categories: Iterable[str] | None) -> np.ndarray | None:
+        if not categories:
+            return None
+        rows = [self.category_rows[c] for c in set(categories) if c in self.category_rows]
+        return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+
+    def score(self, query: str, candidates: int, categories: Iterable[str] | None = None) -> List[Tuple[int, float]]:
+        """Top ``candidates`` chunk ids by cosine similarity, best first."""
+        rows = self._rows(categories)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if not len(matrix):
+            return []
+        sims = matrix @ self._query_vector(query)
+        k = min(candidates, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        ids = top if rows is None else rows[top]
+        return [(int(i), float(s)) for i, s in zip(ids, sims[top])]
+
+    def snippet(self, cid: int) -> str:
+        path, chunk = self.chunks[cid]
+        return chunk.render(self.texts[path])[:2000]
+
+    def meta(self, path: Path) -> dict:
+        return self.doc_meta.get(path, {})
+
+    def search(self, query: str, top: int = 3, categories: Iterable[str] | None = None) -> List[Tuple[Path, str, float]]:
+        """Best-matching chunk per document, ``top`` documents overall."""
+        candidates = top * 8
+        while True:
+            scored = self.score(query, candidates, categories)
+            results = []
+            seen = set()
+            for cid, sc in scored:
+                path = self.chunks[cid][0]
+                if path in seen:
+                    continue
+                seen.add(path)
+                results.append((path, self.snippet(cid), round(sc, 4)))
+                if len(results) == top:
+                    return results
+            if len(scored) < candidates or candidates >= len(self.chunks):
+                return results
+            candidates *= 4
+
+
+def _load_cache(cache_dir: Path) -> Dict[str, np.ndarray]:
+    try:
+        listing = json.loads((cache_dir / "chunks.json").read_text(encoding="utf-8"))
+        raw = (cache_dir / "embeddings.npy").read_bytes()
+        hashes = listing["hashes"]
+        matrix = np.load(io.BytesIO(raw))
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    # the two files are replaced one after the other; only use a matching pair
+    if listing.get("embeddings_sha1") != hashlib.sha1(raw).hexdigest() or len(hashes) != len(matrix):
+        return {}
+    return {h: row.astype(np.float32) for h, row in zip(hashes, matrix)}
+
+
+def _save_cache(cache_dir: Path, hashes: List[str], matrix: np.ndarray):
+    buf = io.BytesIO()
+    np.save(buf, matrix.astype(np.float16))
+    raw = buf.getvalue()
+    listing = {"hashes": hashes, "embeddings_sha1": hashlib.sha1(raw).hexdigest()}
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(cache_dir / "embeddings.npy", lambda f: f.write(raw))
+        _write_atomic(cache_dir / "chunks.json", lambda f: f.write(json.dumps(listing).encode("utf-8")))
+    except OSError as e:
+        print(f"[dense_index] Could not persist embeddings to {cache_dir}: {e}")
+
+
+_encoder: Encoder | None = None
+_build_lock = threading.Lock()
+
+
+def get_dense_index(corpus, encoder: Encoder = None) -> DenseIndex:
+    """Return the dense index for ``corpus``, building (or loading) it on first use."""
+    global _encoder
+    with _build_lock:
+        index = corpus.derived.get("dense")
+        if index is None:
+            if encoder is None:
+                if _encoder is None:
+                    _encoder = HuggingFaceEncoder()
+                encoder = _encoder
+            index = corpus.derived["dense"] = DenseIndex.build(corpus, encoder)
+        return index
@@ -0,0 +1,375 @@
+"""On-disk BM25 index over ``wiki_menu_data``.
+
+Layout of an index directory (default ``<repo>/.rag_index``, overridable
+with ``RAG_INDEX_DIR``):
+
+- ``manifest.json``: format version, BM25 parameters, the compaction report
+  (see `tools.rag.compaction`) and the sha256/size/mtime of every source
+  file the index was built from.
+- ``vocab.json``: term -> [offset, document frequency] into the postings.
+- ``postings_ids.npy`` / ``postings_tfs.npy``: chunk ids and term
+  frequencies, concatenated per term.
+- ``chunks.npy``: per chunk (see `tools.rag.chunker`) the source file id,
+  byte offsets into the source file, token length, kind and ids into the
+  section / column tables of ``sections.json``.
+
+Array files are opened with ``mmap_mode="r"`` so several workers share the
+same pages, and snippet text is read lazily from the source files by offset.
+Builds take ``.build.lock`` in the index directory, so workers that find a
+stale index rebuild it one at a time instead of interleaving their writes.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+from collections import Counter
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from .file_loader import _default_root, _document_meta
+from .chunker import Chunk, document_title
+from .compaction import compact_corpus, compaction_enabled
+from .retriever import _tokenize
+
+
+FORMAT_VERSION = 5
+CHUNK_DTYPE = np.dtype([
+    ("file", "<u4"), ("start", "<u8"), ("end", "<u8"), ("length", "<u4"),
+    ("kind", "u1"), ("section", "<u4"), ("columns", "<i4"),
+])
+CHUNK_KINDS = ("text", "header", "row")
+
+
+def default_index_dir(root: Path = None) -> Path:
+    env = os.getenv("RAG_INDEX_DIR")
+    if env:
+        return Path(env)
+    return Path(root or _default_root()) / ".rag_index"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _scan_sources(data_dir: Path) -> Dict[str, os.stat_result]:
+    if not data_dir.exists():
+        return {}
+    return {p.relative_to(data_dir).as_posix(): p.stat() for p in sorted(data_dir.rglob("*.txt"))}
+
+
+def _byte_spans(text: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Convert sorted character spans of ``text`` into UTF-8 byte spans."""
+    out = []
+    char_pos = 0
+    byte_pos = 0
+    for start, end in spans:
+        byte_pos += len(text[char_pos:start].encode("utf-8"))
+        b_start = byte_pos
+        byte_pos += len(text[start:end].encode("utf-8"))
+        out.append((b_start, byte_pos))
+        char_pos = end
+    return out
+
+
+def _write_atomic(path: Path, write):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _build_lock(index_dir: Path, timeout: float = 300.0, stale: float = 600.0):
+    """Cross-process lock on ``index_dir``: a file created with O_EXCL.
+
+    A lock left behind by a crashed build is broken after ``stale`` seconds;
+    raises `TimeoutError` when another build holds it for over ``timeout``.
+    """
+    index_dir.mkdir(parents=True, exist_ok=True)
+    path = index_dir / ".build.lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale:
+                    path.unlink(missing_ok=True)
+                    continue
+            except OSError:
+                continue  # released in the meantime
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"another process is building the index in {index_dir}")
+            time.sleep(0.1)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def build_index(root: Path = None, out_dir: Path = None, k1: float = 1.5, b: float = 0.75) -> Dict:
+    """Tokenize ``wiki_menu_data`` and write the index files; returns the manifest."""
+    root = Path(root or _default_root()).resolve()
+    out_dir = Path(out_dir or default_index_dir(root))
+    with _build_lock(out_dir):
+        return _build_index(root, out_dir, k1, b)
+
+
+def _build_index(root: Path, out_dir: Path, k1: float = 1.5, b: float = 0.75) -> Dict:
+    data_dir = root / "wiki_menu_data"
+
+    files = []
+    rows = []
+    sections: Dict[str, int] = {}
+    column_sets: Dict[Tuple[str, ...], int] = {}
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    texts = {}
+    for rel, st in _scan_sources(data_dir).items():
+        raw = (data_dir / rel).read_bytes()
+        texts[rel] = raw.decode("utf-8", errors="replace")
+        files.append({"path": rel, "sha256": _sha256(raw), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    chunked, compaction = compact_corpus((rel, text, document_title(rel)) for rel, text in texts.items())
+    for file_id, (rel, text) in enumerate(texts.items()):
+        chunks = [c for c in chunked[rel] if c.kind != "header"]
+        spans = [(c.start, c.end) for c in chunks]
+        for chunk, (b_start, b_end) in zip(chunks, _byte_spans(text, spans)):
+            pid = len(rows)
+            tokens = _tokenize(chunk.section + " " + chunk.raw(text))
+            section_id = sections.setdefault(chunk.section, len(sections))
+            columns_id = column_sets.setdefault(chunk.columns, len(column_sets)) if chunk.columns else -1
+            rows.append((file_id, b_start, b_end, chunk.length or len(tokens), CHUNK_KINDS.index(chunk.kind), section_id, columns_id))
+            for term, tf in Counter(tokens).items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(pid)
+                tfs.append(tf)
+
+    vocab = {}
+    ids_out: List[int] = []
+    tfs_out: List[int] = []
+    for term in sorted(postings):
+        ids, tfs = postings[term]
+        vocab[term] = [len(ids_out), len(ids)]
+        ids_out.extend(ids)
+        tfs_out.extend(min(tf, 65535) for tf in tfs)
+
+    chunk_arr = np.array(rows, dtype=CHUNK_DTYPE)
+    lengths = chunk_arr["length"] if len(chunk_arr) else np.zeros(0)
+    build_id = uuid.uuid4().hex
+    manifest = {
+        "version": FORMAT_VERSION,
+        "build_id": build_id,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "k1": k1,
+        "b": b,
+        "chunks": len(rows),
+        "terms": len(vocab),
+        "avg_length": float(lengths.mean()) if len(lengths) else 0.0,
+        "compaction": compaction.as_dict() if compaction_enabled() else None,
+        "files": files,
+    }
+
+    _write_atomic(out_dir / "postings_ids.npy", lambda f: np.save(f, np.array(ids_out, dtype="<u4")))
+    _write_atomic(out_dir / "postings_tfs.npy", lambda f: np.save(f, np.array(tfs_out, dtype="<u2")))
+    _write_atomic(out_dir / "chunks.npy", lambda f: np.save(f, chunk_arr))
+    _write_atomic(out_dir / "sections.json", lambda f: f.write(json.dumps(
+        {"build_id": build_id, "sections": list(sections), "columns": [list(c) for c in column_sets]}).encode("utf-8")))
+    _write_atomic(out_dir / "vocab.json", lambda f: f.write(json.dumps({"build_id": build_id, "terms": vocab}).encode("utf-8")))
+    # manifest goes last: readers treat the index as complete once it matches
+    _write_atomic(out_dir / "manifest.json", lambda f: f.write(json.dumps(manifest, indent=1).encode("utf-8")))
+    return manifest
+
+
+def manifest_matches(manifest: Dict, data_dir: Path) -> bool:
+    """True when the source files are the ones the index was built from.
+
+    Files whose size and mtime are unchanged are trusted; anything else is
+    re-hashed, so a touched-but-identical file does not force a rebuild.
+    """
+    if manifest.get("version") != FORMAT_VERSION or bool(manifest.get("compaction")) != compaction_enabled():
+        return False
+    current = _scan_sources(data_dir)
+    recorded = {f["path"]: f for f in manifest.get("files", [])}
+    if set(current) != set(recorded):
+        return False
+    for rel, st in current.items():
+        entry = recorded[rel]
+        if st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]:
+            continue
+        if st.st_size != entry["size"] or _sha256((data_dir / rel).read_bytes()) != entry["sha256"]:
+            return False
+    return True
+
+
+class DiskIndex:
+    """Memory-mapped, read-only view of an index written by `build_index`."""
+
+    def __init__(self, index_dir: Path, data_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.data_dir = Path(data_dir)
+        self.manifest = json.loads((self.index_dir / "manifest.json").read_text(encoding="utf-8"))
+        vocab = json.loads((self.index_dir / "vocab.json").read_text(encoding="utf-8"))
+        sections = json.loads((self.index_dir / "sections.json").read_text(encoding="utf-8"))
+        if not vocab.get("build_id") == sections.get("build_id") == self.manifest.get("build_id"):
+            raise ValueError("index files belong to different builds")
+        self.vocab: Dict[str, List[int]] = vocab["terms"]
+        self.sections: List[str] = sections["sections"]
+        self.columns: List[Tuple[str, ...]] = [tuple(c) for c in sections["columns"]]
+        self.post_ids = np.load(self.index_dir / "postings_ids.npy", mmap_mode="r")
+        self.post_tfs = np.load(self.index_dir / "postings_tfs.npy", mmap_mode="r")
+        self.chunks = np.load(self.index_dir / "chunks.npy", mmap_mode="r")
+        self.files = [self.data_dir / f["path"] for f in self.manifest["files"]]
+        self.file_categories = np.array([self.meta(p)["category"] for p in self.files], dtype=object)
+        self._masks: Dict[Tuple[str, ...], np.ndarray] = {}
+        self.k1 = self.manifest["k1"]
+        self.b = self.manifest["b"]
+        self.avg_length = self.manifest["avg_length"] or 1.0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def idf(self, df: int) -> float:
+        n = len(self.chunks)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _chunk_mask(self, categories: Iterable[str]) -> np.ndarray:
+        key = tuple(sorted(set(categories)))
+        mask = self._masks.get(key)
+        if mask is None:
+            file_mask = np.isin(self.file_categories, key)
+            mask = self._masks[key] = file_mask[self.chunks["file"]]
+        return mask
+
+    def score(self, query: str, categories: Iterable[str] | None = None) -> Dict[int, float]:
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        lengths = self.chunks["length"]
+        mask = self._chunk_mask(categories) if categories else None
+        for term, qtf in Counter(_tokenize(query)).items():
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            ids = self.post_ids[offset:offset + df]
+            if mask is not None:
+                keep = mask[ids]
+                ids = ids[keep]
+            else:
+                keep = slice(None)
+            tfs = self.post_tfs[offset:offset + df][keep].astype(np.float64)
+            norm = self.k1 * (1 - self.b + self.b * lengths[ids] / self.avg_length)
+            scores[ids] += self.idf(df) * qtf * tfs * (self.k1 + 1) / (tfs + norm)
+        hit = np.flatnonzero(scores)
+        return dict(zip(hit.tolist(), scores[hit].tolist()))
+
+    def chunk(self, pid: int) -> Tuple[Chunk, str]:
+        """The chunk and its raw text, read from the source file by byte offset."""
+        row = self.chunks[pid]
+        with open(self.files[int(row["file"])], "rb") as f:
+            f.seek(int(row["start"]))
+            raw = f.read(int(row["end"]) - int(row["start"])).decode("utf-8", errors="replace")
+        columns = self.columns[int(row["columns"])] if row["columns"] >= 0 else ()
+        return Chunk(0, len(raw), self.sections[int(row["section"])], CHUNK_KINDS[int(row["kind"])], columns), raw
+
+    def snippet(self, pid: int) -> str:
+        chunk, raw = self.chunk(pid)
+        return chunk.render(raw)[:2000]
+
+    def path(self, pid: int) -> Path:
+        return self.files[int(self.chunks[pid]["file"])]
+
+    def meta(self, path: Path) -> dict:
+        return _document_meta(path, self.data_dir)
+
+    def search(self, query: str, top: int = 3, categories: Iterable[str] | None = None) -> List[Tuple[Path, str, float]]:
+        """Best-scoring chunk per document, ``top`` documents overall."""
+        best: Dict[int, Tuple[float, int]] = {}
+        for pid, sc in self.score(query, categories).items():
+            file_id = int(self.chunks[pid]["file"])
+            current = best.get(file_id)
+            if current is None or sc > current[0]:
+                best[file_id] = (sc, pid)
+
+        ranked = sorted(best.values(), key=lambda x: x[0], reverse=True)[:top]
+        return [(self.path(pid), self.snippet(pid), round(sc, 4)) for sc, pid in ranked]
+
+
+def open_index(root: Path = None, index_dir: Path = None, rebuild: bool = True) -> DiskIndex | None:
+    """Open the on-disk index, rebuilding it when the manifest is stale.
+
+    Returns None when there is no usable index and ``rebuild`` is False.
+    """
+    root = Path(root or _default_root()).resolve()
+    data_dir = root / "wiki_menu_data"
+    index_dir = Path(index_dir or default_index_dir(root))
+    index = _open_current(index_dir, data_dir)
+    if index is not None or not rebuild:
+        return index
+    with _build_lock(index_dir):
+        # another worker may have rebuilt it while this one waited for the lock
+        index = _open_current(index_dir, data_dir, quiet=True)
+        if index is None:
+            print(f"[disk_index] Index at {index_dir} is missing or stale, rebuilding.")
+            _build_index(root, index_dir)
+            index = DiskIndex(index_dir, data_dir)
+    return index
+
+
+def _open_current(index_dir: Path, data_dir: Path, quiet: bool = False) -> DiskIndex | None:
+    """The index in ``index_dir`` if it matches the source files, else None."""
+    manifest_path = index_dir / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest_matches(manifest, data_dir):
+            return DiskIndex(index_dir, data_dir)
+    except (OSError, ValueError, KeyError) as e:
+        # also a build replacing the files while they were being read
+        if not quiet:
+            print(f"[disk_index] Ignoring unreadable index at {index_dir}: {e}")
+    return None
+
+
+class _IndexHandle:
+
+    def __init__(self, root: Path, check_interval: float = 2.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.index: DiskIndex | None = None
+        self.checked_at = 0.0
+        self.stats: Dict[str, os.stat_result] = {}
+        self.lock = threading.Lock()
+
+    def get(self) -> DiskIndex:
+        with self.lock:
+            now = time.monotonic()
+            if self.index is not None and now - self.checked_at < self.check_interval:
+                return self.index
+            current = {rel: (st.st_size, st.st_mtime_ns) for rel, st in _scan_sources(self.root / "wiki_menu_data").items()}
+            if self.index is None or current != self.stats:
+                self.index = open_index(self.root)
+                self.stats = current
+            self.checked_at = now
+            return self.index
+
+
+_handles: Dict[Path, _IndexHandle] = {}
+_handles_lock = threading.Lock()
+
+
+def get_disk_index(root: Path = None) -> DiskIndex:
+    """Process-wide `DiskIndex` for ``root``; reopened when source files change."""
+    key = Path(root or _default_root()).resolve()
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is None:
+            handle = _handles[key] = _IndexHandle(key)
+    return handle.get()
@@ -0,0 +1,243 @@
+"""Typo-tolerant resolution of hero, enemy, trinket, curio and page names.
+
+The retrievers match whole words, so "vestle", "plague doc" or "bone
+defendor" score nothing against the Vestal, Plague Doctor or Bone Defender
+pages. `NameIndex` holds every document title (``title`` metadata of
+`Corpus.documents()`) and every entity name of the entity store (the
+interaction tables and stat blocks). It maps spans of a query to those
+names:
+
+- exactly, ignoring case, punctuation and spacing ("man at arms",
+  "manatarms" -> Man-at-Arms);
+- by abbreviation of the last word ("plague doc" -> Plague Doctor);
+- within a small edit distance. Candidates are found through shared
+  character trigrams and then checked with an optimal-string-alignment
+  distance ("bone defendor" -> Bone Defender).
+
+Words that occur in the corpus are not typos: a span made only of them
+("stack", "trinkets help") is never edit-corrected, only abbreviated, and
+a span that mixes them with unknown words ("bone defendor") is corrected
+by at most one edit. Fuzzy candidates must also share the first letter
+and enough trigrams, so a new query resolves in a fraction of a
+millisecond. Results are memoized
+per query, and a repeated query takes about a microsecond.
+"""
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+import re
+import threading
+
+from .entity_store import get_entity_store, name_key
+from .file_loader import get_corpus_store
+
+
+_WORD_RE = re.compile(r"\w+")
+# longest name (in words) a query span is compared against
+MAX_WORDS = 4
+# a misspelled name does not start or end with these
+STOPWORDS = frozenset(
+    "a about an and any are as at be best can do does for from get good how i in is it its me my of on or "
+    "s should the their them to vs what when where which who why will with you your".split())
+
+
+@dataclass
+class NameMatch:
+    # span of the normalized query that was matched
+    text: str
+    # canonical display name
+    name: str
+    # entity kinds ("hero", "enemy", "trinket", "curio") and/or "page"
+    kinds: List[str] = field(default_factory=list)
+    # title (file stem) of the page about it, if there is one
+    title: str = ""
+    # 0 for an exact match; edits (or abbreviated letters, capped at 1) otherwise
+    distance: int = 0
+
+    @property
+    def corrected(self) -> bool:
+        return self.text != name_key(self.name)
+
+
+def _trigrams(compact: str) -> Set[str]:
+    padded = f"^{compact}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(length: int) -> int:
+    """Edits tolerated for a name of ``length`` letters (without spaces)."""
+    if length < 4:
+        return 0
+    if length < 6:
+        return 1
+    return 2 if length < 12 else 3
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count once); ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class NameIndex:
+    def __init__(self, max_cache: int = 2048, vocabulary: Iterable[str] = ()):
+        # entry id -> (key, display name, kinds, title)
+        self.entries: List[Tuple[str, str, Set[str], str]] = []
+        # lowercase words of the corpus; these are never treated as misspellings
+        self.vocabulary = frozenset(vocabulary)
+        self._by_compact: Dict[str, int] = {}
+        self._trigrams: Dict[str, List[int]] = {}
+        self.max_cache = max_cache
+        self._cache: "OrderedDict[str, List[NameMatch]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, titles: Iterable[str], entities: Iterable[Tuple[str, str]],
+              vocabulary: Iterable[str] = ()) -> "NameIndex":
+        """``titles``: document titles (file stems); ``entities``: (display name, kind) pairs;
+        ``vocabulary``: words of the corpus text."""
+        index = cls(vocabulary=vocabulary)
+        for title in titles:
+            index.add(title.replace("_", " "), "page", title)
+        for name, kind in entities:
+            index.add(name, kind)
+        return index
+
+    def add(self, name: str, kind: str, title: str = ""):
+        key = name_key(name)
+        words = key.split()
+        # skip table-parsing leftovers ("14 3 stress 15 ...", icon captions)
+        if not words or len(words) > MAX_WORDS or not words[0][0].isalpha():
+            return
+        compact = "".join(words)
+        eid = self._by_compact.get(compact)
+        if eid is None:
+            eid = self._by_compact[compact] = len(self.entries)
+            self.entries.append((key, name, set(), ""))
+            for gram in _trigrams(compact):
+                self._trigrams.setdefault(gram, []).append(eid)
+        key, display, kinds, old_title = self.entries[eid]
+        kinds.add(kind)
+        # page titles carry the canonical spelling
+        self.entries[eid] = (key, name if title else display, kinds, title or old_title)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _match(self, eid: int, text: str, distance: int) -> NameMatch:
+        key, name, kinds, title = self.entries[eid]
+        return NameMatch(text, name, sorted(kinds), title, distance)
+
+    def _fuzzy(self, words: List[str]) -> Tuple[int, int] | None:
+        """Best (entry id, distance) for a misspelled or abbreviated span."""
+        compact = "".join(words)
+        known = sum(w in self.vocabulary for w in words)
+        if known == len(words) and len(words) == 1:
+            return None
+        # a span of corpus words can only be an abbreviation; one with some of them, one typo
+        limit = 0 if known == len(words) else min(max_distance(len(compact)), 1) if known else max_distance(len(compact))
+        grams = _trigrams(compact)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        # each edit changes at most three trigrams
+        needed = max(1, len(grams) - 3 * max(limit, 1))
+        best = None
+        for eid, count in shared.items():
+            if count < needed:
+                continue
+            key = self.entries[eid][0]
+            name_words = key.split()
+            target = "".join(name_words)
+            if target[0] != compact[0]:
+                continue
+            distance = edit_distance(compact, target, limit)
+            if distance > limit:
+                if not self._abbreviates(words, name_words):
+                    continue
+                distance = 1
+            if best is None or (distance, len(target)) < (best[1], best[2]):
+                best = (eid, distance, len(target))
+        return (best[0], best[1]) if best else None
+
+    @staticmethod
+    def _abbreviates(words: List[str], name_words: List[str]) -> bool:
+        """"plague doc" for "plague doctor": same words, the last one cut short."""
+        if len(words) != len(name_words) or words[:-1] != name_words[:-1]:
+            return False
+        last, full = words[-1], name_words[-1]
+        minimum = 3 if len(words) > 1 else max(5, round(len(full) * 0.6))
+        return len(last) >= minimum and full.startswith(last)
+
+    def resolve(self, query: str) -> List[NameMatch]:
+        """Names mentioned in ``query``, misspelled or not, left to right; longest span first."""
+        with self._lock:
+            cached = self._cache.get(query)
+            if cached is not None:
+                self._cache.move_to_end(query)
+                return cached
+        tokens = name_key(query).split()
+        matches, i = [], 0
+        while i < len(tokens):
+            found = None
+            for n in range(min(MAX_WORDS, len(tokens) - i), 0, -1):
+                words = tokens[i:i + n]
+                eid = self._by_compact.get("".join(words))
+                if eid is not None:
+                    found = (n, self._match(eid, " ".join(words), 0))
+                    break
+                if words[0] in STOPWORDS or words[-1] in STOPWORDS:
+                    continue
+                if len("".join(words)) >= 4:
+                    hit = self._fuzzy(words)
+                    if hit is not None:
+                        found = (n, self._match(hit[0], " ".join(words), hit[1]))
+                        break
+            if found:
+                matches.append(found[1])
+                i += found[0]
+            else:
+                i += 1
+        with self._lock:
+            self._cache[query] = matches
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+        return matches
+
+
+def expand_query(query: str, matches: List[NameMatch]) -> str:
+    """``query`` followed by the canonical names of the corrected matches, for word-based search."""
+    extra = [m.name for m in matches if m.corrected]
+    return " ".join([query] + extra) if extra else query
+
+
+def get_name_index() -> NameIndex:
+    """Name index of the current corpus snapshot (rebuilt when the corpus changes)."""
+    corpus = get_corpus_store().get()
+    index = corpus.derived.get("names")
+    if index is None:
+        titles = [meta["title"] for _, _, meta in corpus.documents() if meta.get("title")]
+        try:
+            entities = get_entity_store().entries()
+        except Exception as e:
+            print(f"[entity_names] Entity names unavailable ({e}); indexing page titles only.")
+            entities = []
+        vocabulary = {w for _, text, _ in corpus.documents() for w in _WORD_RE.findall(text.lower())}
+        index = corpus.derived["names"] = NameIndex.build(titles, entities, vocabulary)
+    return index
+
+
+def resolve_names(query: str) -> List[NameMatch]:
+    return get_name_index().resolve(query)
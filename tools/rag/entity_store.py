@@ -0,0 +1,422 @@
+"""Typed records for heroes, enemies, trinkets and curios in a local SQLite db.
+
+Most questions are exact lookups ("what cleanses a Sacrificial Stone",
+"Vestal's trinkets", "Bone Defender resistances"). This module parses the
+interaction tables written by `dd_wiki_tool.extract_text` and the stat
+blocks at the top of hero/enemy pages into `EntityRecord` objects, stores
+them in ``<index dir>/entities.sqlite`` with indexes on name, category,
+class restriction and origin dungeon, and answers such questions with
+`structured_lookup` without scanning any text.
+"""
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from .chunker import Chunk, chunk_document, document_title, row_label
+from .disk_index import _scan_sources, default_index_dir
+from .file_loader import _default_root, _read_text
+
+
+SCHEMA_VERSION = 1
+DUNGEONS = ("Ruins", "Weald", "Cove", "Warrens", "Courtyard", "Farmstead", "Darkest Dungeon")
+
+_RESIST_RE = re.compile(r"(Stun|Move|Blight|Bleed|Disease|Debuff|Death Blow|Trap) ((?:[\d.]+% ?)+)")
+_HERO_STATS = {
+    "max_hp": re.compile(r"MAX HP ((?:\d+ ){4}\d+)"),
+    "dodge": re.compile(r"DODGE ((?:\d+ ){4}\d+)"),
+    "speed": re.compile(r"SPD ((?:\d+ ){4}\d+)"),
+    "crit": re.compile(r"CRIT ((?:[\d.]+% ){4}[\d.]+%)"),
+    "damage": re.compile(r"DMG ((?:\d+-\d+ ){4}\d+-\d+)"),
+}
+_ENEMY_RE = re.compile(
+    r"Enemy (?:Type|Class) (?P<type>.+?) Size (?P<size>.+?) Actions per round Stats"
+    r"(?: Variation (?P<variations>.+?))? HP (?P<hp>[\d. ]+?)(?: HP \(Stygian/Bloodmoon\) (?P<hp_stygian>[\d. ]+?))?"
+    r" Dodge (?P<dodge>[\d.% ]+?) Protection (?P<protection>[\d.% ]+?) Speed (?P<speed>[\d ]+?)"
+    r" Resistances (?P<resistances>(?:(?:Stun|Blight|Bleed|Debuff|Move|Disease) (?:[\d.]+% ?)+)+)"
+)
+_ICON_LIST_RE = re.compile(r"\[Íconos: ([^\]]*)\]")
+_PERCENT_RE = re.compile(r"^\d+(?:\.\d+)?%")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL COLLATE NOCASE,
+    name_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    category TEXT NOT NULL,
+    class_restriction TEXT COLLATE NOCASE,
+    origin_dungeon TEXT COLLATE NOCASE,
+    rarity TEXT,
+    source TEXT,
+    section TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entities_name ON entities (name_key);
+CREATE INDEX IF NOT EXISTS idx_entities_category ON entities (category, kind);
+CREATE INDEX IF NOT EXISTS idx_entities_class ON entities (class_restriction, kind);
+CREATE INDEX IF NOT EXISTS idx_entities_dungeon ON entities (origin_dungeon, kind);
+"""
+
+
+@dataclass
+class EntityRecord:
+    name: str
+    # "hero", "enemy", "trinket" or "curio"
+    kind: str
+    # corpus category of the page the record came from
+    category: str
+    source: str = ""
+    section: str = ""
+    class_restriction: str = ""
+    origin_dungeon: str = ""
+    rarity: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def merge(self, other: "EntityRecord"):
+        """Fill empty fields from another record describing the same entity."""
+        for attr in ("class_restriction", "origin_dungeon", "rarity", "section"):
+            if not getattr(self, attr) and getattr(other, attr):
+                setattr(self, attr, getattr(other, attr))
+        for k, v in other.data.items():
+            self.data.setdefault(k, v)
+
+    def summary(self) -> str:
+        parts = [f"{self.name} ({self.kind}"]
+        for label, value in (("class", self.class_restriction), ("dungeon", self.origin_dungeon), ("rarity", self.rarity)):
+            if value:
+                parts.append(f", {label}: {value}")
+        parts.append(")")
+        details = "; ".join(f"{k}: {_format_value(v)}" for k, v in self.data.items() if v not in ("", [], {}, None))
+        return "".join(parts) + (f" - {details}" if details else "")
+
+
+def _format_value(v) -> str:
+    if isinstance(v, dict):
+        return ", ".join(f"{k} {_format_value(x)}" for k, x in v.items())
+    if isinstance(v, list):
+        return " / ".join(_format_value(x) for x in v)
+    return str(v)
+
+
+def name_key(name: str) -> str:
+    return " ".join(re.findall(r"\w+", name.lower()))
+
+
+def _icons(cell: str) -> List[str]:
+    m = _ICON_LIST_RE.search(cell)
+    if not m:
+        return []
+    return [i.strip().removesuffix(".png") for i in m.group(1).split(",") if i.strip()]
+
+
+def _resistances(text: str) -> Dict[str, List[str]]:
+    return {name: values.split() for name, values in _RESIST_RE.findall(text)}
+
+
+def parse_hero(title: str, text: str, chunks: List[Chunk]) -> EntityRecord | None:
+    intro = next((c.raw(text) for c in chunks if c.kind == "text"), "")
+    if "MAX HP" not in intro:
+        return None
+    data: Dict[str, Any] = {}
+    for key, rx in _HERO_STATS.items():
+        m = rx.search(intro)
+        if m:
+            data[key] = m.group(1).split()
+    m = re.search(r"Base Resistances (.+?) Other information", intro)
+    if m:
+        data["resistances"] = {k: v[0] for k, v in _resistances(m.group(1)).items()}
+    m = re.search(r"Religious (Yes|No)", intro)
+    if m:
+        data["religious"] = m.group(1)
+    return EntityRecord(title, "hero", "heroes", section=title, data=data)
+
+
+def parse_enemies(title: str, text: str, chunks: List[Chunk]) -> List[EntityRecord]:
+    intro = next((c.raw(text) for c in chunks if c.kind == "text"), "")
+    dungeon = ""
+    for c in chunks:
+        parts = c.section.split(" > ")
+        if len(parts) >= 3 and parts[1] == "Related Enemies" and parts[2] in DUNGEONS:
+            dungeon = parts[2]
+            break
+
+    skills: Dict[str, List[str]] = {}
+    for c in chunks:
+        if c.kind == "row" and c.columns[:1] == ("Skill Name",):
+            level = c.section.split(" > ")[1]
+            skills.setdefault(level, []).append(c.fields(text).get("Skill Name", ""))
+
+    records = []
+    prev_end = 0
+    for m in _ENEMY_RE.finditer(intro):
+        name = intro[prev_end:m.start()].strip()
+        if not records or not name or len(name) > 40:
+            name = title
+        prev_end = m.end()
+        data = {
+            "type": m.group("type"),
+            "size": m.group("size"),
+            "variations": m.group("variations") or "",
+            "hp": m.group("hp").split(),
+            "hp_stygian": (m.group("hp_stygian") or "").split(),
+            "dodge": m.group("dodge").split(),
+            "protection": m.group("protection").split(),
+            "speed": m.group("speed").split(),
+            "resistances": _resistances(m.group("resistances")),
+        }
+        if name == title and skills:
+            data["skills"] = {level: [s for s in names if s] for level, names in skills.items()}
+        records.append(EntityRecord(name, "enemy", "enemies", section=title, origin_dungeon=dungeon, data=data))
+    return records
+
+
+def parse_table_rows(title: str, category: str, text: str, chunks: List[Chunk]) -> List[EntityRecord]:
+    records = []
+    for c in chunks:
+        if c.kind != "row" or not c.columns:
+            continue
+        if "Trinket Name" in c.columns:
+            f = c.fields(text)
+            name = f.get("Trinket Name")
+            if not name:
+                continue
+            data = {k: v for k, v in f.items() if k in ("Effect", "Set Effect", "Shard Cost", "Additional Notes")}
+            records.append(EntityRecord(
+                name, "trinket", category, section=c.section,
+                class_restriction=f.get("Class Restriction", ""),
+                origin_dungeon=f.get("Origin Dungeon", ""),
+                rarity=f.get("Rarity", ""), data=data,
+            ))
+        elif c.columns[0].startswith("Curio") and "Cleansing" in c.columns:
+            record = _parse_curio(c, text)
+            if record is not None:
+                record.category = category
+                records.append(record)
+    return records
+
+
+def _parse_curio(c: Chunk, text: str) -> EntityRecord | None:
+    cells = c.cells(text)
+    if len(cells) < 5:
+        return None
+    name = row_label(cells[1])
+    if not name:
+        return None
+    items = [i for i in _icons(cells[4]) if i != "Pass" and "curio tracker" not in i]
+    without = next((row_label(x) for x in cells[5:] if _PERCENT_RE.match(row_label(x))), "")
+    caption = c.section.split(" > ")[1]
+    dungeon = next((d for d in DUNGEONS if caption.endswith(d.replace(" ", ""))), "")
+    if not dungeon and "all dungeons" in caption:
+        dungeon = "All"
+    data = {
+        "type": row_label(cells[2]),
+        "description": row_label(cells[3]),
+        "cleansing_items": items,
+        "cleansing": row_label(cells[4]) if items else "none (no supply item has an effect)",
+        "without_cleansing": without,
+    }
+    return EntityRecord(name, "curio", "", section=c.section, origin_dungeon=dungeon, data=data)
+
+
+def extract_records(data_dir: Path) -> List[EntityRecord]:
+    """Parse every page under ``data_dir`` into merged `EntityRecord` objects."""
+    merged: Dict[Tuple[str, str], EntityRecord] = {}
+    for rel in _scan_sources(data_dir):
+        path = data_dir / rel
+        text = _read_text(path)
+        title = document_title(path)
+        category = rel.split("/")[0] if "/" in rel else ""
+        chunks = chunk_document(text, title)
+
+        found: List[EntityRecord] = []
+        if category == "heroes":
+            hero = parse_hero(title, text, chunks)
+            if hero is not None:
+                found.append(hero)
+        elif category == "enemies":
+            found.extend(parse_enemies(title, text, chunks))
+        found.extend(parse_table_rows(title, category, text, chunks))
+
+        for record in found:
+            record.source = rel
+            key = (record.kind, name_key(record.name))
+            if key in merged:
+                merged[key].merge(record)
+            else:
+                merged[key] = record
+    return list(merged.values())
+
+
+def _fingerprint(data_dir: Path) -> str:
+    entries = [(rel, st.st_size, st.st_mtime_ns) for rel, st in _scan_sources(data_dir).items()]
+    return hashlib.sha256(json.dumps([SCHEMA_VERSION, entries]).encode("utf-8")).hexdigest()
+
+
+def build_entity_store(root: Path = None, db_path: Path = None) -> int:
+    """(Re)create the entity database; returns the number of records."""
+    root = Path(root or _default_root()).resolve()
+    data_dir = root / "wiki_menu_data"
+    db_path = Path(db_path or default_index_dir(root) / "entities.sqlite")
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    records = extract_records(data_dir)
+    # unique per build, so concurrent builds (other processes) never share a temp file
+    tmp = db_path.with_name(f".{db_path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT INTO entities (name, name_key, kind, category, class_restriction, origin_dungeon, rarity, source, section, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(r.name, name_key(r.name), r.kind, r.category, r.class_restriction, r.origin_dungeon, r.rarity,
+              r.source, r.section, json.dumps(r.data, ensure_ascii=False)) for r in records],
+        )
+        conn.execute("INSERT INTO store_meta VALUES ('fingerprint', ?)", (_fingerprint(data_dir),))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(tmp, db_path)
+    return len(records)
+
+
+class EntityStore:
+    """Read-only access to a database written by `build_entity_store`."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._conn = self._connect()
+        self._lock = threading.Lock()
+        # name_key -> kinds, longest names first so "bone defender" wins over "bone"
+        rows = self._query("SELECT DISTINCT name_key, kind FROM entities")
+        self.names: Dict[str, List[str]] = {}
+        for key, kind in rows:
+            self.names.setdefault(key, []).append(kind)
+        self._ordered_names = sorted(self.names, key=len, reverse=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def fingerprint(self) -> str:
+        rows = self._query("SELECT value FROM store_meta WHERE key = 'fingerprint'")
+        return rows[0][0] if rows else ""
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        with self._lock:
+            if self._conn is None:
+                # closed by a rebuild while a caller still held this store; read the current file
+                self._conn = self._connect()
+            return self._conn.execute(sql, params).fetchall()
+
+    def find(self, name: str | None = None, kind: str | None = None, category: str | None = None,
+             class_restriction: str | None = None, origin_dungeon: str | None = None, limit: int = 50) -> List[EntityRecord]:
+        clauses, params = [], []
+        for column, value in (("name_key", name_key(name) if name else None), ("kind", kind), ("category", category),
+                              ("class_restriction", class_restriction), ("origin_dungeon", origin_dungeon)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(
+            "SELECT name, kind, category, source, section, class_restriction, origin_dungeon, rarity, data"
+            f" FROM entities{where} ORDER BY id LIMIT ?", tuple(params) + (limit,))
+        return [EntityRecord(*row[:8], data=json.loads(row[8] or "{}")) for row in rows]
+
+    def entries(self) -> List[Tuple[str, str]]:
+        """(display name, kind) of every entity."""
+        return self._query("SELECT DISTINCT name, kind FROM entities")
+
+    def mentioned(self, query: str) -> List[str]:
+        """Entity name keys that appear as whole words in ``query``, longest match first."""
+        q = f" {name_key(query)} "
+        found = []
+        for key in self._ordered_names:
+            if f" {key} " in q:
+                found.append(key)
+                q = q.replace(f" {key} ", "  ")
+        return found
+
+    def lookup(self, query: str, limit: int = 20) -> List[EntityRecord]:
+        """Records answering ``query``: list intents ("Vestal trinkets",
+        "Warrens curios") first, otherwise the entities named in it."""
+        q = name_key(query)
+        wants_trinkets = re.search(r"\btrinkets?\b", q) is not None
+        wants_curios = re.search(r"\bcurios?\b", q) is not None
+        names = self.mentioned(query)
+        dungeon = next((d for d in DUNGEONS if f" {name_key(d)} " in f" {q} "), None)
+
+        if wants_trinkets:
+            hero = next((n for n in names if "hero" in self.names[n]), None)
+            if hero:
+                # class restrictions use the display name ("Man-at-Arms"), not the key
+                hero_name = self.find(name=hero, kind="hero", limit=1)[0].name
+                return self.find(kind="trinket", class_restriction=hero_name, limit=limit)
+            if dungeon:
+                return self.find(kind="trinket", origin_dungeon=dungeon, limit=limit)
+        if wants_curios and dungeon and not any("curio" in self.names[n] for n in names):
+            return self.find(kind="curio", origin_dungeon=dungeon, limit=limit)
+
+        records = []
+        for key in names:
+            records.extend(self.find(name=key, limit=limit))
+        return records[:limit]
+
+
+_store: EntityStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_entity_store(root: Path = None) -> EntityStore:
+    """Shared `EntityStore`, rebuilt when the files under wiki_menu_data change."""
+    global _store
+    root = Path(root or _default_root()).resolve()
+    db_path = default_index_dir(root) / "entities.sqlite"
+    with _store_lock:
+        expected = _fingerprint(root / "wiki_menu_data")
+        if _store is not None and _store.db_path == db_path and _store.fingerprint() == expected:
+            return _store
+        store = EntityStore(db_path) if db_path.exists() else None
+        if store is None or store.fingerprint() != expected:
+            if store is not None:
+                store.close()
+            print(f"[entity_store] Building {db_path}.")
+            build_entity_store(root, db_path)
+            store = EntityStore(db_path)
+        if _store is not None:
+            _store.close()
+        _store = store
+        return _store
+
+
+def structured_lookup(query: str, limit: int = 20) -> Dict[str, Any]:
+    """Answer exact lookups (stats, resistances, trinkets, curio cleansing) from the entity store."""
+    # entity_names builds its index from this module
+    from .entity_names import expand_query, resolve_names
+
+    print(f"   [BEGIN Tool Action] Executing structured lookup: {query} [END Tool Action]")
+    corrected = [m for m in resolve_names(query) if m.corrected]
+    records = get_entity_store().lookup(expand_query(query, corrected), limit=limit)
+    if not records:
+        answer = "No structured record matched; try local_search."
+    else:
+        answer = "\n".join(f"- {r.summary()}" for r in records)
+    if corrected:
+        answer = f"Interpreted {', '.join(f'{m.text!r} as {m.name}' for m in corrected)}.\n" + answer
+    return {"query": query, "resolved": [asdict(m) for m in corrected], "matches": [asdict(r) for r in records],
+            "answer": answer}
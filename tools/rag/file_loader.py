@@ -1,16 +1,26 @@
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
+import threading
+import time
+
+from tools.tracing import span
 
 
 class Corpus:
 
-    def __init__(self, docs: Dict[Path, str]):
+    def __init__(self, docs: Dict[Path, str], meta: Dict[Path, dict] | None = None, generation: int = 0):
         self.docs = docs
+        # per-document metadata, filled by CorpusStore (computed lazily otherwise)
+        self.meta = meta or {}
+        # bumped by CorpusStore every time a file is added, changed or removed
+        self.generation = generation
+        # derived artifacts (e.g. retrieval indexes) built from this snapshot
+        self.derived: Dict[str, object] = {}
 
     def items(self):
         return list(self.docs.items())
 
-    def documents(self, data_root: Path):
+    def documents(self, data_root: Path = None):
         """Return a list of tuples (path, text, metadata)
 
         Metadata includes:
@@ -20,21 +30,143 @@ class Corpus:
         """
         docs = []
         for p, text in self.items():
-            try:
-                rel = p.relative_to(data_root)
-            except Exception:
-                rel = p
-            parts = rel.parts
-            category = parts[0] if len(parts) > 1 else ""
-            meta = {"title": p.stem, "category": category, "relative_path": str(rel)}
+            meta = self.meta.get(p)
+            if meta is None:
+                meta = _document_meta(p, data_root)
             docs.append((p, text, meta))
         return docs
 
 
+def _default_root() -> Path:
+    return Path(__file__).resolve().parents[2]
+
+
+def _document_meta(p: Path, data_root: Path | None) -> dict:
+    rel = p
+    if data_root is not None:
+        try:
+            rel = p.relative_to(data_root)
+        except Exception:
+            rel = p
+    parts = rel.parts
+    category = parts[0] if len(parts) > 1 else ""
+    return {"title": p.stem, "category": category, "relative_path": str(rel)}
+
+
+def _read_text(p: Path) -> str:
+    try:
+        return p.read_text(encoding="utf-8")
+    except Exception:
+        # fallback to default encoding
+        return p.read_text(errors="ignore")
+
+
+class CorpusStore:
+    """Process-wide, incrementally refreshed view of ``wiki_menu_data``.
+
+    Files are read once and kept in memory together with their metadata.
+    On access the store re-stats the tree (at most every ``check_interval``
+    seconds) and re-reads only files whose mtime or size changed. The
+    returned `Corpus` object stays the same between accesses unless
+    something changed, so indexes cached on it remain valid.
+    """
+
+    def __init__(self, root: Path = None, check_interval: float = 2.0):
+        if root is None:
+            root = _default_root()
+        self.root = Path(root).resolve()
+        self.data_dir = self.root / "wiki_menu_data"
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # resolved path -> (mtime_ns, size)
+        self._stats: Dict[Path, Tuple[int, int]] = {}
+        self._corpus: Corpus | None = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.generation = 0
+
+    def get(self, force_check: bool = False) -> Corpus:
+        with self._lock:
+            now = time.monotonic()
+            if self._corpus is not None and not force_check and now - self._checked_at < self.check_interval:
+                self.hits += 1
+                return self._corpus
+            with span("corpus.load") as s:
+                reloads = self.reloads
+                changed = self._refresh()
+                s.set(cache="miss" if changed else "hit", files=len(self._stats), reloaded=self.reloads - reloads,
+                      bytes=sum(size for _, size in self._stats.values()) if changed else 0)
+            self._checked_at = now
+            if changed:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self._corpus
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        found = {}
+        if not self.data_dir.exists():
+            return found
+        for p in self.data_dir.rglob("*.txt"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            found[p] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def _refresh(self) -> bool:
+        found = self._scan()
+        if self._corpus is not None and found == self._stats:
+            return False
+
+        old = self._corpus
+        docs: Dict[Path, str] = {}
+        meta: Dict[Path, dict] = {}
+        for p, stat in sorted(found.items()):
+            if old is not None and self._stats.get(p) == stat and p in old.docs:
+                docs[p] = old.docs[p]
+                meta[p] = old.meta[p]
+                continue
+            docs[p] = _read_text(p)
+            meta[p] = _document_meta(p, self.data_dir)
+            self.reloads += 1
+
+        self.generation += 1
+        self._stats = found
+        self._corpus = Corpus(docs, meta, generation=self.generation)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "generation": self.generation,
+            "documents": len(self._stats),
+        }
+
+
+_stores: Dict[Path, CorpusStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_corpus_store(root: Path = None) -> CorpusStore:
+    """Return the shared `CorpusStore` for ``root`` (created on first use)."""
+    key = Path(root).resolve() if root is not None else _default_root()
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = CorpusStore(key)
+        return store
+
+
 def load_corpus(root: Path = None) -> Corpus:
 
     if root is None:
-        root = Path(__file__).resolve().parents[2]
+        root = _default_root()
 
     data_dir = root / "wiki_menu_data"
     docs = {}
@@ -42,17 +174,12 @@ def load_corpus(root: Path = None) -> Corpus:
         return Corpus(docs)
 
     for p in data_dir.rglob("*.txt"):
-        try:
-            text = p.read_text(encoding="utf-8")
-        except Exception:
-            # fallback to default encoding
-            text = p.read_text(errors="ignore")
-        docs[p] = text
+        docs[p] = _read_text(p)
 
     return Corpus(docs)
 
 
-def load_corpus_documents(root: Path = None):
+def load_corpus_documents(root: Path = None) -> List[tuple]:
     """Helper that returns a list of (path, text, metadata) for each file.
 
     This is useful when you want per-document metadata (category/title) for
@@ -61,7 +188,7 @@ def load_corpus_documents(root: Path = None):
     compatibility.
     """
     if root is None:
-        root = Path(__file__).resolve().parents[2]
+        root = _default_root()
 
     data_dir = root / "wiki_menu_data"
     corpus = load_corpus(root)
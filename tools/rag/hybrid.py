@@ -0,0 +1,67 @@
+"""Hybrid lexical + dense retrieval with reciprocal-rank fusion.
+
+Both backends are queried concurrently with the same category pre-filter
+and their per-document rankings are fused with RRF (Cormack et al., 2009):
+``score(d) = sum(1 / (k + rank_b(d)))`` over the backends that returned d.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+import re
+
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-hybrid")
+
+
+def _normalize(s: str) -> str:
+    return " ".join(re.findall(r"\w+", s.lower().replace("_", " ")))
+
+
+def infer_categories(query: str, documents: Iterable[Tuple[Path, dict]]) -> Set[str]:
+    """Categories of the documents whose title appears in ``query``.
+
+    "Bone Defender resistances" -> {"enemies"}; an empty set means no title
+    matched and the whole corpus should be searched.
+    """
+    q = f" {_normalize(query)} "
+    found = set()
+    for _, meta in documents:
+        title = _normalize(meta.get("title", ""))
+        if title and f" {title} " in q and meta.get("category"):
+            found.add(meta["category"])
+    return found
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[Path, str, float]]], k: int = 60) -> List[Tuple[Path, str, float]]:
+    """Fuse per-document rankings; each document keeps the snippet from its best rank."""
+    fused: Dict[Path, float] = {}
+    best: Dict[Path, Tuple[int, str]] = {}
+    for ranking in rankings:
+        for rank, (path, snippet, _) in enumerate(ranking, start=1):
+            fused[path] = fused.get(path, 0.0) + 1.0 / (k + rank)
+            if path not in best or rank < best[path][0]:
+                best[path] = (rank, snippet)
+    ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+    return [(path, best[path][1], round(score, 6)) for path, score in ranked]
+
+
+class HybridRetriever:
+    """Runs a lexical and a dense index side by side and fuses their results."""
+
+    def __init__(self, lexical, dense, k: int = 60, depth: int = 20):
+        self.lexical = lexical
+        self.dense = dense
+        self.k = k
+        self.depth = depth
+
+    def meta(self, path: Path) -> dict:
+        return self.dense.meta(path) or self.lexical.meta(path)
+
+    def search(self, query: str, top: int = 3, categories: Iterable[str] | None = None) -> List[Tuple[Path, str, float]]:
+        depth = max(self.depth, top * 4)
+        categories = list(categories) if categories else None
+        futures = [
+            _executor.submit(self.lexical.search, query, depth, categories),
+            _executor.submit(self.dense.search, query, depth, categories),
+        ]
+        return reciprocal_rank_fusion([f.result() for f in futures], k=self.k)[:top]
@@ -1,25 +1,111 @@
 from pathlib import Path
 import argparse
-from .file_loader import load_corpus, load_corpus_documents
-from .retriever import retrieve
-from .qa_tool import answer_from_snippets
-from typing import Dict, Any
+import os
+from .file_loader import get_corpus_store
+from .retriever import get_index
+from .disk_index import get_disk_index
+from .entity_names import expand_query, get_name_index, resolve_names
+from .dense_index import get_dense_index
+from .hybrid import HybridRetriever, infer_categories
+from .qa_tool import DEFAULT_BUDGET, pack_snippets
+from tools.tracing import span
+from typing import Dict, Any, List, Set, Tuple
+from dataclasses import asdict
 
 
-def rag_tool(query: str, top: int = 3) -> Dict[str, Any]:
-	print(f"   [BEGIN Tool Action] Executing RAG search: {query} [END Tool Action]")
-	# load documents with metadata so we can enrich results
-	docs_with_meta = load_corpus_documents()
-	# build a lookup map by resolved path string
-	meta_by_path = {str(p.resolve()): meta for p, _, meta in docs_with_meta}
+def _search_index(backend: str):
+	"""Index used by rag_tool.
+
+	backend "dense" uses the embedding index, "hybrid" fuses it with the
+	keyword index; "bm25" uses the mmapped on-disk index unless
+	RAG_INDEX=memory.
+	"""
+	if backend == "dense":
+		return get_dense_index(get_corpus_store().get())
+	if backend == "hybrid":
+		return HybridRetriever(_search_index("bm25"), _search_index("dense"))
+	if backend != "bm25":
+		raise ValueError(f"unknown RAG backend: {backend!r}")
+	if os.getenv("RAG_INDEX", "disk") != "memory":
+		try:
+			return get_disk_index()
+		except (OSError, ValueError) as e:
+			# ValueError: index files from different builds (a rebuild elsewhere was still writing)
+			print(f"[rag_tool] On-disk index unavailable ({e}), using in-memory index.")
+	# shared in-memory corpus; only changed files are re-read between queries
+	corpus = get_corpus_store().get()
+	return get_index(corpus)
+
+
+def _categories(query: str, backend: str, category: str | None):
+	if category:
+		return [c.strip() for c in category.split(",") if c.strip()]
+	if backend == "hybrid":
+		# narrow to the sub-corpora of any document title named in the query
+		docs = [(p, meta) for p, _, meta in get_corpus_store().get().documents()]
+		return sorted(infer_categories(query, docs)) or None
+	return None
+
+
+def _boost(snippets: List[Tuple[Path, str, float]], titles: Set[str], factor: float) -> List[Tuple[Path, str, float]]:
+	"""Raise the score of passages from the pages of names resolved in the query."""
+	if not titles or not factor:
+		return snippets
+	boosted = [(p, snip, round(score * (1 + factor), 4) if Path(p).stem in titles else score) for p, snip, score in snippets]
+	return sorted(boosted, key=lambda s: s[2], reverse=True)
+
 
-	corpus = load_corpus()
-	snippets = retrieve(corpus, query, top=top)
-	answer = answer_from_snippets(snippets, query)
+def warm_up(backend: str | None = None) -> Dict[str, Any]:
+	"""Load the corpus and open (or build) the search index before the first query."""
+	backend = backend or os.getenv("RAG_BACKEND", "bm25")
+	corpus = get_corpus_store().get()
+	index = _search_index(backend)
+	# touch the postings so the first real query does not page them in
+	index.search("warm up", top=1)
+	return {"backend": backend, "documents": len(corpus.docs), "index": type(index).__name__, "names": len(get_name_index())}
+
+
+def rag_tool(query: str, top: int = 3, backend: str | None = None, category: str | None = None) -> Dict[str, Any]:
+	"""Search the local wiki files.
+
+	backend: "bm25" (default), "dense" or "hybrid"; falls back to the
+	RAG_BACKEND env var.
+	category: optional comma-separated categories (heroes, enemies,
+	locations, general) to search; hybrid mode infers them from the query.
+
+	The snippets are packed into one observation ("answer") of at most
+	RAG_CONTEXT_TOKENS tokens; "results" lists the sources that made it in.
+
+	Misspelled or abbreviated names ("vestle", "plague doc") are resolved
+	first: their canonical names are added to the search query and passages
+	from their pages get a RAG_ENTITY_BOOST (default 0.5) score boost.
+	"""
+	print(f"   [BEGIN Tool Action] Executing RAG search: {query} [END Tool Action]")
+	backend = backend or os.getenv("RAG_BACKEND", "bm25")
+	with span("names.resolve") as s:
+		names = resolve_names(query)
+		corrected = [m for m in names if m.corrected]
+		search_query = expand_query(query, corrected)
+		s.set(names=len(names), corrected=len(corrected))
+	with span("rag.index", backend=backend):
+		index = _search_index(backend)
+		categories = _categories(search_query, backend, category)
+	# over-fetch; the packer keeps what fits the budget
+	with span("rag.search", backend=backend, top=top * 2) as s:
+		snippets = index.search(search_query, top=top * 2, categories=categories)
+		snippets = _boost(snippets, {m.title for m in names if m.title}, float(os.getenv("RAG_ENTITY_BOOST", "0.5")))
+		s.set(results=len(snippets))
+	label = query
+	if corrected:
+		label += f" (interpreted {', '.join(f'{m.text!r} as {m.name}' for m in corrected)})"
+	with span("rag.pack") as s:
+		packed = pack_snippets(snippets, label, budget=int(os.getenv("RAG_CONTEXT_TOKENS", str(DEFAULT_BUDGET))))
+		s.set(tokens=packed.tokens, passages=len(packed.passages), duplicates=packed.duplicates, dropped=packed.dropped)
 
 	results = []
-	for p, snip, score in snippets:
-		meta = meta_by_path.get(str(p.resolve()), {})
-		results.append({"path": str(p), "snippet": snip, "score": score, "meta": meta})
+	for p, _, score in packed.passages:
+		meta = index.meta(p)
+		results.append({"path": str(p), "score": score, "meta": meta})
 
-	return {"query": query, "results": results, "answer": answer}
+	return {"query": query, "categories": categories or [], "resolved": [asdict(m) for m in corrected], "results": results,
+		"answer": packed.text, "tokens": packed.tokens}
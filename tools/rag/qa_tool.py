@@ -1,25 +1,88 @@
+from dataclasses import dataclass, field
 from typing import List, Tuple
 from pathlib import Path
+import re
 
+# token budget of one packed observation
+DEFAULT_BUDGET = 600
 
-def answer_from_snippets(snippets: List[Tuple[Path, str, int]], query: str) -> str:
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+def _display_path(path: Path) -> str:
+    path = Path(path)
+    return path.relative_to(path.parents[2]).as_posix() if len(path.parents) > 2 else str(path)
+
+
+def _body(snippet: str) -> str:
+    """Snippet without its "[section] " prefix, for overlap checks."""
+    return re.sub(r"^\[[^\]]*\]\s*", "", snippet)
+
+
+def _overlaps(a: str, b: str, threshold: float = 0.8) -> bool:
+    if a in b or b in a:
+        return True
+    wa, wb = set(re.findall(r"\w+", a.lower())), set(re.findall(r"\w+", b.lower()))
+    if not wa or not wb:
+        return False
+    return len(wa & wb) / min(len(wa), len(wb)) >= threshold
+
+
+@dataclass
+class PackedContext:
+    text: str
+    # estimated tokens of ``text``
+    tokens: int
+    passages: List[Tuple[Path, str, float]] = field(default_factory=list)
+    duplicates: int = 0
+    # passages left out because they did not fit the budget
+    dropped: int = 0
+
+
+def pack_snippets(snippets: List[Tuple[Path, str, float]], query: str, budget: int = DEFAULT_BUDGET) -> PackedContext:
+    """Pack retrieved snippets into one observation of at most ``budget`` tokens.
+
+    Snippets that repeat or mostly overlap a better-scored one are dropped.
+    The best-scored snippet goes in first, the rest by score per token; a
+    snippet that does not fit is skipped whole, so a chunk or table row is
+    never cut in half. Passages are listed in score order.
+    """
     if not snippets:
-        return "No relevant information found in local knowledge files."
-
-    parts = [f"Query: {query}\n"]
-    parts.append("Top results:\n")
-    for path, snip, score in snippets:
-        parts.append(f"- {path.relative_to(path.parents[2])} (score={score})\n")
-        preview = snip.replace("\n", " ")
-        if len(preview) > 400:
-            preview = preview[:400].rsplit(" ", 1)[0] + "..."
-        parts.append(f"  {preview}\n")
-
-    parts.append("\nAnswer (combined snippets):\n")
-    combined = "\n\n".join(s for _, s, _ in snippets)
-    if len(combined) > 3000:
-        combined = combined[:3000] + "..."
-
-    parts.append(combined)
-    return "\n".join(parts)
+        text = "No relevant information found in local knowledge files."
+        return PackedContext(text, estimate_tokens(text))
+
+    unique: List[Tuple[Path, str, float]] = []
+    duplicates = 0
+    for path, snip, score in sorted(snippets, key=lambda s: s[2], reverse=True):
+        if any(_overlaps(_body(snip), _body(kept)) for _, kept, _ in unique):
+            duplicates += 1
+            continue
+        unique.append((path, snip, score))
+
+    def block(i: int, path: Path, snip: str, score: float) -> str:
+        return f"[{i}] {_display_path(path)} (score={score})\n{snip.strip()}"
+
+    header = f"Query: {query}"
+    used = estimate_tokens(header)
+    costs = [estimate_tokens(block(0, *s)) + 1 for s in unique]
+    chosen = []
+    order = [0] + sorted(range(1, len(unique)), key=lambda i: unique[i][2] / costs[i], reverse=True)
+    for i in order:
+        if used + costs[i] <= budget:
+            chosen.append(i)
+            used += costs[i]
+    chosen.sort()
+
+    passages = [unique[i] for i in chosen]
+    if not passages:
+        # even the best snippet is over budget; give it alone rather than nothing
+        passages = unique[:1]
+    text = "\n\n".join([header] + [block(n, *p) for n, p in enumerate(passages, start=1)])
+    return PackedContext(text, estimate_tokens(text), passages, duplicates, len(unique) - len(passages))
+
+
+def answer_from_snippets(snippets: List[Tuple[Path, str, float]], query: str, budget: int = DEFAULT_BUDGET) -> str:
+    return pack_snippets(snippets, query, budget).text
@@ -1,10 +1,19 @@
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple
 from pathlib import Path
+from collections import Counter
+import math
 import re
+import threading
+
+from .chunker import Chunk, chunk_document, document_title
+from .compaction import CompactionReport, compact_corpus
+
+
+_TOKEN_RE = re.compile(r"\w+")
 
 
 def _tokenize(s: str) -> List[str]:
-    return re.findall(r"\w+", s.lower())
+    return _TOKEN_RE.findall(s.lower())
 
 
 def score_text(query_tokens, text: str) -> int:
@@ -15,7 +24,127 @@ def score_text(query_tokens, text: str) -> int:
     return s
 
 
-def retrieve(corpus, query: str, top: int = 3) -> List[Tuple[Path, str, int]]:
+class InvertedIndex:
+    """Chunk-level BM25 index over a `Corpus`.
+
+    Built once per corpus snapshot; a query only touches the postings of its
+    own terms instead of re-tokenizing every paragraph.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # chunk id -> (path, chunk); see tools.rag.chunker
+        self.chunks: List[Tuple[Path, Chunk]] = []
+        self.categories: List[str] = []
+        self.lengths: List[int] = []
+        # term -> ([chunk ids], [term frequencies])
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.texts: Dict[Path, str] = {}
+        self.doc_meta: Dict[Path, dict] = {}
+        self.avg_length = 0.0
+        self.compaction: CompactionReport | None = None
+
+    @classmethod
+    def build(cls, corpus, **kwargs) -> "InvertedIndex":
+        index = cls(**kwargs)
+        index.doc_meta = dict(getattr(corpus, "meta", {}))
+        items = sorted(corpus.items())
+        chunked, index.compaction = compact_corpus((path, content, document_title(path)) for path, content in items)
+        for path, content in items:
+            index.add_document(path, content, chunked[path])
+        index.finalize()
+        return index
+
+    def add_document(self, path: Path, content: str, chunks: List[Chunk] | None = None):
+        """Index ``chunks`` of ``content`` (default: all of its chunks, uncompacted)."""
+        self.texts[path] = content
+        category = self.doc_meta.get(path, {}).get("category", "")
+        for chunk in chunks if chunks is not None else chunk_document(content, document_title(path)):
+            if chunk.kind == "header":
+                continue
+            pid = len(self.chunks)
+            # the section path ("Vestal > Combat Skills > ...") is searchable too
+            tokens = _tokenize(chunk.section + " " + chunk.raw(content))
+            self.chunks.append((path, chunk))
+            self.categories.append(category)
+            self.lengths.append(chunk.length or len(tokens))
+            for term, tf in Counter(tokens).items():
+                ids, tfs = self.postings.setdefault(term, ([], []))
+                ids.append(pid)
+                tfs.append(tf)
+
+    def finalize(self):
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        n = len(self.chunks)
+        df = len(self.postings.get(term, ((), ()))[0])
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str, categories: Iterable[str] | None = None) -> Dict[int, float]:
+        """Return BM25 scores for every chunk matching at least one query term.
+
+        ``categories`` restricts scoring to chunks of those document categories.
+        """
+        scores: Dict[int, float] = {}
+        avg = self.avg_length or 1.0
+        k1, b = self.k1, self.b
+        lengths = self.lengths
+        allowed = set(categories) if categories else None
+        chunk_categories = self.categories
+        for term, qtf in Counter(_tokenize(query)).items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            weight = self.idf(term) * qtf
+            for pid, tf in zip(*posting):
+                if allowed is not None and chunk_categories[pid] not in allowed:
+                    continue
+                norm = k1 * (1 - b + b * lengths[pid] / avg)
+                scores[pid] = scores.get(pid, 0.0) + weight * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def snippet(self, pid: int) -> str:
+        path, chunk = self.chunks[pid]
+        return chunk.render(self.texts[path])[:2000]
+
+    def meta(self, path: Path) -> dict:
+        return self.doc_meta.get(path, {})
+
+    def search(self, query: str, top: int = 3, categories: Iterable[str] | None = None) -> List[Tuple[Path, str, float]]:
+        """Best-scoring chunk per document, ``top`` documents overall."""
+        best: Dict[Path, Tuple[float, int]] = {}
+        for pid, sc in self.score(query, categories).items():
+            path = self.chunks[pid][0]
+            current = best.get(path)
+            if current is None or sc > current[0]:
+                best[path] = (sc, pid)
+
+        ranked = sorted(best.items(), key=lambda x: x[1][0], reverse=True)[:top]
+        return [(path, self.snippet(pid), round(sc, 4)) for path, (sc, pid) in ranked]
+
+
+_build_lock = threading.Lock()
+
+
+def get_index(corpus) -> InvertedIndex:
+    """Return the BM25 index for ``corpus``, building it on first use."""
+    if not hasattr(corpus, "derived"):
+        return InvertedIndex.build(corpus)
+    with _build_lock:
+        index = corpus.derived.get("bm25")
+        if index is None:
+            index = corpus.derived["bm25"] = InvertedIndex.build(corpus)
+        return index
+
+
+def retrieve(corpus, query: str, top: int = 3, categories: Iterable[str] | None = None) -> List[Tuple[Path, str, float]]:
+    return get_index(corpus).search(query, top=top, categories=categories)
+
+
+def retrieve_linear(corpus, query: str, top: int = 3) -> List[Tuple[Path, str, int]]:
+    """Original term-count scorer; kept as the baseline for benchmarks."""
 
     tokens = _tokenize(query)
     results = []
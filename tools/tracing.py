@@ -0,0 +1,217 @@
+"""Lightweight structured spans for the agent, RAG and web pipeline.
+
+``with span("rag.search", backend="bm25") as s: ...; s.set(results=3)``
+records the duration and attributes of a stage. Spans nest through
+contextvars (use `submit` to carry the current span into a thread pool),
+every finished span updates the in-memory aggregates returned by
+`stats()`, and when ``TRACE_FILE`` is set each span is appended to that
+file as one JSON line. With ``TRACE_OTEL=1`` and the ``opentelemetry-api``
+package installed, every span (including those opened with `start_span`
+by callbacks) is mirrored to the configured OpenTelemetry tracer as well.
+
+Conventional attributes: ``bytes``, ``tokens``, ``prompt_tokens``,
+``completion_tokens`` and ``cache`` ("hit", "miss", ...).
+"""
+from collections import deque
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+import contextvars
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("dd_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_file_lock = threading.Lock()
+_otel_tracer = None
+_otel_checked = False
+
+# last durations kept per span name for percentiles
+WINDOW = 1000
+
+
+class Span:
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        parent = _current.get()
+        self.name = name
+        self.span_id = next(_ids)
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = 0.0
+        self.error: str | None = None
+        self._token = None
+        # mirrored OpenTelemetry span and its context token (TRACE_OTEL=1)
+        self._otel = None
+        self._otel_token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+               "start": round(self.start, 6), "duration_ms": round(self.duration_ms, 3), "thread": threading.current_thread().name}
+        if self.error:
+            out["error"] = self.error
+        out.update(self.attrs)
+        return out
+
+
+class _Aggregate:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.durations: Deque[float] = deque(maxlen=WINDOW)
+        self.sums: Dict[str, float] = {}
+        self.cache: Dict[str, int] = {}
+
+    def add(self, s: Span):
+        self.count += 1
+        self.errors += s.error is not None
+        self.total_ms += s.duration_ms
+        self.durations.append(s.duration_ms)
+        for key in ("bytes", "tokens", "prompt_tokens", "completion_tokens"):
+            value = s.attrs.get(key)
+            if isinstance(value, (int, float)):
+                self.sums[key] = self.sums.get(key, 0) + value
+        if s.attrs.get("cache") is not None:
+            self.cache[str(s.attrs["cache"])] = self.cache.get(str(s.attrs["cache"]), 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        durations = sorted(self.durations)
+
+        def pct(p):
+            # nearest rank
+            return round(durations[max(0, math.ceil(p / 100 * len(durations)) - 1)], 3) if durations else 0.0
+
+        out = {"count": self.count, "errors": self.errors, "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+               "p50_ms": pct(50), "p95_ms": pct(95), "max_ms": round(durations[-1], 3) if durations else 0.0}
+        out.update({k: round(v, 3) for k, v in self.sums.items()})
+        if self.cache:
+            out["cache"] = dict(self.cache)
+        return out
+
+
+_aggregates: Dict[str, _Aggregate] = {}
+
+
+def _otel():
+    global _otel_tracer, _otel_checked
+    if not _otel_checked:
+        _otel_checked = True
+        if os.getenv("TRACE_OTEL", "0") == "1":
+            try:
+                from opentelemetry import trace
+
+                _otel_tracer = trace.get_tracer("partykeeper")
+            except ImportError:
+                print("[tracing] TRACE_OTEL=1 but opentelemetry-api is not installed.")
+    return _otel_tracer
+
+
+def _otel_value(v):
+    return v if isinstance(v, (str, bool, int, float)) else json.dumps(v, default=str)
+
+
+def _export(s: Span):
+    with _lock:
+        agg = _aggregates.get(s.name)
+        if agg is None:
+            agg = _aggregates[s.name] = _Aggregate()
+        agg.add(s)
+    path = os.getenv("TRACE_FILE")
+    if path:
+        line = json.dumps(s.to_dict(), default=str, ensure_ascii=False)
+        with _file_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def start_span(name: str, **attrs) -> Span:
+    """Open a span that is ended explicitly with `end_span` (for callback APIs).
+
+    The span is the parent of spans opened until it ends; start and end
+    must run in the same context (thread or task).
+    """
+    s = Span(name, attrs)
+    s._token = _current.set(s)
+    tracer = _otel()
+    if tracer:
+        from opentelemetry import context, trace
+
+        s._otel = tracer.start_span(name)
+        s._otel_token = context.attach(trace.set_span_in_context(s._otel))
+    return s
+
+
+def _end_otel(s: Span, error: BaseException | None):
+    from opentelemetry import context
+    from opentelemetry.trace import Status, StatusCode
+
+    for k, v in s.attrs.items():
+        if v is not None:
+            s._otel.set_attribute(f"dd.{k}", _otel_value(v))
+    if error is not None:
+        s._otel.record_exception(error)
+        s._otel.set_status(Status(StatusCode.ERROR, repr(error)))
+    try:
+        context.detach(s._otel_token)
+    except Exception:
+        pass
+    s._otel.end()
+    s._otel = s._otel_token = None
+
+
+def end_span(s: Span, error: BaseException | None = None, **attrs):
+    s.duration_ms = (time.perf_counter() - s._t0) * 1000
+    s.attrs.update(attrs)
+    if error is not None:
+        s.error = repr(error)
+    if s._token is not None:
+        try:
+            _current.reset(s._token)
+        except ValueError:
+            # ended in another context; nothing to restore there
+            pass
+        s._token = None
+    if s._otel is not None:
+        _end_otel(s, error)
+    _export(s)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    s = start_span(name, **attrs)
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        end_span(s, error)
+
+
+def submit(executor: Executor, fn, *args, **kwargs) -> Future:
+    """``executor.submit`` that runs ``fn`` inside the caller's span context."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Aggregates per span name: count, errors, mean/p50/p95/max ms, summed bytes/tokens, cache outcomes."""
+    with _lock:
+        return {name: agg.summary() for name, agg in sorted(_aggregates.items())}
+
+
+def reset():
+    with _lock:
+        _aggregates.clear()
@@ -0,0 +1,92 @@
+"""On-disk cache of extracted wiki page text, keyed by URL.
+
+Entries keep the ``ETag``/``Last-Modified`` validators of the response they
+came from. Within ``ttl`` seconds a page is served straight from the cache;
+after that it is revalidated with a conditional request and a ``304`` only
+refreshes the timestamp. In offline mode nothing is fetched at all.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+import sqlite3
+import threading
+import time
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    final_url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    text TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class CachedPage:
+    url: str
+    final_url: str
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+    text: str
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional GET of this page."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    def __init__(self, db_path: Path, ttl: float = 7 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get(self, url: str) -> CachedPage | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, final_url, etag, last_modified, fetched_at, text FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        return CachedPage(*row) if row else None
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at < self.ttl
+
+    def put(self, page: CachedPage):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (page.url, page.final_url, page.etag, page.last_modified, page.fetched_at, page.text),
+            )
+            self._conn.commit()
+
+    def count(self, outcome: str):
+        """Count a lookup outcome: "hits", "revalidated" or "misses"."""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def touch(self, page: CachedPage, etag: str | None = None, last_modified: str | None = None):
+        """Mark ``page`` as revalidated now (after a ``304 Not Modified``)."""
+        page.fetched_at = time.time()
+        page.etag = etag or page.etag
+        page.last_modified = last_modified or page.last_modified
+        self.put(page)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses, "entries": entries}
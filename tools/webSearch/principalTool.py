@@ -1,58 +1,124 @@
 from __future__ import annotations
+import os
 import requests
 import urllib.parse
-import re
-from html import unescape
-from typing import Dict
-from bs4 import BeautifulSoup
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Tuple
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-BASE = "https://darkestdungeon.wiki.gg"
+from tools.rag.disk_index import default_index_dir
+from tools.tracing import span
+from tools.webSearch.page_cache import CachedPage, PageCache
+from tools.wiki_extract import main_text
 
+BASE = os.getenv("WEB_SEARCH_BASE", "https://darkestdungeon.wiki.gg")
+HEADERS = {"User-Agent": "PartyKeeperBot/1.0 (+https://example.local)"}
 
-def _fetch_url(path: str, params: Dict | None = None, timeout: int = 10):
-    session = requests.Session()
-    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
-    session.mount("https://", HTTPAdapter(max_retries=retries))
 
-    url = BASE + path
+class PageNotCached(LookupError):
+    """Raised in offline mode when a page is not in the page cache."""
+
+
+_session: requests.Session | None = None
+_cache: PageCache | None = None
+_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Process-wide session, so connections (and TLS handshakes) are reused."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+            pool = int(os.getenv("WEB_SEARCH_POOL", "8"))
+            session.mount("https://", HTTPAdapter(max_retries=retries, pool_connections=pool, pool_maxsize=pool))
+            session.mount("http://", HTTPAdapter(max_retries=retries, pool_connections=pool, pool_maxsize=pool))
+            session.headers.update(HEADERS)
+            _session = session
+        return _session
+
+
+def _get_cache() -> PageCache:
+    global _cache
+    with _lock:
+        if _cache is None:
+            path = os.getenv("WEB_CACHE_PATH") or default_index_dir() / "web_pages.sqlite"
+            _cache = PageCache(Path(path), ttl=float(os.getenv("WEB_CACHE_TTL", str(7 * 24 * 3600))))
+        return _cache
+
+
+def _offline() -> bool:
+    return os.getenv("WEB_SEARCH_OFFLINE", "0") == "1"
+
+
+def _build_url(path: str, params: Dict | None = None, base: str | None = None) -> str:
+    url = (base or BASE) + path
     if params:
         url += "?" + urllib.parse.urlencode(params)
-    headers = {"User-Agent": "PartyKeeperBot/1.0 (+https://example.local)"}
-    resp = session.get(url, timeout=timeout, headers=headers)
-    resp.raise_for_status()
-    return resp.text, resp.url
+    return url
 
 
-def extract_main_content(html_text: str, max_chars: int = 20000) -> str:
-    soup = BeautifulSoup(html_text, "lxml") if html_text else None
-    if not soup:
-        return ""
+def _fetch_url(path: str, params: Dict | None = None, timeout: int = 10, headers: Dict | None = None,
+               base: str | None = None) -> requests.Response:
+    resp = _get_session().get(_build_url(path, params, base), timeout=timeout, headers=headers)
+    if resp.status_code != 304:
+        resp.raise_for_status()
+    return resp
+
 
-    content = soup.select_one(".mw-parser-output")
-    if content is None:
-        content = soup.find("main") or soup.body
-        if content is None:
-            return ""
+def fetch_page(path: str, params: Dict | None = None, timeout: int = 10, base: str | None = None) -> Tuple[str, str]:
+    """Extracted text and final URL of a wiki page, served from the page cache when possible.
 
-    for tag in content.find_all(["script", "style", "noscript", "table", "aside", "nav"]):
-        tag.decompose()
+    Fresh entries are returned without a request; stale ones are revalidated
+    with ``If-None-Match``/``If-Modified-Since``. With ``WEB_SEARCH_OFFLINE=1``
+    only the cache is used and a miss raises `PageNotCached`.
+    """
+    url = _build_url(path, params, base)
+    cache = _get_cache()
+    with span("web.fetch", url=url) as s:
+        page = cache.get(url)
+        if page is not None and (_offline() or cache.is_fresh(page)):
+            cache.count("hits")
+            s.set(cache="hit", bytes=0)
+            return page.text, page.final_url
+        if _offline():
+            s.set(cache="offline_miss", bytes=0)
+            raise PageNotCached(url)
 
-    text = content.get_text(separator="\n\n", strip=True)
-    text = unescape(text)
-    text = re.sub(r"\r?\n\s*\n", "\n\n", text)
-    text = re.sub(r"\s+", " ", text)
-    return text[:max_chars].strip()
+        resp = _fetch_url(path, params, timeout, headers=page.validators() if page else None, base=base)
+        s.set(status=resp.status_code, bytes=len(resp.content))
+        if resp.status_code == 304 and page is not None:
+            cache.count("revalidated")
+            s.set(cache="revalidated")
+            cache.touch(page, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+            return page.text, page.final_url
+
+        cache.count("misses")
+        s.set(cache="miss")
+    with span("web.parse", bytes=len(resp.content)) as s:
+        text = extract_main_content(resp.text)
+        s.set(chars=len(text))
+    cache.put(CachedPage(url, resp.url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), time.time(), text))
+    return text, resp.url
+
+
+def extract_main_content(html_text: str, max_chars: int = 20000) -> str:
+    return main_text(html_text, max_chars)
 
 
 def web_search_tool(title: str) -> Dict[str, str]:
     safe = title.replace(' ', '_')
     print(f"   [BEGIN Tool Action] Executing web search: {title} [END Tool Action]")
     try:
-        html_text, final_url = _fetch_url('/wiki/' + urllib.parse.quote(safe))
-    except requests.HTTPError:
-        html_text, final_url = _fetch_url('/wiki/Special:Search', {'search': title})
+        try:
+            text, final_url = fetch_page('/wiki/' + urllib.parse.quote(safe))
+        except (requests.HTTPError, PageNotCached):
+            text, final_url = fetch_page('/wiki/Special:Search', {'search': title})
+    except PageNotCached as e:
+        return {"title": title, "url": str(e), "text": "", "error": "offline: page not in the web cache"}
 
-    text = extract_main_content(html_text)
-    return {"title": title, "url": final_url, "text": text}
\ No newline at end of file
+    return {"title": title, "url": final_url, "text": text}
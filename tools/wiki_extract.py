@@ -0,0 +1,237 @@
+"""Single-pass text, table and section extraction for wiki pages.
+
+Both the scraper (`dd_wiki_tool`) and ``web_search`` read the
+``.mw-parser-output`` element of a MediaWiki page. `extract_page` parses
+the HTML with lxml and walks that element once. The walk skips
+scripts, styles, navigation, asides and footnote markers. It collects:
+
+- ``text``: body text outside tables, whitespace-collapsed (what web_search returns);
+- ``full_text``: the same with table text inline, except tables that were
+  extracted as interaction tables;
+- ``tables``: every table as header and row cells;
+- ``sections``: each heading with its offset in both texts.
+
+`scraper_text` and `main_text` render the page in the formats the scraper
+and web_search have always produced.
+"""
+from dataclasses import dataclass, field
+from html import unescape
+from typing import List
+
+import lxml.html
+from lxml import etree
+
+from tools.rag.chunker import TABLE_MARKER
+
+# body text of the scraped files is cut at this many characters
+SCRAPER_MAX_CHARS = 40000
+WEB_MAX_CHARS = 20000
+# a wikitable whose headers mention one of these is appended as an interaction table
+INTERACTION_KEYWORDS = ("Curio", "Trinket", "Quirk", "Chance", "Cleansing", "Effect")
+
+_SKIP = frozenset(("script", "style", "noscript", "nav", "aside", "sup"))
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_CONTENT_XPATH = "(//*[contains(concat(' ', normalize-space(@class), ' '), ' mw-parser-output ')])[1]"
+
+
+@dataclass
+class Table:
+    # text of every <th>, in document order
+    headers: List[str]
+    # cells of each row; icon alt texts are prefixed as "[Íconos: ...] "
+    rows: List[List[str]]
+    # heading the table appears under ("" before the first heading)
+    section: str = ""
+    wikitable: bool = False
+
+    @property
+    def interaction(self) -> bool:
+        header = " ".join(self.headers)
+        return self.wikitable and any(kw in header for kw in INTERACTION_KEYWORDS)
+
+
+@dataclass
+class Section:
+    level: int
+    title: str
+    # where the heading starts in ``text`` / ``full_text``
+    offset: int
+    full_offset: int
+
+
+@dataclass
+class ExtractedPage:
+    text: str
+    full_text: str
+    tables: List[Table] = field(default_factory=list)
+    sections: List[Section] = field(default_factory=list)
+
+
+class _TableState:
+    def __init__(self, wikitable: bool, section: str):
+        self.table = Table([], [], section, wikitable)
+        # collapsed text pieces, added to full_text unless the table is extracted
+        self.pieces: List[str] = []
+        self.row: List[str] | None = None
+
+
+class _Walker:
+    def __init__(self):
+        self.text: List[str] = []
+        self.text_len = 0
+        self.full: List[str] = []
+        self.full_len = 0
+        self.tables: List[Table] = []
+        self.sections: List[Section] = []
+        self.section = ""
+        self._open: List[_TableState] = []
+        # stripped strings of the open cell / heading, joined with "" like get_text(strip=True)
+        self._cell: List[str] | None = None
+        self._icons: List[str] | None = None
+        self._heading: List[str] | None = None
+
+    def _add_full(self, piece: str):
+        self.full.append(piece)
+        self.full_len += len(piece) + 1
+
+    def add(self, s: str | None):
+        if not s:
+            return
+        stripped = s.strip()
+        if not stripped:
+            return
+        if "&" in stripped:
+            stripped = unescape(stripped)
+        if self._cell is not None:
+            self._cell.append(stripped)
+        if self._heading is not None:
+            self._heading.append(stripped)
+        piece = " ".join(stripped.split())
+        if self._open:
+            self._open[-1].pieces.append(piece)
+            return
+        self.text.append(piece)
+        self.text_len += len(piece) + 1
+        self._add_full(piece)
+
+    def walk(self, el):
+        tag = el.tag
+        if not isinstance(tag, str):
+            # comments and processing instructions; the parent adds their tail
+            return
+        if tag in _SKIP:
+            return
+        if tag == "table":
+            self._table(el)
+        elif tag in ("td", "th") and self._open:
+            self._table_cell(el, tag == "th")
+        elif tag == "tr" and self._open:
+            state = self._open[-1]
+            outer, state.row = state.row, []
+            self._children(el)
+            if state.row:
+                state.table.rows.append(state.row)
+            state.row = outer
+        elif tag in _HEADINGS:
+            self._section(el, _HEADINGS[tag])
+        else:
+            if tag == "img" and self._icons is not None and el.get("alt"):
+                self._icons.append(el.get("alt"))
+            self._children(el)
+
+    def _children(self, el):
+        self.add(el.text)
+        for child in el:
+            self.walk(child)
+            self.add(child.tail)
+
+    def _table(self, el):
+        state = _TableState("wikitable" in (el.get("class") or "").split(), self.section)
+        self._open.append(state)
+        self._children(el)
+        self._open.pop()
+        self.tables.append(state.table)
+        if state.table.interaction:
+            return
+        if self._open:
+            self._open[-1].pieces.extend(state.pieces)
+        else:
+            for piece in state.pieces:
+                self._add_full(piece)
+
+    def _table_cell(self, el, header: bool):
+        outer = (self._cell, self._icons)
+        self._cell, self._icons = [], []
+        self._children(el)
+        text = "".join(self._cell)
+        if self._icons:
+            text = f"[Íconos: {', '.join(self._icons)}] {text}"
+        state = self._open[-1]
+        if header:
+            state.table.headers.append("".join(self._cell))
+        if state.row is not None:
+            state.row.append(text)
+        self._cell, self._icons = outer
+        if self._cell is not None:
+            # nested cell text also belongs to the enclosing cell
+            self._cell.append(text)
+
+    def _section(self, el, level: int):
+        section = Section(level, "", self.text_len, self.full_len)
+        outer, self._heading = self._heading, []
+        self._children(el)
+        section.title = " ".join(" ".join(self._heading).split())
+        self._heading = outer
+        if section.title:
+            self.section = section.title
+            self.sections.append(section)
+
+
+def _parse(html_text: str):
+    try:
+        return lxml.html.document_fromstring(html_text)
+    except ValueError:
+        # str input with an XML encoding declaration
+        return lxml.html.document_fromstring(html_text.encode("utf-8"))
+
+
+def extract_page(html_text: str, fallback: bool = False) -> ExtractedPage | None:
+    """Walk ``.mw-parser-output`` once; None when the page has no content.
+
+    With ``fallback`` pages without it use ``<main>`` or ``<body>`` instead.
+    """
+    if not html_text or not html_text.strip():
+        return None
+    try:
+        root = _parse(html_text)
+    except etree.ParserError:
+        return None
+    found = root.xpath(_CONTENT_XPATH)
+    content = found[0] if found else None
+    if content is None and fallback:
+        content = next(root.iter("main"), None)
+        if content is None:
+            content = root.find("body")
+    if content is None:
+        return None
+    walker = _Walker()
+    walker.walk(content)
+    return ExtractedPage(" ".join(walker.text), " ".join(walker.full), walker.tables, walker.sections)
+
+
+def scraper_text(page: ExtractedPage, max_chars: int = SCRAPER_MAX_CHARS) -> str:
+    """Scraped-file body: ``full_text`` followed by the interaction tables, one row per paragraph."""
+    parts = [page.full_text[:max_chars]]
+    for table in page.tables:
+        if not table.interaction:
+            continue
+        parts.append(f"\n{TABLE_MARKER}\n")
+        parts.extend(" | ".join(row) for row in table.rows)
+        parts.append("\n")
+    return "\n\n".join(parts)
+
+
+def main_text(html_text: str, max_chars: int = WEB_MAX_CHARS) -> str:
+    """Body text outside tables of a wiki page (or of any page's ``<main>``/``<body>``)."""
+    page = extract_page(html_text, fallback=True)
+    return page.text[:max_chars].strip() if page else ""
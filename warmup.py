@@ -0,0 +1,115 @@
+"""Warm-start checks run before the server accepts traffic, and the readiness state they leave.
+
+`warm_start` loads what the first question would otherwise pay for (the
+corpus, the search index, the entity database, the answer-cache encoder,
+the screenshot detector when its weights are installed) and checks that
+the LLM is configured. Each step becomes a check in
+`readiness()`. The server is ready once every required check passed. A
+failed optional check (entity store, encoder, detector) leaves it ready but
+degraded.
+"""
+from typing import Any, Callable, Dict
+import os
+import threading
+import time
+
+
+# environment variable holding the API key, by LiteLLM provider prefix
+API_KEY_VARS = {
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "mistral": "MISTRAL_API_KEY",
+    "together_ai": "TOGETHERAI_API_KEY",
+}
+
+_lock = threading.Lock()
+_checks: Dict[str, Dict[str, Any]] = {}
+_started = False
+
+
+def _run(name: str, fn: Callable[[], Any], required: bool = True) -> bool:
+    t0 = time.perf_counter()
+    try:
+        detail, ok, error = fn(), True, None
+    except Exception as e:
+        detail, ok, error = None, False, f"{type(e).__name__}: {e}"
+    check = {"ok": ok, "required": required, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if detail is not None:
+        check["detail"] = detail
+    if error:
+        check["error"] = error
+    with _lock:
+        _checks[name] = check
+    print(f"[warmup] {name}: {'ok' if ok else 'FAILED'} in {check['ms']:.0f} ms" + (f" ({error})" if error else ""))
+    return ok
+
+
+def fail(name: str, error: Exception, required: bool = True):
+    """Record a failure that happened outside `warm_start` (e.g. creating the agents)."""
+    with _lock:
+        _checks[name] = {"ok": False, "required": required, "ms": 0.0, "error": f"{type(error).__name__}: {error}"}
+
+
+def check_llm(lm=None, ping: bool = False) -> Dict[str, Any]:
+    """Check that an LM is configured and its provider's API key is set; with ``ping`` call it once."""
+    if lm is None:
+        import dspy
+
+        lm = dspy.settings.lm
+    if lm is None:
+        raise RuntimeError("no LM configured")
+    model = getattr(lm, "model", "") or ""
+    provider = model.split("/", 1)[0] if "/" in model else "openai"
+    var = API_KEY_VARS.get(provider)
+    if var and not os.getenv(var) and not getattr(lm, "kwargs", {}).get("api_key"):
+        raise RuntimeError(f"{var} is not set for {model}")
+    out = {"model": model}
+    if ping:
+        t0 = time.perf_counter()
+        lm("Reply with OK.")
+        out["ping_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+
+def warm_start(cache=None, lm=None, llm: bool = True, ping: bool | None = None) -> Dict[str, Any]:
+    """Run the warm-up checks and return `readiness()`.
+
+    cache: answer cache whose encoder is loaded.
+    lm: LM to validate (default: the configured DSPy LM); ``llm=False`` skips it.
+    ping: also send one request to the LM (default ``WARMUP_LLM_PING=1``).
+    """
+    global _started
+    from tools.imageDetection.detector import get_detector
+    from tools.rag.entity_store import get_entity_store
+    from tools.rag.principalTool import warm_up
+
+    t0 = time.perf_counter()
+    _run("search_index", warm_up)
+    _run("entity_store", lambda: {"fingerprint": get_entity_store().fingerprint()[:12]}, required=False)
+    if cache is not None and cache.encoder is not None:
+        _run("answer_cache_encoder", lambda: {"dims": int(cache.encoder(["warm up"]).shape[-1])}, required=False)
+    detector = get_detector()
+    if detector.weights.exists():
+        _run("image_detector", detector.warm_up, required=False)
+    if llm:
+        if ping is None:
+            ping = os.getenv("WARMUP_LLM_PING", "0") == "1"
+        _run("llm", lambda: check_llm(lm, ping))
+    with _lock:
+        _started = True
+    print(f"[warmup] Done in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return readiness()
+
+
+def readiness() -> Dict[str, Any]:
+    """``{"ready", "degraded", "checks"}``; not ready until `warm_start` ran and every required check passed."""
+    with _lock:
+        checks = {k: dict(v) for k, v in _checks.items()}
+        started = _started
+    return {
+        "ready": started and all(c["ok"] for c in checks.values() if c["required"]),
+        "degraded": any(not c["ok"] for c in checks.values() if not c["required"]),
+        "checks": checks,
+    }